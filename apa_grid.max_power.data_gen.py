@@ -1,132 +1,251 @@
 #!/usr/bin/env python3
 
+import argparse
 import gzip
-import itertools
 import pickle
+import sys
 
-import numpy
+import pandas
 import tqdm
 import calc_lib
 
 
-class MaxPowerWasteFreeCalculator(calc_lib.ProductionCalculator):
-	def calculate(self,
-		# True to allow plutonium fuel rods to be sinked
-		# False to force plutonium fuel rods to be used for power
-		allow_plutonium_sink: bool = True,
-	) -> numpy.ndarray:
-		# prep linprog
-		A = self.get_default_constraint_matrix()
-		b = self.get_default_constraint_vector()
-		# split A, b into _ub and _eq
-		# force non-sinkable items to be strictly zero
-		# otherwise the solver may try to make surplus
-		eq_index = self.get_default_net_zero_item_list()
-		if not allow_plutonium_sink:
-			eq_index.append("Desc_PlutoniumFuelRod_C")
-		A_eq = A.loc[eq_index].values
-		b_eq = b.loc[eq_index].values
-		A_ub = A.drop(index=eq_index).values
-		b_ub = b.drop(index=eq_index).values
-		# bounds
-		bounds = self.get_default_bounds()
-		# coef, optimize over raw_power @ x
-		c = A.loc["raw_power"].values
-		# run linprog
-		return super().calculate(
-			c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=bounds
-		)
+# the grid of each sweep, as runs named by sweep
+SCENARIO_FILE = "scenarios/apa_grid.max_power.toml"
+# names of the group fields of each sweep
+GROUP_FIELDS = {
+	"waste_free": ["with_somersloop", "enable_conversion",
+		"allow_plutonium_sink"],
+	"waste_prone": ["with_somersloop", "enable_conversion"],
+}
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="grid search the apa counts for "
+		"max power, resumable from checkpoints")
+	ap.add_argument("--checkpoint-prefix", type=str,
+		default="large_output/apa_grid.max_power", metavar="prefix",
+		help="checkpoints are <prefix>.<sweep>.checkpoint.jsonl "
+			"[large_output/apa_grid.max_power]")
+	ap.add_argument("--restart", action="store_true",
+		help="discard the checkpoints and start over [no]")
+	ap.add_argument("--shard", type=str, default="0/1", metavar="k/n",
+		help="only calculate every n-th point starting from k, e.g. to split "
+			"a sweep over machines [0/1]")
+	ap.add_argument("-j", "--jobs", type=int, default=1, metavar="int",
+		help="number of worker processes sharing the recipe matrices [1]")
+	ap.add_argument("--merge", type=str, nargs="+", metavar="jsonl",
+		help="merge checkpoint shards into the local checkpoints before "
+			"assembling; shards are matched to sweeps by file name")
+	ap.add_argument("--serve", type=str, metavar="[host:]port",
+		help="coordinate the sweeps over tcp instead of calculating "
+			"locally, until all points are done; workers are started with "
+			"--worker")
+	ap.add_argument("--worker", type=str, metavar="host:port",
+		help="only calculate points of the coordinator at host:port, then "
+			"exit")
+	ap.add_argument("--excel", action="store_true",
+		help="also write one excel workbook per sweep, "
+			"large_output/apa_grid.max_power.<sweep>.xlsx [no]")
+	args = ap.parse_args()
+	k, n = (int(v) for v in args.shard.split("/"))
+	if not (0 <= k < n):
+		ap.error("--shard must be k/n with 0 <= k < n")
+	args.shard = (k, n)
+	if args.serve and ((args.shard != (0, 1)) or (args.jobs > 1)):
+		ap.error("--serve can not be used with --shard or --jobs")
+	return args
+
+
+def parse_address(s: str) -> tuple[str, int]:
+	host, _, port = s.rpartition(":")
+	return host or "127.0.0.1", int(port)
+
+
+def get_points() -> dict[str, list]:
+	# (key, scenario) points of each sweep, from the runs of SCENARIO_FILE;
+	# key is (sweep, group, apa), group as in the output
+	ret = {name: list() for name in GROUP_FIELDS}
+	for run in calc_lib.ScenarioRunner.from_toml(SCENARIO_FILE).runs:
+		scenario = run.scenario
+		group = (scenario.enable_somersloop_amplification,
+			scenario.enable_resource_conversion)
+		if run.name == "waste_free":
+			group += ("Desc_PlutoniumFuelRod_C" not in scenario.extra_eq_items,)
+		apa = (scenario.unfueled_apa_count, scenario.fueled_apa_count)
+		ret[run.name].append(((run.name, group, apa), scenario))
+	return ret
+
+
+def sweep(points: list, checkpoint: calc_lib.SweepCheckpoint,
+	shard: tuple[int, int], jobs: int = 1,
+) -> None:
+	# calculate the points of this shard not in the checkpoint yet
+	k, n = shard
+	todo = [(key, scenario) for i, (key, scenario) in enumerate(points)
+		if (i % n == k) and (key not in checkpoint)]
+	if jobs > 1:
+		sweep_in_pool(todo, checkpoint, jobs)
+		return
+	models = calc_lib.ModelCache()
+	for key, scenario in tqdm.tqdm(todo):
+		calculator, _ = models.get_calculator(scenario)
+		result = scenario.calculate(calculator, exit_on_failure=False)
+		checkpoint.append(key, calc_lib.SweepCheckpoint.encode_result(result,
+			calculator.recipe_matrix.coef_matrix.index))
+	return
 
 
-class MaxPowerWasteProneCalculator(calc_lib.ProductionCalculator):
-	def calculate(self) -> numpy.ndarray:
-		# prep linprog
-		A = self.get_default_constraint_matrix()
-		b = self.get_default_constraint_vector()
-		# bounds
-		bounds = self.get_default_bounds()
-		# coef, optimize over raw_power @ x
-		c = A.loc["raw_power"].values
-		# run linprog
-		return super().calculate(c, A_ub=A, b_ub=b, bounds=bounds)
+def sweep_in_pool(todo: list, checkpoint: calc_lib.SweepCheckpoint,
+	jobs: int,
+) -> None:
+	# in batches, so that finished batches are checkpointed
+	batch_size = 4 * jobs
+	with calc_lib.SharedMatrixPool(jobs) as pool:
+		for start in tqdm.tqdm(range(0, len(todo), batch_size)):
+			batch = todo[start:start + batch_size]
+			results = pool.map([scenario for _, scenario in batch])
+			for (key, scenario), result in zip(batch, results):
+				row_labels = pool.get_recipe_matrix(
+					scenario.model_key).coef_matrix.index
+				checkpoint.append(key, calc_lib.SweepCheckpoint.encode_result(
+					result, row_labels))
+	return
 
 
-def apa_grid_waste_free_gen():
+def assemble(points: list, checkpoint: calc_lib.SweepCheckpoint,
+	fname: str,
+) -> None:
+	# the output pickle, once all points are in the checkpoint:
+	# {group: {apa: dict(result=..., coef_matrix=...)}}
+	missing = sum(key not in checkpoint for key, _ in points)
+	if missing:
+		print(f"{fname}: {missing} of {len(points)} points missing, "
+			"not assembled")
+		return
 	all_res = dict()
-
-	for with_somersloop, enable_conversion, allow_plutonium_sink in itertools.product(
-		[False, True], [False, True], [False, True],
-	):
-		# grid search apa count
-		args = list()
-		for unfueled_apa in range(0, 11):  # max 10
-			for fueled_apa in range(0, 11 - unfueled_apa):  # max 10 total
-				args.append((unfueled_apa, fueled_apa))
-
-		apa_res = dict()
-		for unfueled_apa, fueled_apa in tqdm.tqdm(args):
-			calculator = MaxPowerWasteFreeCalculator.from_recipe_dataset_json(
-				"curated/recipe_dataset.zh-Hans.json",
-				production_clock_speed=250,
-				resource_extraction_clock_speed=250,
-				enable_resource_conversion=enable_conversion,
-				enable_somersloop_amplification=with_somersloop,
-				unfueled_apa_count=unfueled_apa,
-				fueled_apa_count=fueled_apa,
-			)
-
-			result = calculator.calculate(allow_plutonium_sink)
-
-			apa_res[(unfueled_apa, fueled_apa)] = dict(
-				result=result,
-				coef_matrix=calculator.recipe_matrix.coef_matrix,
-			)
-
-		all_res[(with_somersloop, enable_conversion, allow_plutonium_sink)] = apa_res
-
-	with gzip.open("large_output/apa_grid.max_power.waste_free.pkl.gz", "wb") as fp:
+	models = calc_lib.ModelCache()
+	for key, scenario in points:
+		_, group, apa = key
+		calculator, _ = models.get_calculator(scenario)
+		coef_matrix = calculator.recipe_matrix.coef_matrix
+		all_res.setdefault(group, dict())[apa] = dict(
+			result=calc_lib.SweepCheckpoint.decode_result(checkpoint.get(key),
+				coef_matrix.index),
+			coef_matrix=coef_matrix,
+		)
+	with gzip.open(fname, "wb") as fp:
 		pickle.dump(all_res, fp)
+	return
+
 
+def write_result_store(points: list, checkpoint: calc_lib.SweepCheckpoint,
+	fname: str, group_fields: list[str],
+) -> None:
+	# the scalar results of the points in the checkpoint, e.g. for plotting;
+	# also written for incomplete sweeps
+	records = list()
+	for key, _ in points:
+		record = checkpoint.get(key)
+		if record is None:
+			continue
+		_, group, apa = key
+		records.append(list(group) + list(apa)
+			+ calc_lib.ResultStore.result_values(record))
+	df = pandas.DataFrame(records, columns=group_fields
+		+ ["unfueled_apa", "fueled_apa"] + calc_lib.ResultStore.RESULT_COLUMNS)
+	calc_lib.ResultStore.write(fname, df)
 	return
 
 
-def apa_grid_waste_prone_gen():
-	all_res = dict()
+def export_excel(points: list, checkpoint: calc_lib.SweepCheckpoint,
+	fname: str, group_fields: list[str],
+) -> None:
+	# one workbook of the sweep, streamed point by point:
+	#   "points": the summary of each point; success is empty for points not
+	#     in the checkpoint yet
+	#   "recipes": the recipe details of each point
+	missing = sum(key not in checkpoint for key, _ in points)
+	if missing:
+		print(f"warning: {fname}: {missing} of {len(points)} points missing, "
+			"exported without results", file=sys.stderr)
+	key_columns = group_fields + ["unfueled_apa", "fueled_apa"]
+	columns = calc_lib.ProductionCalculator.REPORT_TABLE_COLUMNS
+	# one calculator at a time, the points of a group only differ in their
+	# apa counts
+	recipe_matrices = dict()
+	calculator, solver_key = None, None
+	with calc_lib.StreamingWorkbook(fname) as wb:
+		point_sheet = wb.add_sheet("points", key_columns + ["success"]
+			+ columns["summary"])
+		recipe_sheet = wb.add_sheet("recipes", key_columns
+			+ columns["recipes"])
+		for key, scenario in tqdm.tqdm(points):
+			_, group, apa = key
+			values = list(group) + list(apa)
+			record = checkpoint.get(key)
+			if record is None:
+				point_sheet.append(values + [None])
+				continue
+			if scenario.solver_key != solver_key:
+				if scenario.model_key not in recipe_matrices:
+					recipe_matrices[scenario.model_key] = \
+						scenario.build_recipe_matrix()
+				calculator = scenario.build_calculator(
+					recipe_matrices[scenario.model_key])
+				solver_key = scenario.solver_key
+			else:
+				calculator.set_apa_counts(scenario.unfueled_apa_count,
+					scenario.fueled_apa_count)
+			res = calc_lib.SweepCheckpoint.decode_result(record,
+				calculator.recipe_matrix.coef_matrix.index)
+			if not res.success:
+				point_sheet.append(values + [False])
+				continue
+			tables = calculator.get_report_tables(res.x)
+			point_sheet.append(values + [True]
+				+ list(tables["summary"].iloc[0]))
+			for row in tables["recipes"].itertuples(index=False, name=None):
+				recipe_sheet.append(values + list(row))
+	return
 
-	for with_somersloop, enable_conversion in itertools.product(
-		[False, True], [False, True],
-	):
-		# grid search apa count
-		args = list()
-		for unfueled_apa in range(0, 11):  # max 10
-			for fueled_apa in range(0, 11 - unfueled_apa):  # max 10 total
-				args.append((unfueled_apa, fueled_apa))
-
-		apa_res = dict()
-		for unfueled_apa, fueled_apa in tqdm.tqdm(args):
-			calculator = MaxPowerWasteProneCalculator.from_recipe_dataset_json(
-				"curated/recipe_dataset.zh-Hans.json",
-				production_clock_speed=250,
-				resource_extraction_clock_speed=250,
-				enable_resource_conversion=enable_conversion,
-				enable_somersloop_amplification=with_somersloop,
-				unfueled_apa_count=unfueled_apa,
-				fueled_apa_count=fueled_apa,
-			)
-			result = calculator.calculate()
-			apa_res[(unfueled_apa, fueled_apa)] = dict(
-				result=result,
-				coef_matrix=calculator.recipe_matrix.coef_matrix,
-			)
-
-		all_res[(with_somersloop, enable_conversion)] = apa_res
-
-	with gzip.open("large_output/apa_grid.max_power.waste_prone.pkl.gz", "wb") as fp:
-		pickle.dump(all_res, fp)
 
+def main():
+	args = get_args()
+	if args.worker:
+		host, port = parse_address(args.worker)
+		calc_lib.SweepWorker(host, port).run()
+		return
+	sweeps = list()
+	for name, points in get_points().items():
+		checkpoint = calc_lib.SweepCheckpoint(
+			f"{args.checkpoint_prefix}.{name}.checkpoint.jsonl",
+			resume=not args.restart)
+		if args.merge:
+			added = checkpoint.merge([i for i in args.merge
+				if f".{name}." in i])
+			print(f"{name}: merged {added} points")
+		sweeps.append((name, points, checkpoint))
+	if args.serve:
+		coordinator = calc_lib.SweepCoordinator()
+		for _, points, checkpoint in sweeps:
+			coordinator.add_sweep(points, checkpoint)
+		host, port = parse_address(args.serve)
+		coordinator.run(host=host, port=port)
+	else:
+		for _, points, checkpoint in sweeps:
+			sweep(points, checkpoint, args.shard, args.jobs)
+	for name, points, checkpoint in sweeps:
+		write_result_store(points, checkpoint,
+			f"large_output/apa_grid.max_power.{name}.results.npz",
+			GROUP_FIELDS[name])
+		assemble(points, checkpoint,
+			f"large_output/apa_grid.max_power.{name}.pkl.gz")
+		if args.excel:
+			export_excel(points, checkpoint,
+				f"large_output/apa_grid.max_power.{name}.xlsx", GROUP_FIELDS[name])
 	return
 
 
 if __name__ == "__main__":
-	apa_grid_waste_free_gen()
-	apa_grid_waste_prone_gen()
+	main()
@@ -1,65 +1,143 @@
 #!/usr/bin/env python3
 
+import argparse
+import concurrent.futures
 import gzip
+import os
 import pickle
 
 import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot
 import matplotlib.patches
 import numpy
+import pandas
+
+import calc_lib
 
 matplotlib.pyplot.rcParams["font.family"] = "Hei"
 
 
-def plot_apa_grid(fname: str, upper_data: dict, lower_data: dict, *,
-	upper_label: str, lower_label: str, suptitle: str = None,
+# group fields of each sweep, as in apa_grid.max_power.data_gen.py
+GROUP_FIELDS = {
+	"waste_free": ["with_somersloop", "enable_conversion",
+		"allow_plutonium_sink"],
+	"waste_prone": ["with_somersloop", "enable_conversion"],
+}
+# (output png, sweep, upper group, lower group, suptitle)
+FIGURES = [
+	# with_somersloop, enable_conversion, sink plutonium
+	("large_output/apa_grid.max_power.wate_free.conv.sink_ploto.plot.png",
+		"waste_free", (False, True, True), (True, True, True),
+		"无废料，有转化，钚回收"),
+	("large_output/apa_grid.max_power.wate_free.conv.ficsonium.png",
+		"waste_free", (False, True, False), (True, True, False),
+		"无废料，有转化，铀钚镄"),
+	("large_output/apa_grid.max_power.wate_free.no_conv.sink_ploto.plot.png",
+		"waste_free", (False, False, True), (True, False, True),
+		"无废料，无转化，钚回收"),
+	("large_output/apa_grid.max_power.wate_free.no_conv.ficsonium.png",
+		"waste_free", (False, False, False), (True, False, False),
+		"无废料，无转化，铀钚镄"),
+	# with_somersloop, enable_conversion
+	("large_output/apa_grid.max_power.waste_prone.no_conv.comp.png",
+		"waste_prone", (False, False), (True, False),
+		"允许钚废料，禁用转化"),
+	("large_output/apa_grid.max_power.waste_prone.conv.comp.png",
+		"waste_prone", (False, True), (True, True),
+		"允许钚废料，允许转化"),
+]
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="plot the apa grid search of "
+		"max power, from the result stores of apa_grid.max_power.data_gen.py")
+	ap.add_argument("--prefix", type=str,
+		default="large_output/apa_grid.max_power", metavar="prefix",
+		help="result stores are <prefix>.<sweep>.results.npz; if missing, "
+			"they are converted once from <prefix>.<sweep>.pkl.gz "
+			"[large_output/apa_grid.max_power]")
+	ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+		metavar="int",
+		help="number of figures rendered in parallel [number of cpus]")
+	args = ap.parse_args()
+	return args
+
+
+def load_results(prefix: str, sweep: str) -> pandas.DataFrame:
+	# only the columns needed for plotting
+	fname = f"{prefix}.{sweep}.results.npz"
+	if not os.path.exists(fname):
+		convert_archive(f"{prefix}.{sweep}.pkl.gz", fname, GROUP_FIELDS[sweep])
+	ret = calc_lib.ResultStore(fname).read(GROUP_FIELDS[sweep]
+		+ ["unfueled_apa", "fueled_apa", "fun"])
+	return ret
+
+
+def convert_archive(archive: str, fname: str, group_fields: list[str],
 ) -> None:
-	figure = matplotlib.pyplot.figure(figsize=(6, 7), dpi=300)
-	axes = figure.add_subplot(1, 1, 1)
+	# result store of an archive written before the result stores
+	with gzip.open(archive, "rb") as fp:
+		data = pickle.load(fp)
+	records = list()
+	for group, points in data.items():
+		for apa, point in points.items():
+			res = point["result"]
+			records.append(list(group) + list(apa) + [bool(res.success),
+				int(res.status), numpy.nan if res.fun is None else res.fun,
+				int(res.get("nit", 0))])
+	calc_lib.ResultStore.write(fname, pandas.DataFrame(records,
+		columns=group_fields + ["unfueled_apa", "fueled_apa"]
+			+ calc_lib.ResultStore.RESULT_COLUMNS))
+	return
 
-	# lower triangle
-	lower_cmap = matplotlib.colormaps["Reds"]
-	values = numpy.full((13, 13), numpy.nan)
-	for (unfueled, fueled), result in lower_data.items():
-		values[unfueled, fueled] = -result["result"].fun / 1e6
+
+def triangle_values(df: pandas.DataFrame, *, upper: bool) -> numpy.ndarray:
+	# max power in TW on the 13x13 grid, by (unfueled, fueled) apa count; the
+	# upper triangle is mirrored
+	unfueled = df["unfueled_apa"].to_numpy(dtype=int)
+	fueled = df["fueled_apa"].to_numpy(dtype=int)
+	if upper:
+		unfueled, fueled = 12 - unfueled, 12 - fueled
+	ret = numpy.full((13, 13), numpy.nan)
+	ret[unfueled, fueled] = -df["fun"].to_numpy(dtype=float) / 1e6
+	return ret
+
+
+def draw_triangle(axes, values: numpy.ndarray, cmap, box_color: str,
+) -> None:
 	vmax = numpy.nanmax(values)
-	axes.pcolor(values, cmap=lower_cmap, vmin=0, vmax=vmax)
+	axes.pcolor(values, cmap=cmap, vmin=0, vmax=vmax)
 	# add text
-	for i, j in numpy.ndindex(values.shape):
-		if numpy.isnan(v := values[i, j]):
-			continue
-		axes.text(j + 0.5, i + 0.5, f"{v:.1f}", fontsize=6,
-			color=("#000000" if v < vmax / 2 else "#ffffff"),
-			ha="center", va="center",
+	cells = numpy.argwhere(~numpy.isnan(values))
+	colors = numpy.where(values[cells[:, 0], cells[:, 1]] < vmax / 2,
+		"#000000", "#ffffff")
+	for (i, j), color in zip(cells, colors):
+		axes.text(j + 0.5, i + 0.5, f"{values[i, j]:.1f}", fontsize=6,
+			color=color, ha="center", va="center",
 		)
-		# add box for the maximum value
-		if v == vmax:
-			p = matplotlib.patches.Rectangle((j, i), 1, 1,
-				fill=False, edgecolor="#ffd500", linewidth=1.5,
-			)
-			axes.add_patch(p)
-
-	# upper triangle
-	upper_cmap = matplotlib.colormaps["Blues"]
-	values = numpy.full((13, 13), numpy.nan)
-	for (unfueled, fueled), result in upper_data.items():
-		values[12 - unfueled, 12 - fueled] = -result["result"].fun / 1e6
-	vmax = numpy.nanmax(values)
-	axes.pcolor(values, cmap=upper_cmap, vmin=0, vmax=vmax)
-	# add text
-	for i, j in numpy.ndindex(values.shape):
-		if numpy.isnan(v := values[i, j]):
-			continue
-		axes.text(j + 0.5, i + 0.5, f"{v:.1f}", fontsize=6,
-			color=("#000000" if v < vmax / 2 else "#ffffff"),
-			ha="center", va="center",
+	# add box for the maximum value
+	for i, j in numpy.argwhere(values == vmax):
+		p = matplotlib.patches.Rectangle((j, i), 1, 1,
+			fill=False, edgecolor=box_color, linewidth=1.5,
 		)
-		# add box for the maximum value
-		if v == vmax:
-			p = matplotlib.patches.Rectangle((j, i), 1, 1,
-				fill=False, edgecolor="#00fbff", linewidth=1.5,
-			)
-			axes.add_patch(p)
+		axes.add_patch(p)
+	return
+
+
+def plot_apa_grid(fname: str, upper_data: pandas.DataFrame,
+	lower_data: pandas.DataFrame, *, upper_label: str, lower_label: str,
+	suptitle: str = None,
+) -> None:
+	figure = matplotlib.pyplot.figure(figsize=(6, 7), dpi=300)
+	axes = figure.add_subplot(1, 1, 1)
+
+	lower_cmap = matplotlib.colormaps["Reds"]
+	draw_triangle(axes, triangle_values(lower_data, upper=False), lower_cmap,
+		"#ffd500")
+	upper_cmap = matplotlib.colormaps["Blues"]
+	draw_triangle(axes, triangle_values(upper_data, upper=True), upper_cmap,
+		"#00fbff")
 
 	# legends
 	handles = [
@@ -109,63 +187,25 @@ def plot_apa_grid(fname: str, upper_data: dict, lower_data: dict, *,
 	return
 
 
-if __name__ == "__main__":
-	with gzip.open("large_output/apa_grid.max_power.waste_free.pkl.gz", "rb") as fp:
-		data = pickle.load(fp)
-
-	plot_apa_grid("large_output/apa_grid.max_power.wate_free.conv.sink_ploto.plot.png",
-		# with_somersloop, enable_conversion, sink plutonium
-		upper_data=data[(False, True, True)],
-		upper_label="无红石",
-		lower_data=data[(True, True, True)],
-		lower_label="有红石",
-		suptitle="无废料，有转化，钚回收",
-	)
-
-	plot_apa_grid("large_output/apa_grid.max_power.wate_free.conv.ficsonium.png",
-		# with_somersloop, enable_conversion, sink plutonium
-		upper_data=data[(False, True, False)],
-		upper_label="无红石",
-		lower_data=data[(True, True, False)],
-		lower_label="有红石",
-		suptitle="无废料，有转化，铀钚镄",
-	)
-
-	plot_apa_grid("large_output/apa_grid.max_power.wate_free.no_conv.sink_ploto.plot.png",
-		# with_somersloop, enable_conversion, sink plutonium
-		upper_data=data[(False, False, True)],
-		upper_label="无红石",
-		lower_data=data[(True, False, True)],
-		lower_label="有红石",
-		suptitle="无废料，无转化，钚回收",
-	)
-
-	plot_apa_grid("large_output/apa_grid.max_power.wate_free.no_conv.ficsonium.png",
-		# with_somersloop, enable_conversion, sink plutonium
-		upper_data=data[(False, False, False)],
-		upper_label="无红石",
-		lower_data=data[(True, False, False)],
-		lower_label="有红石",
-		suptitle="无废料，无转化，铀钚镄",
-	)
-
-	with gzip.open("large_output/apa_grid.max_power.waste_prone.pkl.gz", "rb") as fp:
-		data = pickle.load(fp)
+def main():
+	args = get_args()
+	results = {sweep: load_results(args.prefix, sweep)
+		for sweep in sorted({sweep for _, sweep, *_ in FIGURES})}
+	with concurrent.futures.ProcessPoolExecutor(args.jobs) as pool:
+		futures = list()
+		for fname, sweep, upper_group, lower_group, suptitle in FIGURES:
+			groups = results[sweep].groupby(GROUP_FIELDS[sweep])
+			futures.append(pool.submit(plot_apa_grid, fname,
+				upper_data=groups.get_group(upper_group),
+				upper_label="无红石",
+				lower_data=groups.get_group(lower_group),
+				lower_label="有红石",
+				suptitle=suptitle,
+			))
+		for future in concurrent.futures.as_completed(futures):
+			future.result()
+	return
 
-	plot_apa_grid("large_output/apa_grid.max_power.waste_prone.no_conv.comp.png",
-		# with_somersloop, enable_conversion
-		upper_data=data[(False, False)],
-		upper_label="无红石",
-		lower_data=data[(True, False)],
-		lower_label="有红石",
-		suptitle="允许钚废料，禁用转化"
-	)
 
-	plot_apa_grid("large_output/apa_grid.max_power.waste_prone.conv.comp.png",
-		# with_somersloop, enable_conversion
-		upper_data=data[(False, True)],
-		upper_label="无红石",
-		lower_data=data[(True, True)],
-		lower_label="有红石",
-		suptitle="允许钚废料，允许转化"
-	)
+if __name__ == "__main__":
+	main()
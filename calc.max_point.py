@@ -9,23 +9,21 @@ import numpy
 class MaxPointCalculator(calc_lib.ProductionCalculator):
 	def calculate(self) -> numpy.ndarray:
 		# prep linprog
-		A = self.get_default_constraint_matrix()
+		builder = self.constraint_builder
 		b = self.get_default_constraint_vector()
 		# split A, b into _ub and _eq
 		# force non-sinkable items to be strictly zero
 		# otherwise the solver may try to make surplus
 		eq_index = self.get_default_net_zero_item_list()
-		A_eq = A.loc[eq_index].values
-		b_eq = b.loc[eq_index].values
-		A_ub = A.drop(index=eq_index).values
-		b_ub = b.drop(index=eq_index).values
+		partition = builder.get_partition(eq_index)
+		b_eq, b_ub = partition.split(b)
 		# bounds
 		bounds = self.get_default_bounds()
 		# coef, optimize over points_gain_rate @ x
-		c = A.loc["points_gain_rate"].values
+		c = builder.get_row("points_gain_rate")
 		# run linprog
-		return super().calculate(
-			c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=bounds
+		return super().calculate(c, A_ub=partition.A_ub, b_ub=b_ub,
+			A_eq=partition.A_eq, b_eq=b_eq, bounds=bounds,
 		)
 
 
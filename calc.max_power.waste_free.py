@@ -13,7 +13,7 @@ class MaxPowerWasteFreeCalculator(calc_lib.ProductionCalculator):
 		allow_plutonium_sink: bool = True,
 	) -> numpy.ndarray:
 		# prep linprog
-		A = self.get_default_constraint_matrix()
+		builder = self.constraint_builder
 		b = self.get_default_constraint_vector()
 		# split A, b into _ub and _eq
 		# force non-sinkable items to be strictly zero
@@ -21,17 +21,15 @@ class MaxPowerWasteFreeCalculator(calc_lib.ProductionCalculator):
 		eq_index = self.get_default_net_zero_item_list()
 		if not allow_plutonium_sink:
 			eq_index.append("Desc_PlutoniumFuelRod_C")
-		A_eq = A.loc[eq_index].values
-		b_eq = b.loc[eq_index].values
-		A_ub = A.drop(index=eq_index).values
-		b_ub = b.drop(index=eq_index).values
+		partition = builder.get_partition(eq_index)
+		b_eq, b_ub = partition.split(b)
 		# bounds
 		bounds = self.get_default_bounds()
 		# coef, optimize over raw_power @ x
-		c = A.loc["raw_power"].values
+		c = builder.get_row("raw_power")
 		# run linprog
-		return super().calculate(
-			c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=bounds
+		return super().calculate(c, A_ub=partition.A_ub, b_ub=b_ub,
+			A_eq=partition.A_eq, b_eq=b_eq, bounds=bounds,
 		)
 
 
@@ -9,14 +9,18 @@ import numpy
 class MaxPowerWasteProneCalculator(calc_lib.ProductionCalculator):
 	def calculate(self) -> numpy.ndarray:
 		# prep linprog
-		A = self.get_default_constraint_matrix()
+		builder = self.constraint_builder
 		b = self.get_default_constraint_vector()
+		# no net-zero items, all rows go to _ub
+		partition = builder.get_partition([])
+		_, b_ub = partition.split(b)
 		# bounds
 		bounds = self.get_default_bounds()
 		# coef, optimize over raw_power @ x
-		c = A.loc["raw_power"].values
+		c = builder.get_row("raw_power")
 		# run linprog
-		return super().calculate(c, A_ub=A, b_ub=b, bounds=bounds)
+		return super().calculate(c, A_ub=partition.A_ub, b_ub=b_ub,
+			bounds=bounds)
 
 
 if __name__ == "__main__":
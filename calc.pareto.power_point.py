@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+import calc_lib
+
+
+if __name__ == "__main__":
+	for with_somersloop in [False, True]:
+		calculator = calc_lib.ParetoFrontierCalculator.from_recipe_dataset_json(
+			"curated/recipe_dataset.zh-Hans.json",
+			production_clock_speed=250,
+			resource_extraction_clock_speed=250,
+			enable_resource_conversion=True,
+			enable_somersloop_amplification=with_somersloop,
+			unfueled_apa_count=0,
+			fueled_apa_count=0,
+			objectives=("raw_power", "points_gain_rate"),
+		)
+
+		calculator.calculate()
+		fname = ("output/calc.pareto.power_point.{}.txt").format(
+			"with_sloop" if with_somersloop else "wo_sloop",
+		)
+		with open(fname, "w") as fp:
+			calculator.report_frontier(fp)
@@ -1,16 +1,176 @@
 #!/usr/bin/env python3
 
-from . import util
-
-from . import config
-from . import elements
-from . import recipe_dataset
-from . import recipe_dataset_curator
-from . import recipe_matrix
-from . import production_calculator
-
-from .elements import ClockSpeed, Recipe, Item, Building
-from .recipe_dataset import RecipeDataset
-from .recipe_dataset_curator import RecipeDatasetCurator
-from .recipe_matrix import RecipeMatrix, ClockSpeed
-from .production_calculator import ProductionCalculator
+# submodules and public names are loaded lazily on first access (PEP 562),
+# so that e.g. a CLI --help does not pay for importing pandas and scipy
+
+import importlib
+from typing import TYPE_CHECKING
+
+_SUBMODULES = [
+	"util",
+	"config",
+	"elements",
+	"recipe_dataset",
+	"recipe_dataset_curator",
+	"recipe_matrix",
+	"constraint_builder",
+	"linear_program",
+	"production_calculator",
+	"target_production_calculator",
+	"objective_calculator",
+	"scenario",
+	"calc_service",
+	"what_if_session",
+	"alternate_recipe_ranker",
+	"pareto_frontier_calculator",
+	"column_generation_calculator",
+	"flow_decomposition",
+	"infeasibility_diagnoser",
+	"lp_file",
+	"scenario_runner",
+	"sweep_checkpoint",
+	"worker_pool",
+	"excel_writer",
+	"coef_matrix_file",
+	"result_store",
+	"sweep_cluster",
+	"job_queue",
+	"regional_calculator",
+	"build_out_planner",
+	"logistics",
+]
+
+# public name -> submodule providing it
+_ATTRIBUTES = {
+	"ClockSpeed": "elements",
+	"Recipe": "elements",
+	"Item": "elements",
+	"Building": "elements",
+	"RecipeDataset": "recipe_dataset",
+	"RecipeDatasetCurator": "recipe_dataset_curator",
+	"RecipeMatrix": "recipe_matrix",
+	"RowMetadata": "recipe_matrix",
+	"ConstraintBuilder": "constraint_builder",
+	"ConstraintPartition": "constraint_builder",
+	"LinearProgram": "linear_program",
+	"LinearProgramSolver": "linear_program",
+	"ProductionCalculator": "production_calculator",
+	"TargetProductionCalculator": "target_production_calculator",
+	"ObjectiveCalculator": "objective_calculator",
+	"Scenario": "scenario",
+	"CalcService": "calc_service",
+	"ModelCache": "calc_service",
+	"WhatIfSession": "what_if_session",
+	"WhatIfDiff": "what_if_session",
+	"AlternateRecipeRanker": "alternate_recipe_ranker",
+	"ParetoFrontierCalculator": "pareto_frontier_calculator",
+	"ParetoPoint": "pareto_frontier_calculator",
+	"ColumnGenerationCalculator": "column_generation_calculator",
+	"FlowDecomposition": "flow_decomposition",
+	"InfeasibilityDiagnoser": "infeasibility_diagnoser",
+	"InfeasibleSubsystem": "infeasibility_diagnoser",
+	"LinearProgramFile": "lp_file",
+	"ScenarioRunner": "scenario_runner",
+	"ScenarioRun": "scenario_runner",
+	"SweepCheckpoint": "sweep_checkpoint",
+	"SharedMatrixPool": "worker_pool",
+	"SharedModel": "worker_pool",
+	"SharedArray": "worker_pool",
+	"StreamingSheet": "excel_writer",
+	"StreamingWorkbook": "excel_writer",
+	"CoefMatrixFile": "coef_matrix_file",
+	"ResultStore": "result_store",
+	"SweepCoordinator": "sweep_cluster",
+	"SweepWorker": "sweep_cluster",
+	"Job": "job_queue",
+	"JobQueue": "job_queue",
+	"Region": "regional_calculator",
+	"Link": "regional_calculator",
+	"RegionalCalculator": "regional_calculator",
+	"Phase": "build_out_planner",
+	"BuildOutPlanner": "build_out_planner",
+	"LogisticsLimits": "logistics",
+}
+
+__all__ = _SUBMODULES + list(_ATTRIBUTES.keys())
+
+
+def __getattr__(name: str):
+	if name in _SUBMODULES:
+		ret = importlib.import_module(f".{name}", __name__)
+	elif name in _ATTRIBUTES:
+		module = importlib.import_module(f".{_ATTRIBUTES[name]}", __name__)
+		ret = getattr(module, name)
+	else:
+		raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+	# cache in module globals, so that __getattr__ is not called again
+	globals()[name] = ret
+	return ret
+
+
+def __dir__() -> list[str]:
+	return sorted(set(globals().keys()) | set(__all__))
+
+
+if TYPE_CHECKING:
+	from . import util
+	from . import config
+	from . import elements
+	from . import recipe_dataset
+	from . import recipe_dataset_curator
+	from . import recipe_matrix
+	from . import constraint_builder
+	from . import linear_program
+	from . import production_calculator
+	from . import target_production_calculator
+	from . import objective_calculator
+	from . import scenario
+	from . import calc_service
+	from . import what_if_session
+	from . import alternate_recipe_ranker
+	from . import pareto_frontier_calculator
+	from . import column_generation_calculator
+	from . import flow_decomposition
+	from . import infeasibility_diagnoser
+	from . import lp_file
+	from . import scenario_runner
+	from . import sweep_checkpoint
+	from . import worker_pool
+	from . import excel_writer
+	from . import coef_matrix_file
+	from . import result_store
+	from . import sweep_cluster
+	from . import job_queue
+	from . import regional_calculator
+	from . import build_out_planner
+	from . import logistics
+
+	from .elements import ClockSpeed, Recipe, Item, Building
+	from .recipe_dataset import RecipeDataset
+	from .recipe_dataset_curator import RecipeDatasetCurator
+	from .recipe_matrix import RecipeMatrix, RowMetadata
+	from .constraint_builder import ConstraintBuilder, ConstraintPartition
+	from .linear_program import LinearProgram, LinearProgramSolver
+	from .production_calculator import ProductionCalculator
+	from .target_production_calculator import TargetProductionCalculator
+	from .objective_calculator import ObjectiveCalculator
+	from .scenario import Scenario
+	from .calc_service import CalcService, ModelCache
+	from .what_if_session import WhatIfSession, WhatIfDiff
+	from .alternate_recipe_ranker import AlternateRecipeRanker
+	from .pareto_frontier_calculator import ParetoFrontierCalculator, ParetoPoint
+	from .column_generation_calculator import ColumnGenerationCalculator
+	from .flow_decomposition import FlowDecomposition
+	from .infeasibility_diagnoser import InfeasibilityDiagnoser, InfeasibleSubsystem
+	from .lp_file import LinearProgramFile
+	from .scenario_runner import ScenarioRunner, ScenarioRun
+	from .sweep_checkpoint import SweepCheckpoint
+	from .worker_pool import SharedMatrixPool, SharedModel, SharedArray
+	from .excel_writer import StreamingSheet, StreamingWorkbook
+	from .coef_matrix_file import CoefMatrixFile
+	from .result_store import ResultStore
+	from .sweep_cluster import SweepCoordinator, SweepWorker
+	from .job_queue import Job, JobQueue
+	from .regional_calculator import Region, Link, RegionalCalculator
+	from .build_out_planner import Phase, BuildOutPlanner
+	from .logistics import LogisticsLimits
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import collections
+import concurrent.futures
+import dataclasses
+
+import numpy
+import pandas
+
+from . import config
+from .objective_calculator import ObjectiveCalculator
+from .scenario import Scenario
+
+
+class _SubsetEvaluator(object):
+	# solves the scenario with only a subset of alternates unlocked
+	# one per process, consecutive solves warm-start from each other
+	def __init__(self, scenario: Scenario, alternates: list[str] = None,
+	) -> None:
+		calculator = scenario.build_calculator()
+		if not isinstance(calculator, ObjectiveCalculator):
+			raise ValueError("alternate recipe ranking requires an objective "
+				"scenario, not a target production")
+		self.session = calculator.new_what_if_session()
+		self.recipe_dataset = calculator.recipe_matrix.recipe_dataset
+		row_recipes = calculator.recipe_matrix.row_metadata.recipe
+		if alternates is None:
+			alternates = [r for r in pandas.unique(row_recipes)
+				if r.startswith(config.ALTERNATE_RECIPE_CLASSNAME_PREFIX)]
+		self.alternates = list(alternates)
+		# variant positions of each alternate
+		self.positions = {a: numpy.flatnonzero(row_recipes == a)
+			for a in self.alternates}
+		return
+
+	def evaluate(self, unlocked: frozenset[str],
+	) -> tuple[float | None, dict[str, float]]:
+		# return the objective and the best reduced cost of each locked
+		# alternate, in the solver's minimization sense; objective is None if
+		# the solve failed
+		self.session.reset()
+		self.session.disable_recipes([a for a in self.alternates
+			if a not in unlocked])
+		diff = self.session.solve()
+		if not diff.success:
+			return None, dict()
+		rc = diff.result.reduced_costs
+		reduced_costs = {a: float(rc[self.positions[a]].min())
+			for a in self.alternates if a not in unlocked}
+		return diff.objective_after, reduced_costs
+
+
+# evaluator of worker processes, set by the pool initializer
+_worker_evaluator: _SubsetEvaluator = None
+
+
+def _init_worker(scenario: Scenario, alternates: list[str]) -> None:
+	global _worker_evaluator
+	_worker_evaluator = _SubsetEvaluator(scenario, alternates)
+	return
+
+
+def _evaluate_in_worker(unlocked: frozenset[str],
+) -> tuple[float | None, dict[str, float]]:
+	return _worker_evaluator.evaluate(unlocked)
+
+
+@dataclasses.dataclass
+class _SearchState(object):
+	path: tuple[str, ...]  # unlocked alternates, in unlock order
+	objectives: tuple[float, ...]  # objective after each unlock, and before
+	reduced_costs: dict[str, float]
+
+	@property
+	def objective(self) -> float:
+		return self.objectives[-1]
+
+
+class AlternateRecipeRanker(object):
+	# rank alternate recipes by their contribution to the scenario objective,
+	# e.g. max power or max points, as an unlock order
+	# starting with all alternates locked, each step unlocks the alternate
+	# that improves the objective most (greedy), or keeps the best
+	# beam_width subsets of each size (beam search)
+	# an alternate is only tried if one of its variants has an improving
+	# reduced cost in the current solution; otherwise the current solution
+	# stays optimal after unlocking it, and the solve can be skipped
+	# solves run in a process pool if max_workers > 1
+	def __init__(self, scenario: Scenario, *,
+		alternates: list[str] = None,
+		beam_width: int = 1,
+		max_workers: int = 1,
+		tol: float = 1e-6,
+	) -> None:
+		if beam_width < 1:
+			raise ValueError("beam_width must be positive")
+		if max_workers < 1:
+			raise ValueError("max_workers must be positive")
+		self.scenario = scenario
+		self.beam_width = beam_width
+		self.max_workers = max_workers
+		self.tol = tol
+		# local evaluator, also resolves the alternates list
+		self._evaluator = _SubsetEvaluator(scenario, alternates)
+		self.alternates = self._evaluator.alternates
+		self._executor: concurrent.futures.ProcessPoolExecutor = None
+		# objective with all alternates locked, set by rank()
+		self.base_objective: float = None
+		self.stats = collections.Counter()
+		return
+
+	def _evaluate_many(self, subsets: list[frozenset[str]],
+	) -> list[tuple[float | None, dict[str, float]]]:
+		self.stats["solved"] += len(subsets)
+		if self._executor is None:
+			ret = [self._evaluator.evaluate(s) for s in subsets]
+		else:
+			chunksize = max(1, len(subsets) // (self.max_workers * 4))
+			ret = list(self._executor.map(_evaluate_in_worker, subsets,
+				chunksize=chunksize))
+		return ret
+
+	def _is_better(self, a: float, b: float) -> bool:
+		if self.scenario.maximize:
+			return a > b + self.tol
+		return a < b - self.tol
+
+	def rank(self, max_steps: int = None) -> pandas.DataFrame:
+		# return the unlock order, one row per step, with the objective after
+		# the step and its delta; alternates not listed do not improve the
+		# objective any further
+		if max_steps is None:
+			max_steps = len(self.alternates)
+		objective, reduced_costs = self._evaluator.evaluate(frozenset())
+		if objective is None:
+			raise RuntimeError("calculation without alternate recipes failed")
+		self.stats["solved"] += 1
+		best = _SearchState((), (objective,), reduced_costs)
+		beam = [best]
+		seen = {frozenset()}
+		if self.max_workers > 1:
+			self._executor = concurrent.futures.ProcessPoolExecutor(
+				self.max_workers, initializer=_init_worker,
+				initargs=(self.scenario, self.alternates))
+		try:
+			for _ in range(max_steps):
+				# expand, skipping alternates that cannot improve
+				candidates = dict()  # subset -> (parent, alternate)
+				for state in beam:
+					for alternate, rc in state.reduced_costs.items():
+						if rc >= -self.tol:
+							self.stats["pruned"] += 1
+							continue
+						subset = frozenset(state.path + (alternate,))
+						if (subset in seen) or (subset in candidates):
+							continue
+						candidates[subset] = (state, alternate)
+				if not candidates:
+					break
+				seen.update(candidates.keys())
+				results = self._evaluate_many(list(candidates.keys()))
+				children = list()
+				for (parent, alternate), (objective, reduced_costs) in zip(
+					candidates.values(), results,
+				):
+					if objective is None:
+						continue
+					children.append(_SearchState(parent.path + (alternate,),
+						parent.objectives + (objective,), reduced_costs))
+				children.sort(key=lambda s: s.objective,
+					reverse=self.scenario.maximize)
+				beam = children[:self.beam_width]
+				if (not beam) or (not self._is_better(beam[0].objective,
+					best.objective)):
+					break
+				best = beam[0]
+		finally:
+			if self._executor is not None:
+				self._executor.shutdown()
+				self._executor = None
+		# unlock order of the best subset
+		recipes = self._evaluator.recipe_dataset.recipes
+		objectives = numpy.asarray(best.objectives)
+		ret = pandas.DataFrame({
+			"recipe": list(best.path),
+			"display_name": [recipes[r].display_name for r in best.path],
+			"objective": objectives[1:],
+			"delta": numpy.diff(objectives),
+		}, index=pandas.RangeIndex(1, len(best.path) + 1, name="step"))
+		self.base_objective = float(objectives[0])
+		return ret
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+import collections
+import dataclasses
+from typing import Sequence
+
+import numpy
+import pandas
+import scipy.optimize
+import scipy.sparse
+
+from . import config
+from .linear_program import LinearProgram, LinearProgramSolver
+from .objective_calculator import ObjectiveCalculator
+from .recipe_matrix import RecipeMatrix
+from .regional_calculator import Region
+
+
+@dataclasses.dataclass
+class Phase(object):
+	# one period of the build-out, with what is unlocked by then; counts are
+	# cumulative:
+	#   somersloops: collected by then, including those spent on unlocks and
+	#     APAs
+	#   unfueled_apa_count, fueled_apa_count: APAs built by then
+	#   territory: the nodes accessible by then, default the whole map
+	#   max_new_machines: machines that can be built during the period
+	#   weight: weight of the period in the objective, e.g. its duration
+	name: str
+	somersloops: int = config.SOMERSLOOP_GLOBAL_LIMIT
+	unfueled_apa_count: int = 0
+	fueled_apa_count: int = 0
+	territory: Region = None
+	max_new_machines: float = numpy.inf
+	weight: float = 1.0
+
+
+class BuildOutPlanner(ObjectiveCalculator):
+	# time-phased build-out: one production plan per phase, maximizing (or
+	# minimizing) the weighted sum of the objective over the phases
+	# what has been built stays: each phase has the machines built per
+	# recipe, at least as many as in the previous phase, and runs them at any
+	# clock speed and somersloop count; max_new_machines limits the machines
+	# added per phase; somersloops can be moved between machines, those spent
+	# on unlocks and APAs are gone
+	# each phase has its own somersloop limit, APA counts (fixed, boosting
+	# its generators) and node access
+	# window: phases per solve, default all; with fewer (rolling horizon),
+	# each solve covers window phases, keeps the first step of them and moves
+	# on, with what has been built so far fixed; all windows share one
+	# problem of window phases, so each solve warm-starts from the previous
+	# basis; the last window is padded with copies of the last phase at
+	# weight 0
+	# .result.plans (phase x variant) and .result.built (phase x recipe) hold
+	# the running and built machines, .result.period_objective the objective
+	# of each phase; .result.x is the plan of the last phase, e.g. for
+	# .report() (without its APA power boost)
+	def __init__(self, recipe_matrix: RecipeMatrix, *,
+		phases: Sequence[Phase],
+		window: int = None,
+		step: int = 1,
+		**kw,
+	) -> None:
+		super().__init__(recipe_matrix, **kw)
+		if self.logistics is not None:
+			raise ValueError("logistics limits are not supported by the build-out planner")
+		if self.total_apa_count:
+			raise ValueError("APA counts are given per phase")
+		self.phases = list(phases)
+		if not self.phases:
+			raise ValueError("at least one phase is required")
+		self.phase_index = pandas.Index([p.name for p in self.phases])
+		if not self.phase_index.is_unique:
+			raise ValueError("phase names must be unique")
+		for phase in self.phases:
+			if (phase.unfueled_apa_count < 0) or (phase.fueled_apa_count < 0):
+				raise ValueError("APA count must be non-negative")
+			if (phase.unfueled_apa_count + phase.fueled_apa_count) > 10:
+				raise ValueError("the total APA count must be at most 10")
+		if window is None:
+			window = len(self.phases)
+		if (window < 1) or (step < 1) or (step > window):
+			raise ValueError("expected 1 <= step <= window")
+		self.window = min(window, len(self.phases))
+		self.step = step
+		# the single-phase problem, every phase of a window is a copy of it
+		self._base_lp: LinearProgram = None
+		# recipes, the unit of what has been built
+		self.recipe_index = pandas.Index(pandas.unique(
+			self.recipe_matrix.row_metadata.recipe))
+		# variants with their power output boosted by APAs
+		self._boosted = numpy.flatnonzero(
+			self.recipe_matrix.coef_matrix["power"].to_numpy() > 0)
+		self.stats = collections.Counter()
+		return
+
+	def set_apa_counts(self, unfueled_apa_count: int, fueled_apa_count: int,
+	) -> None:
+		raise ValueError("APA counts are given per phase")
+
+	@property
+	def base_linear_program(self) -> LinearProgram:
+		if self._base_lp is None:
+			self._base_lp = self.get_linear_program(self.objective,
+				maximize=self.maximize, eq_items=self.get_eq_items())
+		return self._base_lp
+
+	def get_phase_bounds(self, phase: Phase) -> numpy.ndarray:
+		ret = self.get_default_bounds(
+			unfueled_apa_count=phase.unfueled_apa_count,
+			fueled_apa_count=phase.fueled_apa_count)
+		if phase.territory is not None:
+			ret = phase.territory.limit_bounds(self.recipe_matrix, ret)
+		return ret
+
+	def get_phase_power_scale(self, phase: Phase) -> float:
+		ret = 1 + self.get_apa_power_boost(phase.unfueled_apa_count,
+			phase.fueled_apa_count)
+		return ret
+
+	def get_phase_objective(self, phase: Phase) -> numpy.ndarray:
+		# the objective column with the phase's APA power boost, unweighted
+		ret = numpy.array(self.recipe_matrix.get_column(self.objective),
+			dtype=float)
+		if self.objective in ("power", "raw_power"):
+			ret[self._boosted] *= self.get_phase_power_scale(phase)
+		return ret
+
+	@property
+	def solver(self) -> LinearProgramSolver:
+		# the problem of one window, per phase:
+		#   columns: running machines x (per variant), built machines y (per
+		#     recipe)
+		#   rows: the single-phase rows on x, machines running - y <= 0,
+		#     new machines sum(y) - sum(y of the previous phase), and
+		#     y of the previous phase - y <= 0
+		# phase data are loaded by ._load_window()
+		if self._solver is None:
+			base = self.base_linear_program
+			n, k = base.n_cols, len(self.recipe_index)
+			row_index = self.constraint_builder.row_index
+			# recipe x variant
+			recipes = scipy.sparse.csr_array((numpy.ones(n), (
+				self.recipe_index.get_indexer(self.recipe_matrix.row_metadata.recipe),
+				numpy.arange(n))), shape=(k, n))
+			identity = scipy.sparse.identity(k, format="csr")
+			ones = scipy.sparse.csr_array(numpy.ones((1, k)))
+			blocks, row_lower, row_upper, row_names = list(), list(), list(), list()
+			self._window_rows = list()
+			n_rows = 0
+			for s in range(self.window):
+				x, y = 2 * s, 2 * s + 1
+				groups = [{x: base.A}, {x: recipes, y: -identity}, {y: ones}]
+				row_lower.extend([base.row_lower, numpy.full(k, -numpy.inf),
+					[-numpy.inf]])
+				row_upper.extend([base.row_upper, numpy.zeros(k), [numpy.inf]])
+				row_names.extend([f"{s}:{i}" for i in base.row_names]
+					+ [f"{s}:running:{i}" for i in self.recipe_index]
+					+ [f"{s}:new_machines"])
+				if s:
+					groups[2][y - 2] = -ones
+					groups.append({y - 2: identity, y: -identity})
+					row_lower.append(numpy.full(k, -numpy.inf))
+					row_upper.append(numpy.zeros(k))
+					row_names.extend(f"{s}:built:{i}" for i in self.recipe_index)
+				for group in groups:
+					blocks.append([group.get(i) for i in range(2 * self.window)])
+				# rows of the phase data
+				self._window_rows.append(dict(
+					power=n_rows + row_index.get_loc("power"),
+					raw_power=n_rows + row_index.get_loc("raw_power"),
+					somersloop=n_rows + row_index.get_loc("somersloop"),
+					new_machines=n_rows + base.n_rows + k,
+				))
+				n_rows += base.n_rows + k + 1 + (k if s else 0)
+			lp = LinearProgram(
+				c=numpy.zeros(self.window * (n + k)),
+				A=scipy.sparse.csr_array(scipy.sparse.bmat(blocks)),
+				row_lower=numpy.concatenate(row_lower),
+				row_upper=numpy.concatenate(row_upper),
+				col_lower=numpy.zeros(self.window * (n + k)),
+				col_upper=numpy.full(self.window * (n + k), numpy.inf),
+				col_names=pandas.Index([f"{s}:{i}" for s in range(self.window)
+					for i in [*base.col_names, *self.recipe_index]]),
+				row_names=pandas.Index(row_names),
+			)
+			self._solver = LinearProgramSolver(lp)
+		return self._solver
+
+	def _get_slot_columns(self, s: int) -> tuple[slice, slice]:
+		# x and y columns of the s-th phase of a window
+		n, k = self.base_linear_program.n_cols, len(self.recipe_index)
+		ret = (slice(s * (n + k), s * (n + k) + n),
+			slice(s * (n + k) + n, (s + 1) * (n + k)))
+		return ret
+
+	def _load_window(self, start: int, built: numpy.ndarray) -> None:
+		# phase data of the phases from start on; built: machines built
+		# before start, fixed
+		solver = self.solver
+		coef_matrix = self.recipe_matrix.coef_matrix
+		power = coef_matrix["power"].to_numpy()[self._boosted]
+		raw_power = coef_matrix["raw_power"].to_numpy()[self._boosted]
+		c = numpy.zeros(solver.lp.n_cols)
+		lower = numpy.zeros(solver.lp.n_cols)
+		upper = numpy.full(solver.lp.n_cols, numpy.inf)
+		rows, upper_bounds = list(), list()
+		coef_rows, coef_cols, coef_values = list(), list(), list()
+		for s, window_rows in enumerate(self._window_rows):
+			phase = self.phases[min(start + s, len(self.phases) - 1)]
+			weight = phase.weight if (start + s) < len(self.phases) else 0.0
+			x, y = self._get_slot_columns(s)
+			objective = self.get_phase_objective(phase)
+			c[x] = weight * (-objective if self.maximize else objective)
+			bounds = self.get_phase_bounds(phase)
+			lower[x] = bounds[:, 0]
+			upper[x] = bounds[:, 1]
+			new_machines = phase.max_new_machines
+			if s == 0:
+				lower[y] = built
+				new_machines += built.sum()
+			rows.extend([window_rows["somersloop"], window_rows["new_machines"]])
+			upper_bounds.extend([self.get_somersloop_limit(phase.somersloops,
+				total_apa=phase.unfueled_apa_count + phase.fueled_apa_count),
+				new_machines])
+			scale = self.get_phase_power_scale(phase)
+			for name, values in [("power", power), ("raw_power", raw_power)]:
+				coef_rows.append(numpy.full(len(self._boosted),
+					window_rows[name]))
+				coef_cols.append(x.start + self._boosted)
+				coef_values.append(-scale * values)
+		solver.set_objective(c)
+		solver.set_col_bounds(slice(None), lower, upper)
+		solver.set_row_bounds(numpy.array(rows), -numpy.inf, upper_bounds)
+		solver.set_coefficients(numpy.concatenate(coef_rows),
+			numpy.concatenate(coef_cols), numpy.concatenate(coef_values))
+		return
+
+	def calculate(self, *, exit_on_failure: bool = True,
+	) -> scipy.optimize.OptimizeResult:
+		solver = self.solver
+		n_phases = len(self.phases)
+		plans = numpy.zeros((n_phases, self.base_linear_program.n_cols))
+		built = numpy.zeros((n_phases, len(self.recipe_index)))
+		start = 0
+		nit = 0
+		while start < n_phases:
+			self._load_window(start, built[start - 1] if start
+				else numpy.zeros(built.shape[1]))
+			res = solver.solve()
+			nit += res.nit
+			self.stats["windows"] += 1
+			if not res.success:
+				res.message = f"window from phase '{self.phases[start].name}': " \
+					f"{res.message}"
+				break
+			n_keep = (n_phases - start) if (start + self.window >= n_phases) \
+				else self.step
+			for s in range(n_keep):
+				x, y = self._get_slot_columns(s)
+				plans[start + s] = res.x[x]
+				built[start + s] = res.x[y]
+			start += n_keep
+		res.nit = nit
+		if res.success:
+			period_objective = numpy.array([self.get_phase_objective(phase) @ x
+				for phase, x in zip(self.phases, plans)])
+			total = numpy.array([p.weight for p in self.phases]) @ period_objective
+			res.fun = -total if self.maximize else total
+			res.plans = pandas.DataFrame(plans, index=self.phase_index,
+				columns=self.base_linear_program.col_names)
+			res.built = pandas.DataFrame(built, index=self.phase_index,
+				columns=self.recipe_index)
+			res.period_objective = pandas.Series(period_objective,
+				index=self.phase_index, name=self.objective)
+			res.x = plans[-1]
+			# marginals are over the last window
+			for k in ["row_marginals", "reduced_costs", "lower", "upper"]:
+				res.pop(k, None)
+		self._accept_result(res, exit_on_failure=exit_on_failure,
+			lp=solver.lp)
+		return res
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import asyncio
+import collections
+import concurrent.futures
+import io
+import json
+import socket
+import sys
+import threading
+
+import numpy
+import scipy.optimize
+
+from .production_calculator import ProductionCalculator
+from .recipe_matrix import RecipeMatrix
+from .scenario import Scenario
+
+
+class ModelCache(object):
+	# keeps compiled recipe matrices and calculators in memory
+	# recipe matrices are keyed by Scenario.model_key, and evicted in LRU order
+	# along with all their calculators when there are more than max_models
+	# calculators of a model are keyed by Scenario.calculator_key, and
+	# evicted in LRU order when there are more than max_calculators; a
+	# calculator in use keeps working, but is not cached anymore
+	class _ModelEntry(object):
+		def __init__(self) -> None:
+			self.build_lock = threading.Lock()
+			self.recipe_matrix: RecipeMatrix = None
+			# calculator_key -> (calculator, lock)
+			self.calculators = collections.OrderedDict()
+			return
+
+	def __init__(self, max_models: int = 4, *,
+		max_calculators: int = 16,
+	) -> None:
+		if max_models < 1:
+			raise ValueError("max_models must be positive")
+		if max_calculators < 1:
+			raise ValueError("max_calculators must be positive")
+		self.max_models = max_models
+		self.max_calculators = max_calculators
+		self._models = collections.OrderedDict()
+		self._lock = threading.Lock()
+		self.stats = collections.Counter()
+		return
+
+	def __len__(self) -> int:
+		return len(self._models)
+
+	def _get_entry(self, key: tuple) -> "_ModelEntry":
+		with self._lock:
+			if key in self._models:
+				self._models.move_to_end(key)
+				self.stats["model_hit"] += 1
+			else:
+				self._models[key] = self._ModelEntry()
+				self.stats["model_miss"] += 1
+				while len(self._models) > self.max_models:
+					self._models.popitem(last=False)
+					self.stats["model_evicted"] += 1
+			return self._models[key]
+
+	def get_calculator(self, scenario: Scenario,
+	) -> tuple[ProductionCalculator, threading.Lock]:
+		# the returned lock must be held while using the calculator
+		entry = self._get_entry(scenario.model_key)
+		with entry.build_lock:
+			if entry.recipe_matrix is None:
+				entry.recipe_matrix = scenario.build_recipe_matrix()
+			key = scenario.calculator_key
+			if key not in entry.calculators:
+				calculator = scenario.build_calculator(entry.recipe_matrix)
+				entry.calculators[key] = (calculator, threading.Lock())
+				self.stats["calculator_miss"] += 1
+				while len(entry.calculators) > self.max_calculators:
+					entry.calculators.popitem(last=False)
+					self.stats["calculator_evicted"] += 1
+			else:
+				entry.calculators.move_to_end(key)
+				self.stats["calculator_hit"] += 1
+			return entry.calculators[key]
+
+
+class CalcService(object):
+	# answers solve/report/sensitivity requests on hot in-memory models
+	# requests are dicts: {"op": <op>, "scenario": {Scenario fields}}
+	# identical in-flight requests are coalesced into a single solve
+	# solves run in a bounded thread pool
+	OPS = ("solve", "report", "sensitivity")
+
+	def __init__(self, *, max_models: int = 4, max_calculators: int = 16,
+		max_workers: int = 4,
+	) -> None:
+		self.models = ModelCache(max_models, max_calculators=max_calculators)
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+		self._inflight: dict[str, asyncio.Future] = dict()
+		self.stats = collections.Counter()
+		return
+
+	def close(self) -> None:
+		self.executor.shutdown(wait=False, cancel_futures=True)
+		return
+
+	async def handle(self, request: dict) -> dict:
+		# never raises, errors are reported in the response
+		ret = {"id": request.get("id"), "ok": True}
+		try:
+			ret["result"] = await self._dispatch(request)
+		except Exception as e:
+			ret["ok"] = False
+			ret["error"] = f"{type(e).__name__}: {e}"
+			self.stats["error"] += 1
+		return ret
+
+	async def _dispatch(self, request: dict) -> dict:
+		op = request.get("op")
+		self.stats[f"op_{op}"] += 1
+		if op == "ping":
+			return {"pong": True}
+		if op == "stats":
+			return {"service": dict(self.stats),
+				"models": dict(self.models.stats),
+				"loaded_models": len(self.models),
+			}
+		if op not in self.OPS:
+			raise ValueError(f"unknown op: {op}")
+		# validate before coalescing, so that the key is canonical
+		scenario = Scenario.from_dict(request.get("scenario", dict()))
+		key = json.dumps([op, scenario.to_dict()], sort_keys=True)
+		future = self._inflight.get(key)
+		if future is None:
+			loop = asyncio.get_running_loop()
+			future = loop.run_in_executor(self.executor, self._run, op, scenario)
+			self._inflight[key] = future
+			future.add_done_callback(lambda _: self._inflight.pop(key, None))
+		else:
+			self.stats["coalesced"] += 1
+		return await asyncio.shield(future)
+
+	def _run(self, op: str, scenario: Scenario) -> dict:
+		# runs in a worker thread
+		calculator, lock = self.models.get_calculator(scenario)
+		with lock:
+			res = scenario.calculate(calculator, exit_on_failure=False)
+			ret = {
+				"success": bool(res.success),
+				"status": int(res.status),
+				"message": str(res.message),
+				"objective": scenario.objective_value(res),
+			}
+			if not res.success:
+				return ret
+			if op == "solve":
+				ret["x"] = self._nonzero_dict(calculator.recipe_matrix.coef_matrix.index,
+					res.x, tol=1e-8)
+			elif op == "report":
+				fp = io.StringIO()
+				calculator.report(fp)
+				ret["report"] = fp.getvalue()
+			elif op == "sensitivity":
+				ret.update(self._sensitivity(calculator, res))
+		return ret
+
+	@staticmethod
+	def _nonzero_dict(names, values, *, tol: float) -> dict[str, float]:
+		if values is None:
+			return None
+		values = numpy.asarray(values, dtype=float)
+		pos = numpy.flatnonzero(numpy.abs(values) > tol)
+		return {str(names[i]): float(values[i]) for i in pos}
+
+	def _sensitivity(self, calculator: ProductionCalculator,
+		res: scipy.optimize.OptimizeResult,
+	) -> dict:
+		# shadow prices of constraint rows and reduced costs of recipe
+		# variants, in the solver's minimization sense
+		builder = calculator.constraint_builder
+		ret = {
+			"shadow_prices": self._nonzero_dict(builder.row_index,
+				res.get("row_marginals"), tol=1e-9),
+			"reduced_costs": self._nonzero_dict(builder.col_index,
+				res.get("reduced_costs"), tol=1e-9),
+		}
+		return ret
+
+	async def _on_client(self, reader: asyncio.StreamReader,
+		writer: asyncio.StreamWriter,
+	) -> None:
+		# newline-delimited json; requests on one connection are processed
+		# concurrently, responses carry the request "id"
+		write_lock = asyncio.Lock()
+
+		async def respond(line: bytes) -> None:
+			try:
+				request = json.loads(line)
+				if not isinstance(request, dict):
+					raise ValueError("request must be a json object")
+			except ValueError as e:
+				response = {"id": None, "ok": False, "error": f"bad request: {e}"}
+			else:
+				response = await self.handle(request)
+			async with write_lock:
+				writer.write(json.dumps(response).encode("utf-8") + b"\n")
+				await writer.drain()
+			return
+
+		tasks = set()
+		try:
+			while (line := await reader.readline()):
+				if not line.strip():
+					continue
+				task = asyncio.create_task(respond(line))
+				tasks.add(task)
+				task.add_done_callback(tasks.discard)
+			if tasks:
+				await asyncio.gather(*tasks, return_exceptions=True)
+		finally:
+			writer.close()
+		return
+
+	async def serve(self, *, path: str = None, host: str = "127.0.0.1",
+		port: int = None,
+	) -> None:
+		# listen on a unix socket if path is given, otherwise on tcp host:port
+		if path is not None:
+			server = await asyncio.start_unix_server(self._on_client, path=path)
+		elif port is not None:
+			server = await asyncio.start_server(self._on_client, host=host,
+				port=port)
+		else:
+			raise ValueError("either path or port must be provided")
+		for sock in server.sockets:
+			print(f"calc service listening on {sock.getsockname()}",
+				file=sys.stderr)
+		async with server:
+			await server.serve_forever()
+		return
+
+
+def request(payload: dict, *, path: str = None, host: str = "127.0.0.1",
+	port: int = None, timeout: float = None,
+) -> dict:
+	# blocking client for one request, e.g. for scripts
+	if path is not None:
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		address = path
+	else:
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		address = (host, port)
+	with sock:
+		sock.settimeout(timeout)
+		sock.connect(address)
+		sock.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+		with sock.makefile("rb") as fp:
+			ret = json.loads(fp.readline())
+	return ret
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import os
+from typing import Self
+
+import numpy
+import pandas
+import scipy.io
+import scipy.sparse
+
+from .recipe_matrix import RecipeMatrix
+
+
+class CoefMatrixFile(object):
+	# read/write a coef matrix, e.g. to diff recipe matrices across game
+	# versions:
+	#   "tsv": dense, with row and column labels (DataFrame.to_csv)
+	#   "npz": scipy.sparse CSR (save_npz)
+	#   "mtx": Matrix Market coordinate, one entry per line
+	#   "parquet": one (row, col, value) record per non-zero entry, rows and
+	#     columns by position
+	# the row and column labels of the sparse formats are written to sidecar
+	# files, one label per line: <fname>.rows.txt and <fname>.cols.txt
+	FORMATS = ("tsv", "npz", "mtx", "parquet")
+	EXTENSIONS = {"tsv": "tsv", "txt": "tsv", "npz": "npz", "mtx": "mtx",
+		"parquet": "parquet"}
+
+	def __init__(self, matrix: scipy.sparse.csr_array,
+		row_names: pandas.Index, col_names: pandas.Index,
+	) -> None:
+		if matrix.shape != (len(row_names), len(col_names)):
+			raise ValueError(f"matrix shape {matrix.shape} does not match "
+				f"{len(row_names)} row and {len(col_names)} column names")
+		self.matrix = scipy.sparse.csr_array(matrix)
+		self.row_names = pandas.Index(row_names)
+		self.col_names = pandas.Index(col_names)
+		return
+
+	@classmethod
+	def from_recipe_matrix(cls, recipe_matrix: RecipeMatrix) -> Self:
+		ret = cls(recipe_matrix.get_sparse_coef_matrix(),
+			recipe_matrix.coef_matrix.index, recipe_matrix.coef_matrix.columns)
+		return ret
+
+	@classmethod
+	def get_format(cls, fname: str, fmt: str = None) -> str:
+		if fmt is None:
+			ext = os.path.splitext(fname)[1].lstrip(".").lower()
+			fmt = cls.EXTENSIONS.get(ext, ext)
+		if fmt not in cls.FORMATS:
+			raise ValueError(f"unknown coef matrix file format: '{fmt}', "
+				f"expected one of {cls.FORMATS}")
+		return fmt
+
+	@staticmethod
+	def sidecar_names(fname: str) -> tuple[str, str]:
+		# row and column label files of fname
+		return fname + ".rows.txt", fname + ".cols.txt"
+
+	def to_dataframe(self) -> pandas.DataFrame:
+		# dense, as RecipeMatrix.coef_matrix
+		ret = pandas.DataFrame(self.matrix.toarray(), index=self.row_names,
+			columns=self.col_names)
+		return ret
+
+	def write(self, fname: str, fmt: str = None) -> None:
+		# fmt: one of FORMATS, by default from the file extension
+		fmt = self.get_format(fname, fmt)
+		if fmt == "tsv":
+			self.to_dataframe().to_csv(fname, sep="\t", index=True)
+			return
+		if fmt == "npz":
+			scipy.sparse.save_npz(fname, self.matrix, compressed=True)
+		elif fmt == "mtx":
+			scipy.io.mmwrite(fname, self.matrix, precision=17)
+		else:
+			coo = self.matrix.tocoo()
+			pandas.DataFrame({
+				"row": coo.row.astype(numpy.int32),
+				"col": coo.col.astype(numpy.int32),
+				"value": coo.data,
+			}).to_parquet(fname, index=False)
+		for sidecar, names in zip(self.sidecar_names(fname),
+			[self.row_names, self.col_names],
+		):
+			with open(sidecar, "w", encoding="utf-8") as fp:
+				for name in names:
+					print(name, file=fp)
+		return
+
+	@staticmethod
+	def _read_names(fname: str) -> pandas.Index:
+		with open(fname, "r", encoding="utf-8") as fp:
+			ret = pandas.Index([line.rstrip("\n") for line in fp])
+		return ret
+
+	@classmethod
+	def read(cls, fname: str, fmt: str = None) -> Self:
+		# inverse of .write(); the sparse formats need their sidecar files
+		fmt = cls.get_format(fname, fmt)
+		if fmt == "tsv":
+			df = pandas.read_csv(fname, sep="\t", index_col=0,
+				float_precision="round_trip")
+			ret = cls(scipy.sparse.csr_array(df.to_numpy(dtype=float)),
+				df.index, df.columns)
+			return ret
+		row_names, col_names = (cls._read_names(i)
+			for i in cls.sidecar_names(fname))
+		shape = (len(row_names), len(col_names))
+		if fmt == "npz":
+			matrix = scipy.sparse.load_npz(fname)
+		elif fmt == "mtx":
+			matrix = scipy.io.mmread(fname)
+		else:
+			df = pandas.read_parquet(fname)
+			matrix = scipy.sparse.coo_array((df["value"].to_numpy(dtype=float),
+				(df["row"].to_numpy(), df["col"].to_numpy())), shape=shape)
+		ret = cls(scipy.sparse.csr_array(matrix), row_names, col_names)
+		return ret
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import collections
+from typing import Self, Sequence
+
+import numpy
+import scipy.optimize
+
+from .elements import ClockSpeed
+from .linear_program import LinearProgram, LinearProgramSolver
+from .objective_calculator import ObjectiveCalculator
+from .recipe_matrix import RecipeMatrix
+
+
+class ColumnGenerationCalculator(ObjectiveCalculator):
+	# same problem as ObjectiveCalculator, solved by column generation
+	# the recipe matrix is the pool of all candidate variants, e.g. every
+	# (somersloop, clock speed) pair on a fine clock speed grid; the solver
+	# (master problem) starts with the S0 variants at production clock speed,
+	# then each round prices all other variants with the current duals and
+	# adds those with negative reduced cost, until there is none
+	# only a small part of the pool ever enters the master problem, and each
+	# round warm-starts from the previous basis
+	# .result.x is over the whole pool, unused variants are 0
+	def __init__(self, recipe_matrix: RecipeMatrix, *,
+		max_columns_per_round: int = None,
+		max_rounds: int = 1000,
+		tol: float = 1e-6,
+		**kw,
+	) -> None:
+		super().__init__(recipe_matrix, **kw)
+		if self.logistics is not None:
+			raise ValueError("logistics limits are not supported by column generation")
+		if max_rounds < 1:
+			raise ValueError("max_rounds must be positive")
+		self.max_columns_per_round = max_columns_per_round
+		self.max_rounds = max_rounds
+		self.tol = tol
+		# the problem over the whole pool, used for pricing
+		self._pool_lp: LinearProgram = None
+		# pool positions of the master problem columns
+		self._active: numpy.ndarray = None
+		self.stats = collections.Counter()
+		return
+
+	@classmethod
+	def from_recipe_dataset_json(cls, fname: str, *,
+		production_clock_speed: int = ClockSpeed(250),
+		resource_extraction_clock_speed: int = ClockSpeed(250),
+		enable_somersloop_amplification: bool = False,
+		production_clock_speed_grid: Sequence[int] = None,
+		**kw,
+	) -> Self:
+		# production_clock_speed_grid: e.g. range(10, 251, 10)
+		recipe_matrix = RecipeMatrix.from_curated_recipe_dataset_json(fname,
+			production_clock_speed=production_clock_speed,
+			resource_extraction_clock_speed=resource_extraction_clock_speed,
+			with_somersloop=enable_somersloop_amplification,
+			production_clock_speed_grid=production_clock_speed_grid,
+		)
+		ret = cls(recipe_matrix,
+			enable_somersloop_amplification=enable_somersloop_amplification,
+			**kw,
+		)
+		return ret
+
+	def get_initial_columns(self) -> numpy.ndarray:
+		# S0 variants at production clock speed; recipes without such a
+		# variant (e.g. resources, not overclockable) start with all their S0
+		# variants
+		row_meta = self.recipe_matrix.row_metadata
+		s0 = row_meta.somersloop == 0
+		preferred = s0 & (row_meta.clock_speed
+			== self.recipe_matrix.production_clock_speed)
+		uncovered = ~numpy.isin(row_meta.recipe, row_meta.recipe[preferred])
+		ret = numpy.flatnonzero(preferred | (s0 & uncovered))
+		return ret
+
+	@property
+	def solver(self) -> LinearProgramSolver:
+		# the master problem
+		if self._solver is None:
+			pool = self.get_linear_program(self.objective,
+				maximize=self.maximize, eq_items=self.get_eq_items())
+			active = self.get_initial_columns()
+			master = LinearProgram(
+				c=pool.c[active],
+				A=pool.A[:, active],
+				row_lower=pool.row_lower,
+				row_upper=pool.row_upper,
+				col_lower=pool.col_lower[active],
+				col_upper=pool.col_upper[active],
+				col_names=pool.col_names[active],
+				row_names=pool.row_names,
+			)
+			self._solver = LinearProgramSolver(master)
+			self._pool_lp = pool
+			self._active = active
+		return self._solver
+
+	def _price(self, row_duals: numpy.ndarray) -> numpy.ndarray:
+		# pool positions of variants to add, most negative reduced cost first
+		pool = self._pool_lp
+		reduced_costs = pool.c - pool.A.T @ row_duals
+		# active variants and variants fixed at 0 cannot enter
+		reduced_costs[self._active] = numpy.inf
+		reduced_costs[pool.col_upper <= 0] = numpy.inf
+		candidates = numpy.flatnonzero(reduced_costs < -self.tol)
+		candidates = candidates[numpy.argsort(reduced_costs[candidates],
+			kind="stable")]
+		# only the best variant of each recipe, the others are priced again
+		# in the next round
+		_, first = numpy.unique(
+			self.recipe_matrix.row_metadata.recipe[candidates],
+			return_index=True)
+		ret = candidates[numpy.sort(first)]
+		if self.max_columns_per_round is not None:
+			ret = ret[:self.max_columns_per_round]
+		return ret
+
+	def _update_apa_counts(self) -> None:
+		# the master problem is rebuilt from the pool, with the initial columns
+		self._solver = None
+		self._pool_lp = None
+		self._active = None
+		return
+
+	def calculate(self, *, exit_on_failure: bool = True,
+	) -> scipy.optimize.OptimizeResult:
+		solver = self.solver
+		pool = self._pool_lp
+		nit = 0
+		for _ in range(self.max_rounds):
+			res = solver.solve()
+			nit += res.nit
+			self.stats["rounds"] += 1
+			if not res.success:
+				break
+			entering = self._price(res.row_marginals)
+			if not len(entering):
+				break
+			solver.add_cols(pool.A[:, entering], pool.c[entering],
+				pool.col_lower[entering], pool.col_upper[entering],
+				names=pool.col_names[entering])
+			self._active = numpy.concatenate([self._active, entering])
+			self.stats["columns_added"] += len(entering)
+		else:
+			res.success = False
+			res.status = 1
+			res.message = "column generation round limit reached"
+		res.nit = nit
+		if res.x is not None:
+			# map back onto the whole pool
+			x = numpy.zeros(pool.n_cols)
+			x[self._active] = res.x
+			res.x = x
+			res.reduced_costs = pool.c - pool.A.T @ res.row_marginals
+			res.active_columns = self._active.copy()
+			# bound marginals are over the master problem only
+			res.pop("lower", None)
+			res.pop("upper", None)
+		self._accept_result(res, exit_on_failure=exit_on_failure,
+			lp=solver.lp)
+		return res
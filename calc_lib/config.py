@@ -205,6 +205,14 @@ POWER_BOOST_BUILDING_LIST = [
 	"Build_AlienPowerBuilding_C",
 ]
 
+################################################################################
+# logistics throughput by tier (Mk), in items/min for belts and m3/min for
+# pipes, can get from:
+# https://satisfactory.wiki.gg/wiki/Conveyor_Belts
+# https://satisfactory.wiki.gg/wiki/Pipelines
+BELT_THROUGHPUT = {1: 60, 2: 120, 3: 270, 4: 480, 5: 780, 6: 1200}
+PIPE_THROUGHPUT = {1: 300, 2: 600}
+
 ################################################################################
 # resource converter recipes
 RESOURCE_CONVERTER_RECIPE_LIST = [
@@ -226,3 +234,7 @@ RESOURCE_CONVERTER_RECIPE_LIST = [
 	"Recipe_Sulfur_Iron_C",
 	"Recipe_Uranium_Bauxite_C",
 ]
+
+################################################################################
+# alternate recipes, unlocked from hard drives
+ALTERNATE_RECIPE_CLASSNAME_PREFIX = "Recipe_Alternate_"
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import dataclasses
+from typing import Sequence
+
+import numpy
+import pandas
+import scipy.sparse
+
+
+@dataclasses.dataclass
+class ConstraintPartition(object):
+	# the eq/ub split of constraint rows for a given list of net-zero items
+	# A_eq and A_ub are shared by all users of the partition, do not modify
+	eq_index: pandas.Index
+	ub_index: pandas.Index
+	eq_positions: numpy.ndarray
+	ub_positions: numpy.ndarray
+	A_eq: scipy.sparse.csr_array
+	A_ub: scipy.sparse.csr_array
+
+	def split(self, b: pandas.Series | numpy.ndarray,
+	) -> tuple[numpy.ndarray, numpy.ndarray]:
+		# split a constraint vector (indexed by constraint rows) into b_eq, b_ub
+		b = numpy.asarray(b, dtype=float)
+		return b[self.eq_positions], b[self.ub_positions]
+
+
+class ConstraintBuilder(object):
+	def __init__(self, coef_matrix: pandas.DataFrame) -> None:
+		# constraint rows are the coef matrix columns (somersloop, power, items)
+		# constraint columns are the coef matrix rows (recipe variants)
+		self.row_index: pandas.Index = coef_matrix.columns
+		self.col_index: pandas.Index = coef_matrix.index
+		# take the negative transpose of the coef matrix
+		# keep the somersloop row not negated
+		sign = numpy.where(self.row_index == "somersloop", 1.0, -1.0)
+		self.A = scipy.sparse.csr_array(
+			coef_matrix.to_numpy(dtype=float).T * sign[:, None])
+		# cached partitions and dense rows
+		self._partitions: dict[tuple[str, ...], ConstraintPartition] = dict()
+		self._rows: dict[str, numpy.ndarray] = dict()
+		return
+
+	@property
+	def shape(self) -> tuple[int, int]:
+		return self.A.shape
+
+	def get_row(self, name: str) -> numpy.ndarray:
+		# a dense constraint row, e.g. to be used as linprog objective
+		if name not in self._rows:
+			pos = self.row_index.get_loc(name)
+			self._rows[name] = self.A[[pos], :].toarray().ravel()
+		return self._rows[name]
+
+	def get_partition(self, eq_items: Sequence[str]) -> ConstraintPartition:
+		# the partition is computed once per net-zero item list
+		# the list order is kept as the row order of A_eq
+		key = tuple(eq_items)
+		if key not in self._partitions:
+			self._partitions[key] = self._compute_partition(key)
+		return self._partitions[key]
+
+	def _compute_partition(self, eq_items: tuple[str, ...],
+	) -> ConstraintPartition:
+		eq_positions = self.row_index.get_indexer(eq_items)
+		if (eq_positions < 0).any():
+			missing = [i for i, p in zip(eq_items, eq_positions) if p < 0]
+			raise KeyError(f"unknown constraint rows: {missing}")
+		mask = numpy.ones(len(self.row_index), dtype=bool)
+		mask[eq_positions] = False
+		ub_positions = numpy.flatnonzero(mask)
+		ret = ConstraintPartition(
+			eq_index=self.row_index[eq_positions],
+			ub_index=self.row_index[ub_positions],
+			eq_positions=eq_positions,
+			ub_positions=ub_positions,
+			A_eq=self.A[eq_positions, :],
+			A_ub=self.A[ub_positions, :],
+		)
+		return ret
+
+	def find_partition(self, A_ub=None, A_eq=None) -> ConstraintPartition | None:
+		# the cached partition whose matrices are the given ones, e.g. to
+		# recover row names of linprog arguments; None if there is none
+		for partition in self._partitions.values():
+			if (A_ub is not None) and (A_ub is not partition.A_ub):
+				continue
+			if (A_eq is not None) and (A_eq is not partition.A_eq):
+				continue
+			if (A_ub is None) and (A_eq is None):
+				continue
+			return partition
+		return None
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
 import dataclasses
-import pdb
-from typing import Optional
+from typing import Optional, Sequence
+
+import numpy
 
 from . import util
 from . import config
@@ -15,6 +16,14 @@ class ClockSpeed(int):
 			raise ValueError("ClockSpeed must be between 0 and 250")
 		return new
 
+	@classmethod
+	def array(cls, x) -> numpy.ndarray:
+		# validate a whole array of clock speeds at once
+		ret = numpy.asarray(x)
+		if ((ret < 1) | (ret > 250)).any():
+			raise ValueError("ClockSpeed must be between 0 and 250")
+		return ret
+
 
 @dataclasses.dataclass
 class Item(object):
@@ -206,3 +215,87 @@ class Building(object):
 			else:
 				ret = base_power
 		return ret
+
+	# below are vectorized versions of the methods above
+	# clock_speed and somersloop are arrays broadcastable against each other,
+	# recipe-dependent values are taken from recipes, a single recipe or a
+	# sequence of recipes aligned with the broadcast shape
+	def get_base_power_array(self, recipes: Recipe | Sequence[Recipe] = None,
+	) -> numpy.ndarray:
+		if self.variable_power_consumption:
+			if recipes is None:
+				raise ValueError("recipe must be provided for variable power "
+					"consumption buildings")
+			if isinstance(recipes, Recipe):
+				recipes = [recipes]
+			constant = numpy.array([r.variable_power_consumption_constant
+				for r in recipes], dtype=float)
+			factor = numpy.array([r.variable_power_consumption_factor
+				for r in recipes], dtype=float)
+			ret = -constant - factor / 2
+		else:
+			ret = numpy.asarray(self.get_base_power(), dtype=float)
+		return ret
+
+	def get_overclock_power_multiplier_array(self, clock_speed,
+	) -> numpy.ndarray:
+		clock_speed = ClockSpeed.array(clock_speed)
+		if self.power_consumption > 0:
+			ret = (clock_speed / 100) ** self.power_consumption_exponent
+		elif self.power_production > 0:
+			# linear, same as get_overclock_power_multiplier()
+			ret = clock_speed / 100
+		else:
+			ret = numpy.ones(clock_speed.shape, dtype=float)
+		return ret
+
+	def get_production_multiplier_array(self, somersloop) -> numpy.ndarray:
+		somersloop = numpy.asarray(somersloop)
+		if ((somersloop < 0) | (somersloop > self.production_shard_slot_size)).any():
+			raise ValueError("somersloop must be between 0 and slot size "
+				f"{self.production_shard_slot_size}, got {somersloop}")
+		return somersloop * self.production_shard_boost_multiplier + 1.0
+
+	def get_production_boost_power_multiplier_array(self, somersloop,
+	) -> numpy.ndarray:
+		multiplier = self.get_production_multiplier_array(somersloop)
+		if self.power_consumption == 0:
+			# skip if is not a power-consumption building
+			return numpy.ones(multiplier.shape, dtype=float)
+		return multiplier ** self.production_boost_power_consumption_exponent
+
+	def get_geothermal_power_array(self, recipes: Recipe | Sequence[Recipe],
+	) -> numpy.ndarray:
+		# power of geothermal generator is decided by the geyser purity, which
+		# is encoded in the recipe classname
+		if isinstance(recipes, Recipe):
+			recipes = [recipes]
+		ret = numpy.empty(len(recipes), dtype=float)
+		for i, recipe in enumerate(recipes):
+			for purity_config in config.RESOURCE_NODE_PURITY_CONFIG.values():
+				if recipe.classname.endswith(purity_config["label"]):
+					ret[i] = config.RESOURCE_NODE_GEYSER_POWER_NORMAL * \
+						purity_config["multiplier"]
+					break
+			else:
+				raise ValueError(f"{config.RESOURCE_NODE_GEYSER_GENERATOR} "
+					f"cannot work with recipe {recipe.classname}")
+		return ret
+
+	def get_adjusted_power_array(self, clock_speed, somersloop,
+		recipes: Recipe | Sequence[Recipe] = None,
+	) -> numpy.ndarray:
+		shape = numpy.broadcast_shapes(numpy.shape(clock_speed),
+			numpy.shape(somersloop))
+		# deal with geothermal generator magic
+		if self.classname == config.RESOURCE_NODE_GEYSER_GENERATOR:
+			ret = self.get_geothermal_power_array(recipes)
+		else:
+			base_power = self.get_base_power_array(recipes)
+			overclock = self.get_overclock_power_multiplier_array(clock_speed)
+			boost = self.get_production_boost_power_multiplier_array(somersloop)
+			ret = numpy.where(base_power > 0, base_power * overclock,
+				numpy.where(base_power < 0, base_power * overclock * boost,
+					base_power))
+		ret = numpy.broadcast_to(ret, numpy.broadcast_shapes(shape, ret.shape))
+		return ret
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import math
+import re
+from typing import Iterable, Self
+
+import numpy
+import openpyxl
+import openpyxl.cell
+import pandas
+
+
+class StreamingSheet(object):
+	# a sheet of a StreamingWorkbook; rows are appended, and can not be
+	# revisited once written
+	def __init__(self, worksheet, columns: list[str],
+		number_formats: dict[str, str],
+	) -> None:
+		self.worksheet = worksheet
+		self.number_formats = number_formats
+		self.set_columns(columns)
+		self.n_rows = 0
+		return
+
+	def set_columns(self, columns: list[str]) -> None:
+		# columns of the following rows, e.g. of another section
+		self.columns = list(columns)
+		# number format of each column position, None for general
+		self._formats = [self.number_formats.get(c) for c in self.columns]
+		return
+
+	@staticmethod
+	def _value(value):
+		# plain python values; NaN and None are empty cells
+		if isinstance(value, numpy.generic):
+			value = value.item()
+		if isinstance(value, float) and math.isnan(value):
+			value = None
+		return value
+
+	def append(self, values: Iterable) -> None:
+		# values by column position; with typed columns, numbers are formatted
+		row = list()
+		for k, value in enumerate(values):
+			value = self._value(value)
+			fmt = self._formats[k] if k < len(self._formats) else None
+			if (fmt is not None) and isinstance(value, (int, float)) \
+				and not isinstance(value, bool):
+				cell = openpyxl.cell.WriteOnlyCell(self.worksheet, value=value)
+				cell.number_format = fmt
+				value = cell
+			row.append(value)
+		self.worksheet.append(row)
+		self.n_rows += 1
+		return
+
+	def append_header(self) -> None:
+		self.worksheet.append(self.columns)
+		self.n_rows += 1
+		return
+
+	def append_dataframe(self, df: pandas.DataFrame) -> None:
+		# rows of df, columns in the order of this sheet
+		for values in df.reindex(columns=self.columns).itertuples(index=False,
+			name=None):
+			self.append(values)
+		return
+
+
+class StreamingWorkbook(object):
+	# a workbook written in openpyxl's write-only mode: rows go to temporary
+	# files as they are appended, so memory does not grow with the number of
+	# cells, e.g. for a whole sweep of results; the workbook is saved on
+	# .close()
+	# columns are typed by number formats given by column name, in addition
+	# to NUMBER_FORMATS, e.g. {"machines": "0.000"}; columns without a
+	# format are written as general cells
+	# sheet titles are cleaned of characters invalid in Excel, truncated and
+	# made unique
+	MAX_TITLE_LENGTH = 31
+	# number formats of the columns of ProductionCalculator.get_report_tables()
+	NUMBER_FORMATS = {
+		"machines": "0.000",
+		"somersloop": "0.000",
+		"power": "0.0",
+		"rate": "0.000",
+		"sinkpoints": "0",
+		"consumption": "0.000",
+		"utilized": "0.0%",
+		"somersloop_amplification": "0.0",
+		"somersloop_apa": "0",
+		"apa_power_boost": "0%",
+		"net_power": "0.0",
+		"raw_power": "0.0",
+	}
+	REPORT_SECTIONS = {
+		"recipes": "Recipe detail",
+		"summary": "Summary",
+		"net_products": "Net products",
+		"resources": "Resource summary",
+	}
+
+	def __init__(self, fname: str, *, number_formats: dict[str, str] = None,
+	) -> None:
+		self.fname = fname
+		self.number_formats = dict(self.NUMBER_FORMATS)
+		if number_formats:
+			self.number_formats.update(number_formats)
+		self.workbook = openpyxl.Workbook(write_only=True)
+		self._titles = set()
+		return
+
+	def __enter__(self) -> Self:
+		return self
+
+	def __exit__(self, exc_type, *ka) -> None:
+		# not saved if an error occurred
+		if exc_type is None:
+			self.close()
+		return
+
+	def close(self) -> None:
+		self.workbook.save(self.fname)
+		return
+
+	def _unique_title(self, title: str) -> str:
+		title = re.sub(r"[\[\]:*?/\\]", "_", str(title)).strip("'") or "Sheet"
+		ret = title[:self.MAX_TITLE_LENGTH]
+		n = 0
+		while ret.lower() in self._titles:
+			n += 1
+			suffix = f"~{n}"
+			ret = title[:self.MAX_TITLE_LENGTH - len(suffix)] + suffix
+		self._titles.add(ret.lower())
+		return ret
+
+	def add_sheet(self, title: str, columns: list[str], *,
+		number_formats: dict[str, str] = None, header: bool = True,
+	) -> StreamingSheet:
+		# an empty sheet for rows of columns; number_formats override those of
+		# the workbook for this sheet
+		formats = dict(self.number_formats)
+		if number_formats:
+			formats.update(number_formats)
+		worksheet = self.workbook.create_sheet(title=self._unique_title(title))
+		ret = StreamingSheet(worksheet, columns, formats)
+		if header:
+			ret.append_header()
+		return ret
+
+	def add_dataframe(self, title: str, df: pandas.DataFrame, *,
+		number_formats: dict[str, str] = None,
+	) -> StreamingSheet:
+		ret = self.add_sheet(title, list(df.columns),
+			number_formats=number_formats)
+		ret.append_dataframe(df)
+		return ret
+
+	def add_report(self, title: str, tables: dict[str, pandas.DataFrame],
+	) -> StreamingSheet:
+		# the tables of ProductionCalculator.get_report_tables() in one sheet,
+		# one section after another; the summary is written as name/value
+		# rows
+		ret = self.add_sheet(title, [], header=False)
+		for section, df in tables.items():
+			if ret.n_rows:
+				ret.append([])
+			ret.append([">> " + self.REPORT_SECTIONS.get(section, section)])
+			if section == "summary":
+				for column, value in df.iloc[0].items():
+					ret.set_columns(["name", column])
+					ret.append([column, value])
+				continue
+			ret.set_columns(df.columns)
+			ret.append_header()
+			ret.append_dataframe(df)
+		return ret
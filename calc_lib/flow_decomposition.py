@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import dataclasses
+from typing import Self
+
+import numpy
+import pandas
+import scipy.sparse
+import scipy.sparse.linalg
+
+from . import util
+from .recipe_matrix import RecipeMatrix
+
+
+@dataclasses.dataclass
+class FlowDecomposition(object):
+	# decomposition of a solution into chains per final product and per
+	# resource, by proportional sharing:
+	#   each item is supplied to its consumers (and to the net output) in
+	#   proportion to their consumption, by all of its producers alike
+	#   a recipe with several outputs is shared among them in proportion to
+	#   the output amounts, times optional allocation weights
+	# power is treated as an item, "power", in MW; net power is a final
+	# product like net item outputs
+	# with W[r, s] the share of recipe r's activity serving recipe s, the
+	# share of r serving final product k is T = (I - W)^-1 F, and resources
+	# embodied in each recipe are E = (I - W^T)^-1 D; both are solved with a
+	# single sparse LU of the active submatrix
+	# all amounts are per minute as shown in the reports (i.e. m3/min for
+	# fluids), except power in MW
+	POWER = "power"
+
+	row_labels: pandas.Index  # active variants
+	recipes: numpy.ndarray  # recipe classname of each active variant
+	x: numpy.ndarray  # machine count of each active variant
+	flows: scipy.sparse.csr_array  # active variants x .flow_columns
+	flow_columns: pandas.Index  # items and "power"
+	final_products: pandas.Series  # net output of each final product
+	resources: pandas.Series  # extraction of each resource
+	# share of each variant's activity serving each final product
+	attribution: pandas.DataFrame  # active variants x final products
+	# amount of each resource embodied in each variant's activity
+	embodied: pandas.DataFrame  # active variants x resources
+	# amount of each resource extracted by each variant directly
+	extraction: pandas.DataFrame  # active variants x resources
+
+	@classmethod
+	def from_result(cls, recipe_matrix: RecipeMatrix, x: numpy.ndarray, *,
+		tol: float = 1e-8, allocation_weights: dict[str, float] = None,
+	) -> Self:
+		# allocation_weights: item -> weight of its output amount when
+		# sharing multi-output recipes, default 1.0
+		items = recipe_matrix.recipe_dataset.items
+		row_meta = recipe_matrix.row_metadata
+		active = numpy.flatnonzero(x > tol)
+		xa = x[active]
+		# flows of active variants, display units per minute and MW
+		flow_columns = recipe_matrix.item_index.append(
+			pandas.Index([cls.POWER]))
+		scale = numpy.array([items[k].rescale_amount(60.0) if k in items
+			else 60.0 for k in recipe_matrix.item_index] + [1.0])
+		flows = scipy.sparse.hstack([
+			recipe_matrix.flow_matrix[active],
+			scipy.sparse.csr_array(recipe_matrix.get_column(cls.POWER)[active,
+				None]),
+		])
+		flows = scipy.sparse.diags_array(xa) @ flows @ scipy.sparse.diags_array(
+			scale)
+		flows = scipy.sparse.csr_array(flows)
+		flows.data[numpy.abs(flows.data) <= tol] = 0
+		flows.eliminate_zeros()
+		produced = flows.maximum(0)
+		consumed = (-flows).maximum(0)
+		total_produced = numpy.asarray(produced.sum(axis=0)).ravel()
+		net = total_produced - numpy.asarray(consumed.sum(axis=0)).ravel()
+		net[net <= tol * numpy.maximum(total_produced, 1.0)] = 0
+		inv_produced = numpy.divide(1.0, total_produced,
+			out=numpy.zeros_like(total_produced), where=total_produced > 0)
+		# output shares of multi-output recipes
+		weights = numpy.ones(len(flow_columns))
+		if allocation_weights:
+			pos = flow_columns.get_indexer(list(allocation_weights.keys()))
+			weights[pos[pos >= 0]] = numpy.fromiter(
+				allocation_weights.values(), dtype=float)[pos >= 0]
+		weighted = produced @ scipy.sparse.diags_array(weights)
+		row_total = numpy.asarray(weighted.sum(axis=1)).ravel()
+		alpha = scipy.sparse.diags_array(numpy.divide(1.0, row_total,
+			out=numpy.zeros_like(row_total), where=row_total > 0)) @ weighted
+		# share of each variant serving other variants and final products
+		w = alpha @ scipy.sparse.diags_array(inv_produced) @ consumed.T
+		final_pos = numpy.flatnonzero(net > 0)
+		f = (alpha @ scipy.sparse.diags_array(net * inv_produced))[:, final_pos]
+		# resources are the item products of resource proxy recipes
+		# (i.e. not geothermal power)
+		is_proxy = row_meta.is_resource_proxy[active]
+		d = scipy.sparse.diags_array(is_proxy.astype(float)) @ produced
+		extracted = numpy.asarray(d.sum(axis=0)).ravel()
+		extracted[flow_columns.get_loc(cls.POWER)] = 0
+		resource_pos = numpy.flatnonzero(extracted > 0)
+		d = d[:, resource_pos]
+		# solve both directions with one factorization
+		n = len(active)
+		lu = scipy.sparse.linalg.splu(scipy.sparse.csc_array(
+			scipy.sparse.eye_array(n) - w))
+		attribution = lu.solve(f.toarray()) if len(final_pos) \
+			else numpy.zeros((n, 0))
+		embodied = lu.solve(d.toarray(), trans="T") if len(resource_pos) \
+			else numpy.zeros((n, 0))
+		row_labels = recipe_matrix.coef_matrix.index[active]
+		ret = cls(
+			row_labels=row_labels,
+			recipes=row_meta.recipe[active],
+			x=xa,
+			flows=flows,
+			flow_columns=flow_columns,
+			final_products=pandas.Series(net[final_pos],
+				index=flow_columns[final_pos]),
+			resources=pandas.Series(extracted[resource_pos],
+				index=flow_columns[resource_pos]),
+			attribution=pandas.DataFrame(numpy.clip(attribution, 0, None),
+				index=row_labels, columns=flow_columns[final_pos]),
+			embodied=pandas.DataFrame(numpy.clip(embodied, 0, None),
+				index=row_labels, columns=flow_columns[resource_pos]),
+			extraction=pandas.DataFrame(d.toarray(), index=row_labels,
+				columns=flow_columns[resource_pos]),
+		)
+		return ret
+
+	def get_final_product_resources(self) -> pandas.DataFrame:
+		# resources embodied in the net output of each final product,
+		# final products x resources
+		# i.e. the share of each extraction serving each final product
+		ret = pandas.DataFrame(
+			self.attribution.to_numpy().T @ self.extraction.to_numpy(),
+			index=self.attribution.columns, columns=self.extraction.columns)
+		return ret
+
+	def get_chain(self, final_product: str, *, tol: float = 1e-8,
+	) -> pandas.Series:
+		# machine count of each variant serving a final product
+		ret = self.attribution[final_product] * self.x
+		return ret[ret > tol]
+
+	def to_dict(self, *, tol: float = 1e-8) -> dict:
+		# nested structure:
+		# {"final_products": {item: {"rate", "recipes": {variant: machines},
+		#   "resources": {resource: rate}}},
+		#  "resources": {resource: {"rate", "final_products": {item: rate},
+		#   "recipes": {variant: embodied rate}}}}
+		product_resources = self.get_final_product_resources()
+		ret = {"final_products": dict(), "resources": dict()}
+		for k, rate in self.final_products.items():
+			resources = product_resources.loc[k]
+			ret["final_products"][k] = {
+				"rate": float(rate),
+				"recipes": {str(r): float(v)
+					for r, v in self.get_chain(k, tol=tol).items()},
+				"resources": {str(r): float(v)
+					for r, v in resources[resources > tol].items()},
+			}
+		for r, rate in self.resources.items():
+			products = product_resources[r]
+			recipes = self.embodied[r]
+			ret["resources"][r] = {
+				"rate": float(rate),
+				"final_products": {str(k): float(v)
+					for k, v in products[products > tol].items()},
+				"recipes": {str(k): float(v)
+					for k, v in recipes[recipes > tol].items()},
+			}
+		return ret
+
+	def get_edges(self, final_product: str = None) -> pandas.DataFrame:
+		# item flows between variants, and from variants to final outputs
+		# (target "out:<item>"); columns source, target, item, rate
+		# if final_product is set, only the part serving it is kept
+		produced = scipy.sparse.csc_array(self.flows.maximum(0))
+		consumed = scipy.sparse.csc_array((-self.flows).maximum(0))
+		total = numpy.asarray(produced.sum(axis=0)).ravel()
+		if final_product is not None:
+			share = self.attribution[final_product].to_numpy()
+		else:
+			share = numpy.ones(len(self.x))
+		sources, targets, flow_items, rates = list(), list(), list(), list()
+		for i in numpy.flatnonzero(total > 0):
+			item = self.flow_columns[i]
+			p = produced[:, [i]]
+			c = consumed[:, [i]]
+			p_rows, p_vals = p.indices, p.data
+			c_rows, c_vals = c.indices, c.data * share[c.indices]
+			# producer x consumer pairs, proportional to both
+			sources.append(numpy.repeat(self.row_labels[p_rows], len(c_rows)))
+			targets.append(numpy.tile(self.row_labels[c_rows], len(p_rows)))
+			rates.append(numpy.outer(p_vals / total[i], c_vals).ravel())
+			flow_items.append(numpy.full(len(p_rows) * len(c_rows), item))
+			if item in self.final_products.index and ((final_product is None)
+				or (final_product == item)):
+				sources.append(numpy.asarray(self.row_labels[p_rows]))
+				targets.append(numpy.full(len(p_rows), f"out:{item}"))
+				rates.append(p_vals / total[i] * self.final_products[item])
+				flow_items.append(numpy.full(len(p_rows), item))
+		ret = pandas.DataFrame({
+			"source": numpy.concatenate(sources) if sources else [],
+			"target": numpy.concatenate(targets) if targets else [],
+			"item": numpy.concatenate(flow_items) if flow_items else [],
+			"rate": numpy.concatenate(rates) if rates else [],
+		})
+		ret = ret[ret["rate"] > 1e-8].reset_index(drop=True)
+		return ret
+
+	def to_dot(self, final_product: str = None, *,
+		recipe_names: dict[str, str] = None, item_names: dict[str, str] = None,
+	) -> str:
+		# graphviz dot of the flow graph, or of one final product chain
+		# names: optional classname -> display name mappings
+		recipe_names = recipe_names or dict()
+		item_names = item_names or dict()
+		edges = self.get_edges(final_product)
+		share = self.attribution[final_product] if final_product is not None \
+			else pandas.Series(1.0, index=self.row_labels)
+		lines = ["digraph flows {", "\trankdir=LR;"]
+		used = set(edges["source"]) | set(edges["target"])
+		for label, recipe, x in zip(self.row_labels, self.recipes, self.x):
+			if label not in used:
+				continue
+			variant = label.partition("/")[2]
+			text = "{} ({})\\nx {}".format(recipe_names.get(recipe, recipe),
+				variant, util.simplify_decimal(x * share[label], decimal=3))
+			lines.append(f"\t{self._quote(label)} [shape=box, "
+				f"label={self._quote(text)}];")
+		for k in self.final_products.index:
+			if f"out:{k}" in used:
+				lines.append(f"\t{self._quote('out:' + k)} [shape=ellipse, "
+					f"label={self._quote(item_names.get(k, k))}];")
+		for source, target, item, rate in edges.itertuples(index=False):
+			text = "{} {}".format(item_names.get(item, item),
+				util.simplify_decimal(rate, decimal=3))
+			lines.append(f"\t{self._quote(source)} -> {self._quote(target)} "
+				f"[label={self._quote(text)}];")
+		lines.append("}")
+		return ("\n").join(lines) + "\n"
+
+	@staticmethod
+	def _quote(s: str) -> str:
+		return '"' + str(s).replace('"', '\\"') + '"'
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import collections
+import dataclasses
+import io
+import sys
+
+import numpy
+import pandas
+
+from . import util
+from .linear_program import LinearProgram, LinearProgramSolver
+from .recipe_matrix import RecipeMatrix
+
+
+@dataclasses.dataclass
+class InfeasibleSubsystem(object):
+	# an irreducible infeasible subsystem: the problem is infeasible with only
+	# these constraints, but feasible once any one of them is removed
+	# (non-negativity of variants is always kept)
+	# rows/cols: one constraint per row, columns name, kind, display_name,
+	#   constraint (readable form), lower, upper (in solver units)
+	rows: pandas.DataFrame
+	cols: pandas.DataFrame
+	solves: int
+
+	def __len__(self) -> int:
+		return len(self.rows) + len(self.cols)
+
+	def report(self, fp: io.TextIOBase = None) -> None:
+		if fp is None:
+			fp = sys.stdout
+		print(">> Infeasible subsystem", file=fp)
+		print("=" * 80, file=fp)
+		print(("\t").join(["Kind", "Name", "Constraint", "Classname"]), file=fp)
+		print("-" * 80, file=fp)
+		for df in [self.rows, self.cols]:
+			for row in df.itertuples(index=False):
+				print(("\t").join([row.kind, row.display_name, row.constraint,
+					row.name]), file=fp)
+		print("-" * 80, file=fp)
+		print(f"{len(self)} constraints, found with {self.solves} solves",
+			file=fp)
+		print("=" * 80, file=fp)
+		return
+
+
+class InfeasibilityDiagnoser(object):
+	# find an irreducible infeasible subsystem (IIS) of an infeasible problem
+	# by deletion filtering: constraints are removed one block at a time as
+	# long as the problem stays infeasible; a block whose removal makes the
+	# problem feasible is bisected, down to single necessary constraints
+	# candidate constraints are all finite row bounds and all finite column
+	# bounds other than non-negativity, e.g. resource node counts or APA
+	# counts
+	# all feasibility solves share one solver with a zero objective, so that
+	# each solve warm-starts from the previous basis
+	AGGREGATE_ROWS = ("power", "raw_power", "points_gain_rate")
+
+	def __init__(self, lp: LinearProgram, *,
+		recipe_matrix: RecipeMatrix = None,
+		block_count: int = 16,
+	) -> None:
+		# recipe_matrix: if provided, used for display names and kinds
+		lp = lp.copy()
+		lp.c = numpy.zeros(lp.n_cols)
+		self.lp = lp
+		self.recipe_matrix = recipe_matrix
+		self.block_count = block_count
+		self.stats = collections.Counter()
+		self._solver: LinearProgramSolver = None
+		return
+
+	def _is_feasible(self) -> bool:
+		self.stats["solves"] += 1
+		res = self._solver.solve()
+		# anything else than optimal is treated as infeasible
+		return res.status == 0
+
+	def _relax(self, constraints: list[tuple[str, int]]) -> None:
+		rows = [i for kind, i in constraints if kind == "row"]
+		cols = [i for kind, i in constraints if kind == "col"]
+		if rows:
+			self._solver.set_row_bounds(rows, -numpy.inf, numpy.inf)
+		if cols:
+			self._solver.set_col_bounds(cols,
+				numpy.minimum(self.lp.col_lower[cols], 0), numpy.inf)
+		return
+
+	def _restore(self, constraints: list[tuple[str, int]]) -> None:
+		rows = [i for kind, i in constraints if kind == "row"]
+		cols = [i for kind, i in constraints if kind == "col"]
+		if rows:
+			self._solver.set_row_bounds(rows, self.lp.row_lower[rows],
+				self.lp.row_upper[rows])
+		if cols:
+			self._solver.set_col_bounds(cols, self.lp.col_lower[cols],
+				self.lp.col_upper[cols])
+		return
+
+	def _filter(self, block: list[tuple[str, int]],
+	) -> list[tuple[str, int]]:
+		# return the necessary constraints of the block; the others stay
+		# relaxed
+		self._relax(block)
+		if not self._is_feasible():
+			return list()
+		self._restore(block)
+		if len(block) == 1:
+			return block
+		half = len(block) // 2
+		ret = self._filter(block[:half])
+		ret.extend(self._filter(block[half:]))
+		return ret
+
+	def find(self) -> InfeasibleSubsystem:
+		self._solver = LinearProgramSolver(self.lp)
+		self.stats.clear()
+		if self._is_feasible():
+			raise ValueError("the problem is feasible")
+		lp = self.lp
+		rows = numpy.flatnonzero(numpy.isfinite(lp.row_lower)
+			| numpy.isfinite(lp.row_upper))
+		cols = numpy.flatnonzero(numpy.isfinite(lp.col_upper)
+			| (lp.col_lower > 0))
+		candidates = [("row", int(i)) for i in rows] \
+			+ [("col", int(i)) for i in cols]
+		size = max(1, -(-len(candidates) // self.block_count))
+		necessary = list()
+		for start in range(0, len(candidates), size):
+			necessary.extend(self._filter(candidates[start:start + size]))
+		ret = InfeasibleSubsystem(
+			rows=self._describe_rows([i for k, i in necessary if k == "row"]),
+			cols=self._describe_cols([i for k, i in necessary if k == "col"]),
+			solves=self.stats["solves"],
+		)
+		return ret
+
+	@staticmethod
+	def _bound_repr(lower: float, upper: float, *, scale: float = 1.0,
+		unit: str = "",
+	) -> str:
+		# readable form of lower <= value <= upper, with value scaled
+		# (+ 0.0 avoids printing -0)
+		lower, upper = sorted([lower * scale + 0.0, upper * scale + 0.0])
+		if lower == upper:
+			return f"== {util.simplify_decimal(lower)}{unit}"
+		parts = list()
+		if numpy.isfinite(lower):
+			parts.append(f">= {util.simplify_decimal(lower)}{unit}")
+		if numpy.isfinite(upper):
+			parts.append(f"<= {util.simplify_decimal(upper)}{unit}")
+		return (", ").join(parts)
+
+	def _describe_rows(self, positions: list[int]) -> pandas.DataFrame:
+		# constraint rows are negated net production, except somersloop
+		lp = self.lp
+		items = self.recipe_matrix.recipe_dataset.items \
+			if self.recipe_matrix is not None else dict()
+		records = list()
+		for i in positions:
+			name = str(lp.row_names[i]) if lp.row_names is not None else f"r{i}"
+			lower, upper = lp.row_lower[i], lp.row_upper[i]
+			if name == "somersloop":
+				kind, display_name = "somersloop limit", "Somersloop"
+				constraint = "used " + self._bound_repr(lower, upper)
+			elif name in self.AGGREGATE_ROWS:
+				kind, display_name = "aggregate", name
+				constraint = "net " + self._bound_repr(lower, upper, scale=-1)
+			elif name in items:
+				kind, display_name = "item balance", items[name].display_name
+				constraint = "net production " + self._bound_repr(lower, upper,
+					scale=-items[name].rescale_amount(60.0), unit="/min.")
+			else:
+				kind, display_name = "other", name
+				constraint = self._bound_repr(lower, upper)
+			records.append((name, kind, display_name, constraint, lower, upper))
+		ret = pandas.DataFrame(records, columns=["name", "kind",
+			"display_name", "constraint", "lower", "upper"])
+		return ret
+
+	def _describe_cols(self, positions: list[int]) -> pandas.DataFrame:
+		lp = self.lp
+		records = list()
+		for j in positions:
+			name = str(lp.col_names[j]) if lp.col_names is not None else f"x{j}"
+			lower, upper = lp.col_lower[j], lp.col_upper[j]
+			kind, display_name = "variant bound", name
+			if self.recipe_matrix is not None \
+				and name in self.recipe_matrix.coef_matrix.index:
+				pos = self.recipe_matrix.coef_matrix.index.get_loc(name)
+				row_meta = self.recipe_matrix.row_metadata
+				recipe = self.recipe_matrix.recipe_dataset.recipes.get(
+					row_meta.recipe[pos])
+				if recipe is not None:
+					display_name = "{} ({})".format(recipe.display_name,
+						name.partition("/")[2])
+				if row_meta.is_resource_proxy[pos]:
+					kind = "resource bound"
+				elif row_meta.is_power_booster[pos]:
+					kind = "APA count"
+			# non-negativity is implied
+			constraint = "machines " + self._bound_repr(
+				-numpy.inf if lower == 0 and upper > 0 else lower, upper)
+			records.append((name, kind, display_name, constraint, lower, upper))
+		ret = pandas.DataFrame(records, columns=["name", "kind",
+			"display_name", "constraint", "lower", "upper"])
+		return ret
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import heapq
+import itertools
+import multiprocessing
+import os
+from typing import AsyncIterator, Sequence
+
+import scipy.optimize
+
+from .calc_service import ModelCache
+from .scenario import Scenario
+
+
+class Job(object):
+	# a submitted solve or sweep of a JobQueue, awaitable for its results:
+	# one OptimizeResult per scenario, None for scenarios cancelled before
+	# they started
+	# states: "pending" -> "running" -> "done", "cancelled" or "failed"
+	# progress events are dicts with "job", "type", "done" and "total":
+	#   "started": the first scenario started
+	#   "progress": a scenario finished, with its "index" and "success"
+	#   "done", "cancelled", "failed" (with "error"): the job finished
+	TERMINAL = ("done", "cancelled", "failed")
+
+	def __init__(self, queue: "JobQueue", job_id: int,
+		scenarios: Sequence[Scenario], priority: int,
+	) -> None:
+		self.queue = queue
+		self.id = job_id
+		self.scenarios = list(scenarios)
+		self.priority = priority
+		self.state = "pending"
+		self.results: list[scipy.optimize.OptimizeResult] = \
+			[None] * len(self.scenarios)
+		self.n_done = 0
+		self.n_running = 0
+		self.cancel_requested = False
+		self._future = asyncio.get_running_loop().create_future()
+		# all events, so that late listeners get the whole history
+		self._events: list[dict] = list()
+		self._changed = asyncio.Condition()
+		return
+
+	def __await__(self):
+		return asyncio.shield(self._future).__await__()
+
+	@property
+	def total(self) -> int:
+		return len(self.scenarios)
+
+	def cancel(self) -> None:
+		# cooperative: scenarios not started yet are skipped, running ones
+		# still finish and keep their results
+		self.cancel_requested = True
+		self.queue._check_finished(self)
+		return
+
+	def _emit(self, event_type: str, **kw) -> None:
+		event = {"job": self.id, "type": event_type, "done": self.n_done,
+			"total": self.total}
+		event.update(kw)
+		self._events.append(event)
+		asyncio.get_running_loop().create_task(self._notify())
+		return
+
+	async def _notify(self) -> None:
+		async with self._changed:
+			self._changed.notify_all()
+		return
+
+	async def events(self) -> AsyncIterator[dict]:
+		# progress events from the first one, until the job finished
+		position = 0
+		while True:
+			async with self._changed:
+				await self._changed.wait_for(
+					lambda: len(self._events) > position)
+			while position < len(self._events):
+				event = self._events[position]
+				position += 1
+				yield event
+				if event["type"] in self.TERMINAL:
+					return
+		return
+
+
+class JobQueue(object):
+	# asyncio front end of the calculators: solves and sweeps are submitted
+	# as awaitable Jobs and run in a process pool
+	# scenarios wait in a priority queue in this process, and at most
+	# max_workers are in the pool at a time, so that jobs of a higher
+	# priority lane (lower value), e.g. interactive queries, start before
+	# the remaining scenarios of background sweeps; within a lane, jobs are
+	# first come, first served
+	# workers keep compiled recipe matrices and calculators in a ModelCache
+	PRIORITIES = {"interactive": 0, "normal": 10, "background": 20}
+
+	def __init__(self, max_workers: int = None, *,
+		executor: concurrent.futures.Executor = None,
+	) -> None:
+		# executor: e.g. a thread pool to embed in one process; owned by the
+		# caller, who also gives its max_workers
+		if executor is None:
+			if max_workers is None:
+				max_workers = os.cpu_count() or 1
+			start_method = "forkserver" if "forkserver" \
+				in multiprocessing.get_all_start_methods() else "spawn"
+			context = multiprocessing.get_context(start_method)
+			if start_method == "forkserver":
+				context.set_forkserver_preload(["calc_lib.job_queue"])
+			self.executor = concurrent.futures.ProcessPoolExecutor(max_workers,
+				mp_context=context)
+			self._owns_executor = True
+		else:
+			if max_workers is None:
+				raise ValueError("max_workers is required with an executor")
+			self.executor = executor
+			self._owns_executor = False
+		self.max_workers = max_workers
+		# (priority, sequence, job, scenario index)
+		self._heap: list[tuple[int, int, Job, int]] = list()
+		self._sequence = itertools.count()
+		self._job_ids = itertools.count(1)
+		self._n_running = 0
+		self.stats = collections.Counter()
+		return
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *ka) -> None:
+		await self.close()
+		return
+
+	async def close(self) -> None:
+		# pending scenarios are cancelled; running ones are waited for in
+		# another thread, so that the event loop keeps running meanwhile
+		for _, _, job, _ in self._heap:
+			job.cancel()
+		if self._owns_executor:
+			await asyncio.get_running_loop().run_in_executor(None,
+				functools.partial(self.executor.shutdown, wait=True,
+					cancel_futures=True))
+		return
+
+	@classmethod
+	def get_priority(cls, priority: int | str) -> int:
+		if isinstance(priority, str):
+			if priority not in cls.PRIORITIES:
+				raise ValueError(f"unknown priority lane: '{priority}', "
+					f"expected one of {list(cls.PRIORITIES)}")
+			priority = cls.PRIORITIES[priority]
+		return int(priority)
+
+	def submit(self, scenario: Scenario, *,
+		priority: int | str = "interactive",
+	) -> Job:
+		# a single solve; await the job for a list of one result
+		ret = self.submit_sweep([scenario], priority=priority)
+		return ret
+
+	def submit_sweep(self, scenarios: Sequence[Scenario], *,
+		priority: int | str = "background",
+	) -> Job:
+		ret = Job(self, next(self._job_ids), scenarios,
+			self.get_priority(priority))
+		sequence = next(self._sequence)
+		for i in range(ret.total):
+			heapq.heappush(self._heap, (ret.priority, sequence, ret, i))
+		self.stats["jobs"] += 1
+		if not ret.total:
+			self._finish(ret)
+		self._fill()
+		return ret
+
+	def _fill(self) -> None:
+		# move scenarios from the heap into the pool, while workers are free
+		loop = asyncio.get_running_loop()
+		while self._heap and (self._n_running < self.max_workers):
+			_, _, job, i = heapq.heappop(self._heap)
+			if job.state in Job.TERMINAL:
+				continue
+			if job.cancel_requested:
+				self.stats["skipped"] += 1
+				continue
+			if job.state == "pending":
+				job.state = "running"
+				job._emit("started")
+			job.n_running += 1
+			self._n_running += 1
+			future = loop.run_in_executor(self.executor, _solve_scenario,
+				job.scenarios[i])
+			future.add_done_callback(lambda f, job=job, i=i:
+				self._on_solved(job, i, f))
+		return
+
+	def _on_solved(self, job: Job, i: int, future: asyncio.Future) -> None:
+		job.n_running -= 1
+		self._n_running -= 1
+		if job.state not in Job.TERMINAL:
+			if future.cancelled():
+				job.cancel()
+			elif future.exception() is not None:
+				job.cancel_requested = True
+				job.state = "failed"
+				job._emit("failed", error=f"{type(future.exception()).__name__}: "
+					f"{future.exception()}")
+				job._future.set_exception(future.exception())
+				# retrieved here, so that a job nobody awaits does not log it;
+				# awaiting the job still raises it
+				job._future.exception()
+			else:
+				job.results[i] = future.result()
+				job.n_done += 1
+				self.stats["solved"] += 1
+				job._emit("progress", index=i,
+					success=bool(job.results[i].success))
+				self._check_finished(job)
+		self._fill()
+		return
+
+	def _check_finished(self, job: Job) -> None:
+		# finished once nothing of the job is running or left to start
+		if job.n_running or (job.state in Job.TERMINAL):
+			return
+		if job.cancel_requested or (job.n_done == job.total):
+			self._finish(job)
+		return
+
+	def _finish(self, job: Job) -> None:
+		job.state = "cancelled" if job.cancel_requested \
+			and (job.n_done < job.total) else "done"
+		job._emit(job.state)
+		job._future.set_result(job.results)
+		self.stats[job.state] += 1
+		return
+
+
+# worker state, per process
+_worker_models = ModelCache(max_models=4)
+
+
+def _solve_scenario(scenario: Scenario) -> scipy.optimize.OptimizeResult:
+	calculator, lock = _worker_models.get_calculator(scenario)
+	with lock:
+		res = scenario.calculate(calculator, exit_on_failure=False)
+	# only what pickles small and safely
+	ret = scipy.optimize.OptimizeResult(
+		x=res.x,
+		fun=res.fun,
+		success=bool(res.success),
+		status=int(res.status),
+		message=str(res.message),
+		nit=res.get("nit", 0),
+	)
+	return ret
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+import dataclasses
+from typing import Self, Sequence
+
+import numpy
+import pandas
+import scipy.optimize
+import scipy.sparse
+
+# highspy is optional, it enables warm-started re-solves
+try:
+	import highspy
+except ImportError:
+	highspy = None
+
+
+def normalize_bounds(bounds, n: int) -> numpy.ndarray:
+	# convert linprog-style bounds into a n x 2 float array
+	# None means (0, inf), None in a pair means unbounded on that side
+	if bounds is None:
+		bounds = (0, None)
+	arr = numpy.array(bounds, dtype=object)
+	if arr.ndim == 1:
+		arr = numpy.tile(arr, (n, 1))
+	if arr.shape != (n, 2):
+		raise ValueError(f"bounds must be a pair or {n} pairs")
+	lower = numpy.array([-numpy.inf if v is None else v for v in arr[:, 0]],
+		dtype=float)
+	upper = numpy.array([numpy.inf if v is None else v for v in arr[:, 1]],
+		dtype=float)
+	return numpy.column_stack([lower, upper])
+
+
+@dataclasses.dataclass
+class LinearProgram(object):
+	# minimize c @ x
+	# s.t. row_lower <= A @ x <= row_upper
+	#      col_lower <= x <= col_upper
+	# equality rows have row_lower == row_upper, unbounded sides are +/-inf
+	# names are optional labels of columns and rows
+	c: numpy.ndarray
+	A: scipy.sparse.csr_array
+	row_lower: numpy.ndarray
+	row_upper: numpy.ndarray
+	col_lower: numpy.ndarray
+	col_upper: numpy.ndarray
+	col_names: pandas.Index = None
+	row_names: pandas.Index = None
+
+	@property
+	def n_cols(self) -> int:
+		return self.A.shape[1]
+
+	@property
+	def n_rows(self) -> int:
+		return self.A.shape[0]
+
+	@property
+	def is_eq_row(self) -> numpy.ndarray:
+		return self.row_lower == self.row_upper
+
+	@property
+	def bounds(self) -> numpy.ndarray:
+		return numpy.column_stack([self.col_lower, self.col_upper])
+
+	def copy(self) -> Self:
+		# vectors are copied, the matrix is shared
+		ret = dataclasses.replace(self,
+			c=self.c.copy(),
+			row_lower=self.row_lower.copy(),
+			row_upper=self.row_upper.copy(),
+			col_lower=self.col_lower.copy(),
+			col_upper=self.col_upper.copy(),
+		)
+		return ret
+
+	@classmethod
+	def from_linprog_args(cls, c, A_ub=None, b_ub=None, A_eq=None, b_eq=None,
+		bounds=None, *, col_names: Sequence[str] = None,
+		ub_names: Sequence[str] = None, eq_names: Sequence[str] = None,
+	) -> Self:
+		# stack linprog-style arguments into a single ranged-row problem,
+		# _ub rows first, then _eq rows
+		c = numpy.asarray(c, dtype=float)
+		n = len(c)
+		blocks, lower, upper, names = list(), list(), list(), list()
+		for A, b, is_eq, row_names, prefix in [(A_ub, b_ub, False, ub_names, "ub"),
+			(A_eq, b_eq, True, eq_names, "eq"),
+		]:
+			if A is None:
+				continue
+			A = scipy.sparse.csr_array(A, shape=(len(b), n))
+			b = numpy.asarray(b, dtype=float)
+			blocks.append(A)
+			upper.append(b)
+			lower.append(b if is_eq else numpy.full(len(b), -numpy.inf))
+			if row_names is None:
+				row_names = [f"{prefix}{i}" for i in range(len(b))]
+			names.extend(row_names)
+		if blocks:
+			A = scipy.sparse.csr_array(scipy.sparse.vstack(blocks))
+		else:
+			A = scipy.sparse.csr_array((0, n))
+		bounds = normalize_bounds(bounds, n)
+		ret = cls(c=c, A=A,
+			row_lower=numpy.concatenate(lower) if lower else numpy.zeros(0),
+			row_upper=numpy.concatenate(upper) if upper else numpy.zeros(0),
+			col_lower=bounds[:, 0].copy(),
+			col_upper=bounds[:, 1].copy(),
+			col_names=pandas.Index(col_names if col_names is not None
+				else [f"x{i}" for i in range(n)]),
+			row_names=pandas.Index(names),
+		)
+		return ret
+
+	def to_linprog_args(self) -> dict:
+		# split back into linprog-style arguments
+		# ranged rows with both sides finite are split into two _ub rows
+		is_eq = self.is_eq_row
+		has_upper = (~is_eq) & numpy.isfinite(self.row_upper)
+		has_lower = (~is_eq) & numpy.isfinite(self.row_lower)
+		A_ub = scipy.sparse.vstack([self.A[has_upper], -self.A[has_lower]])
+		b_ub = numpy.concatenate([self.row_upper[has_upper],
+			-self.row_lower[has_lower]])
+		ret = dict(c=self.c,
+			A_ub=scipy.sparse.csr_array(A_ub) if len(b_ub) else None,
+			b_ub=b_ub if len(b_ub) else None,
+			A_eq=self.A[is_eq] if is_eq.any() else None,
+			b_eq=self.row_upper[is_eq] if is_eq.any() else None,
+			bounds=self.bounds,
+		)
+		return ret
+
+
+class LinearProgramSolver(object):
+	# keeps a LinearProgram loaded in the solver, so that re-solves after
+	# changing the objective, row bounds or column bounds start from the
+	# previous basis (warm start)
+	# backend "highspy" is used when installed; "linprog" is the fallback and
+	# always solves from scratch
+	HIGHS_TO_SCIPY_STATUS = {
+		"kOptimal": 0,
+		"kTimeLimit": 1,
+		"kIterationLimit": 1,
+		"kInfeasible": 2,
+		"kModelError": 2,
+		"kUnbounded": 3,
+	}
+
+	def __init__(self, lp: LinearProgram, *, backend: str = None) -> None:
+		if backend is None:
+			backend = "linprog" if highspy is None else "highspy"
+		if backend not in ("highspy", "linprog"):
+			raise ValueError(f"unknown backend: {backend}")
+		if (backend == "highspy") and (highspy is None):
+			raise RuntimeError("backend 'highspy' requires highspy installed")
+		self.backend = backend
+		# own copy, kept in sync with the modifications
+		self.lp = lp.copy()
+		self._highs = None
+		if self.backend == "highspy":
+			self._load_highs()
+		return
+
+	def _load_highs(self) -> None:
+		lp = self.lp
+		h = highspy.Highs()
+		h.setOptionValue("output_flag", False)
+		h.addVars(lp.n_cols, self._finite(lp.col_lower),
+			self._finite(lp.col_upper))
+		h.changeColsCost(lp.n_cols, numpy.arange(lp.n_cols, dtype=numpy.int32),
+			lp.c)
+		A = lp.A
+		h.addRows(lp.n_rows, self._finite(lp.row_lower),
+			self._finite(lp.row_upper), A.nnz,
+			A.indptr[:-1].astype(numpy.int32), A.indices.astype(numpy.int32),
+			A.data.astype(float),
+		)
+		self._highs = h
+		return
+
+	@staticmethod
+	def _finite(v: numpy.ndarray) -> numpy.ndarray:
+		# highs uses its own infinity
+		return numpy.clip(numpy.asarray(v, dtype=float), -highspy.kHighsInf,
+			highspy.kHighsInf)
+
+	@staticmethod
+	def _as_index_array(index, n: int) -> numpy.ndarray:
+		# bool mask, int array or slice into an int32 index array
+		return numpy.arange(n, dtype=numpy.int32)[index].reshape(-1)
+
+	def set_objective(self, c: numpy.ndarray) -> None:
+		self.lp.c = numpy.asarray(c, dtype=float).copy()
+		if self._highs is not None:
+			self._highs.changeColsCost(self.lp.n_cols,
+				numpy.arange(self.lp.n_cols, dtype=numpy.int32), self.lp.c)
+		return
+
+	def set_row_bounds(self, index, lower, upper) -> None:
+		# index: rows to change, as int array, bool mask or slice
+		pos = self._as_index_array(index, self.lp.n_rows)
+		self.lp.row_lower[pos] = lower
+		self.lp.row_upper[pos] = upper
+		if (self._highs is not None) and len(pos):
+			self._highs.changeRowsBounds(len(pos), pos,
+				self._finite(self.lp.row_lower[pos]),
+				self._finite(self.lp.row_upper[pos]),
+			)
+		return
+
+	def set_col_bounds(self, index, lower, upper) -> None:
+		# index: columns to change, as int array, bool mask or slice
+		pos = self._as_index_array(index, self.lp.n_cols)
+		self.lp.col_lower[pos] = lower
+		self.lp.col_upper[pos] = upper
+		if (self._highs is not None) and len(pos):
+			self._highs.changeColsBounds(len(pos), pos,
+				self._finite(self.lp.col_lower[pos]),
+				self._finite(self.lp.col_upper[pos]),
+			)
+		return
+
+	def set_coefficients(self, rows, cols, values) -> None:
+		# change entries of A, e.g. scaled yields; rows, cols: int arrays of
+		# the same length, values: broadcast to it
+		rows = numpy.asarray(rows, dtype=int).reshape(-1)
+		cols = numpy.asarray(cols, dtype=int).reshape(-1)
+		values = numpy.broadcast_to(numpy.asarray(values, dtype=float),
+			rows.shape).copy()
+		if rows.shape != cols.shape:
+			raise ValueError("rows and cols must have the same length")
+		# the matrix may be shared with the original problem
+		A = self.lp.A.copy()
+		A[rows, cols] = values
+		self.lp.A = scipy.sparse.csr_array(A)
+		if self._highs is not None:
+			for row, col, value in zip(rows.tolist(), cols.tolist(),
+				values.tolist()):
+				self._highs.changeCoeff(row, col, value)
+		return
+
+	def add_rows(self, A, lower, upper, names: Sequence[str] = None,
+	) -> numpy.ndarray:
+		# append constraint rows, return their positions
+		# the current basis is extended, so the next solve still warm-starts
+		lp = self.lp
+		A = scipy.sparse.csr_array(A)
+		if A.shape[1] != lp.n_cols:
+			raise ValueError(f"rows must have {lp.n_cols} columns")
+		n = A.shape[0]
+		lower = numpy.broadcast_to(numpy.asarray(lower, dtype=float), n).copy()
+		upper = numpy.broadcast_to(numpy.asarray(upper, dtype=float), n).copy()
+		ret = numpy.arange(lp.n_rows, lp.n_rows + n)
+		if names is None:
+			names = [f"r{i}" for i in ret]
+		lp.A = scipy.sparse.csr_array(scipy.sparse.vstack([lp.A, A]))
+		lp.row_lower = numpy.concatenate([lp.row_lower, lower])
+		lp.row_upper = numpy.concatenate([lp.row_upper, upper])
+		if lp.row_names is not None:
+			lp.row_names = lp.row_names.append(pandas.Index(names))
+		if (self._highs is not None) and n:
+			self._highs.addRows(n, self._finite(lower), self._finite(upper),
+				A.nnz, A.indptr[:-1].astype(numpy.int32),
+				A.indices.astype(numpy.int32), A.data.astype(float),
+			)
+		return ret
+
+	def add_cols(self, A, c, lower, upper, names: Sequence[str] = None,
+	) -> numpy.ndarray:
+		# append columns (variables), return their positions
+		# A: the new columns, as a n_rows x k matrix
+		# new columns enter the basis as nonbasic, so the next solve still
+		# warm-starts
+		lp = self.lp
+		A = scipy.sparse.csc_array(A)
+		if A.shape[0] != lp.n_rows:
+			raise ValueError(f"columns must have {lp.n_rows} rows")
+		n = A.shape[1]
+		c = numpy.broadcast_to(numpy.asarray(c, dtype=float), n).copy()
+		lower = numpy.broadcast_to(numpy.asarray(lower, dtype=float), n).copy()
+		upper = numpy.broadcast_to(numpy.asarray(upper, dtype=float), n).copy()
+		ret = numpy.arange(lp.n_cols, lp.n_cols + n)
+		if names is None:
+			names = [f"x{i}" for i in ret]
+		lp.A = scipy.sparse.csr_array(scipy.sparse.hstack([lp.A, A]))
+		lp.c = numpy.concatenate([lp.c, c])
+		lp.col_lower = numpy.concatenate([lp.col_lower, lower])
+		lp.col_upper = numpy.concatenate([lp.col_upper, upper])
+		if lp.col_names is not None:
+			lp.col_names = lp.col_names.append(pandas.Index(names))
+		if (self._highs is not None) and n:
+			self._highs.addCols(n, c, self._finite(lower), self._finite(upper),
+				A.nnz, A.indptr[:-1].astype(numpy.int32),
+				A.indices.astype(numpy.int32), A.data.astype(float),
+			)
+		return ret
+
+	def solve(self) -> scipy.optimize.OptimizeResult:
+		if self._highs is None:
+			ret = scipy.optimize.linprog(**self.lp.to_linprog_args(),
+				method="highs")
+			ret = self._split_linprog_result(ret)
+		else:
+			ret = self._solve_highs()
+		return ret
+
+	def _split_linprog_result(self, res: scipy.optimize.OptimizeResult,
+	) -> scipy.optimize.OptimizeResult:
+		# linprog reports _ub/_eq marginals, map them back onto ranged rows
+		res.row_marginals = None
+		if res.get("ineqlin") is not None and res.ineqlin.marginals is not None:
+			lp = self.lp
+			is_eq = lp.is_eq_row
+			has_upper = (~is_eq) & numpy.isfinite(lp.row_upper)
+			has_lower = (~is_eq) & numpy.isfinite(lp.row_lower)
+			marginals = numpy.zeros(lp.n_rows)
+			n_upper = has_upper.sum()
+			marginals[has_upper] += res.ineqlin.marginals[:n_upper]
+			marginals[has_lower] -= res.ineqlin.marginals[n_upper:]
+			if is_eq.any():
+				marginals[is_eq] = res.eqlin.marginals
+			res.row_marginals = marginals
+		res.reduced_costs = None
+		if res.get("lower") is not None and res.lower.marginals is not None:
+			res.reduced_costs = res.lower.marginals + res.upper.marginals
+		return res
+
+	def _solve_highs(self) -> scipy.optimize.OptimizeResult:
+		h = self._highs
+		h.run()
+		model_status = h.getModelStatus()
+		status = self.HIGHS_TO_SCIPY_STATUS.get(model_status.name, 4)
+		info = h.getInfo()
+		ret = scipy.optimize.OptimizeResult(
+			status=status,
+			success=(status == 0),
+			message=h.modelStatusToString(model_status),
+			nit=info.simplex_iteration_count,
+			x=None, fun=None, row_marginals=None, reduced_costs=None,
+		)
+		if status != 0:
+			return ret
+		solution = h.getSolution()
+		basis = h.getBasis()
+		lp = self.lp
+		x = numpy.array(solution.col_value)
+		row_value = numpy.array(solution.row_value)
+		row_dual = numpy.array(solution.row_dual)
+		col_dual = numpy.array(solution.col_dual)
+		# bound marginals follow the column basis status, same as linprog
+		col_status = numpy.array([int(s) for s in basis.col_status])
+		marg_lower = numpy.where(
+			col_status == int(highspy.HighsBasisStatus.kLower), col_dual, 0.0)
+		marg_upper = numpy.where(
+			col_status == int(highspy.HighsBasisStatus.kUpper), col_dual, 0.0)
+		ret.update(
+			x=x,
+			fun=info.objective_function_value,
+			row_value=row_value,
+			row_marginals=row_dual,
+			reduced_costs=col_dual,
+			lower=scipy.optimize.OptimizeResult(residual=x - lp.col_lower,
+				marginals=marg_lower),
+			upper=scipy.optimize.OptimizeResult(residual=lp.col_upper - x,
+				marginals=marg_upper),
+		)
+		return ret
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import dataclasses
+
+import numpy
+import scipy.sparse
+
+from . import config
+from .recipe_matrix import RecipeMatrix
+
+
+@dataclasses.dataclass
+class LogisticsLimits(object):
+	# belt and pipe throughput of the factory, as the best tier (Mk) in use
+	# each item of a machine, input or output, has its own belt or pipe; a
+	# variant whose per-machine flow of any item exceeds that cannot be built
+	# resource nodes (ResourceNode-* proxies) extract at most what their
+	# output belt or pipe carries, if limit_node_extraction
+	# resource wells are not limited, their satellites have one pipe each
+	belt_tier: int = 6
+	pipe_tier: int = 2
+	limit_node_extraction: bool = True
+
+	def __post_init__(self) -> None:
+		if self.belt_tier not in config.BELT_THROUGHPUT:
+			raise ValueError(f"unknown belt tier: {self.belt_tier}, expected "
+				f"one of {list(config.BELT_THROUGHPUT)}")
+		if self.pipe_tier not in config.PIPE_THROUGHPUT:
+			raise ValueError(f"unknown pipe tier: {self.pipe_tier}, expected "
+				f"one of {list(config.PIPE_THROUGHPUT)}")
+		return
+
+	def get_item_throughput(self, recipe_matrix: RecipeMatrix) -> numpy.ndarray:
+		# throughput of each item of the flow matrix, in its units (items/s,
+		# or 1000x for fluids)
+		items = recipe_matrix.recipe_dataset.items
+		belt = config.BELT_THROUGHPUT[self.belt_tier]
+		pipe = config.PIPE_THROUGHPUT[self.pipe_tier]
+		ret = numpy.array([(pipe * 1000 if items[i].is_fluid else belt) / 60
+			for i in recipe_matrix.item_index], dtype=float)
+		return ret
+
+	def get_load(self, recipe_matrix: RecipeMatrix) -> numpy.ndarray:
+		# the largest per-machine item flow of each variant, relative to its
+		# throughput; above 1, the variant runs over its belt or pipe
+		throughput = self.get_item_throughput(recipe_matrix)
+		flow = abs(recipe_matrix.flow_matrix) \
+			@ scipy.sparse.diags_array(1 / throughput)
+		ret = scipy.sparse.csr_array(flow).max(axis=1).toarray().reshape(-1)
+		return ret
+
+	def get_upper_bounds(self, recipe_matrix: RecipeMatrix,
+		upper: numpy.ndarray = None, *, load: numpy.ndarray = None,
+	) -> numpy.ndarray:
+		# the variant upper bounds under these limits: 0 for variants that
+		# cannot be built, the node count scaled down to the throughput for
+		# resource nodes, unchanged for the others
+		# upper: the bounds to limit, default the global limits
+		# load: as .get_load(), e.g. cached by the caller
+		if upper is None:
+			upper = recipe_matrix.global_limit.to_numpy(dtype=float)
+		if load is None:
+			load = self.get_load(recipe_matrix)
+		ret = numpy.array(upper, dtype=float)
+		over = load > 1 + 1e-9
+		nodes = recipe_matrix.row_metadata.is_resource_proxy \
+			& numpy.char.startswith(recipe_matrix.row_metadata.recipe,
+				"ResourceNode-")
+		wells = recipe_matrix.row_metadata.is_resource_proxy \
+			& numpy.char.startswith(recipe_matrix.row_metadata.recipe,
+				"ResourceWell-")
+		ret[over & ~nodes & ~wells] = 0
+		if self.limit_node_extraction:
+			ret[over & nodes] = ret[over & nodes] / load[over & nodes]
+		return ret
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import re
+
+import numpy
+import pandas
+
+from .linear_program import LinearProgram
+
+
+class LinearProgramFile(object):
+	# read/write a LinearProgram in the file formats of external solvers:
+	#   "mps": free-format MPS
+	#   "lp": CPLEX-LP
+	# and read their solution files back
+	# names are sanitized for both formats (e.g. "/" and "-" in variant labels
+	# become "_"), made unique over rows and columns together; the original
+	# names are kept in .col_names/.row_names, aligned with the sanitized
+	# .file_col_names/.file_row_names
+	# rows without a finite bound are not written; in the LP format, ranged
+	# rows are written as two rows, "<name>" (<= upper) and "<name>_lo"
+	# (>= lower)
+	FORMATS = ("mps", "lp")
+	OBJECTIVE_NAME = "obj"
+	MAX_NAME_LENGTH = 200
+	# terms per line in the LP format, lines are limited to 560 characters
+	TERMS_PER_LINE = 4
+
+	def __init__(self, lp: LinearProgram, *, name: str = "SATISFACTORY",
+	) -> None:
+		self.lp = lp
+		self.name = name
+		self.col_names = lp.col_names if lp.col_names is not None \
+			else pandas.Index([f"x{i}" for i in range(lp.n_cols)])
+		self.row_names = lp.row_names if lp.row_names is not None \
+			else pandas.Index([f"r{i}" for i in range(lp.n_rows)])
+		names = self.sanitize_names([self.OBJECTIVE_NAME]
+			+ list(self.col_names) + list(self.row_names))
+		self.file_col_names = names[1:lp.n_cols + 1]
+		self.file_row_names = names[lp.n_cols + 1:]
+		return
+
+	@classmethod
+	def sanitize_names(cls, names: list[str]) -> list[str]:
+		# only letters, digits, "_" and "."; not starting with a digit, "." or
+		# an exponent-like "e1"; unique
+		ret = list()
+		used = set()
+		for name in names:
+			s = re.sub(r"[^A-Za-z0-9_.]", "_", str(name))[:cls.MAX_NAME_LENGTH]
+			if (not s) or re.match(r"[0-9.]|[eE][0-9.+-]", s):
+				s = "_" + s
+			unique, n = s, 0
+			while unique.lower() in used:
+				n += 1
+				unique = f"{s}_{n}"
+			used.add(unique.lower())
+			ret.append(unique)
+		return ret
+
+	@staticmethod
+	def _num(value: float) -> str:
+		# shortest repr that round-trips
+		ret = repr(float(value))
+		return ret
+
+	@classmethod
+	def get_format(cls, fname: str, fmt: str = None) -> str:
+		if fmt is None:
+			fmt = os.path.splitext(fname)[1].lstrip(".").lower()
+		if fmt not in cls.FORMATS:
+			raise ValueError(f"unknown lp file format: '{fmt}', expected one "
+				f"of {cls.FORMATS}")
+		return fmt
+
+	def write(self, fname: str, fmt: str = None) -> None:
+		# fmt: "mps" or "lp", by default from the file extension
+		fmt = self.get_format(fname, fmt)
+		with open(fname, "w") as fp:
+			if fmt == "mps":
+				self.write_mps(fp)
+			else:
+				self.write_cplex_lp(fp)
+		return
+
+	def _row_senses(self) -> numpy.ndarray:
+		# E, L, G, R (ranged) or N (free) of each row
+		lp = self.lp
+		has_lower = numpy.isfinite(lp.row_lower)
+		has_upper = numpy.isfinite(lp.row_upper)
+		ret = numpy.full(lp.n_rows, "N")
+		ret[has_upper] = "L"
+		ret[has_lower] = "G"
+		ret[has_lower & has_upper] = "R"
+		ret[lp.is_eq_row] = "E"
+		return ret
+
+	def write_mps(self, fp: io.TextIOBase) -> None:
+		# columns are streamed from the column-major matrix, one entry per
+		# line
+		lp = self.lp
+		senses = self._row_senses()
+		written = senses != "N"
+		print(f"NAME {self.name}", file=fp)
+		print("ROWS", file=fp)
+		print(f" N {self.OBJECTIVE_NAME}", file=fp)
+		for i in numpy.flatnonzero(written):
+			print(f" {'L' if senses[i] == 'R' else senses[i]} "
+				f"{self.file_row_names[i]}", file=fp)
+		print("COLUMNS", file=fp)
+		A = lp.A.tocsc()
+		for j in range(lp.n_cols):
+			name = self.file_col_names[j]
+			# always written, so that empty columns are declared
+			print(f" {name} {self.OBJECTIVE_NAME} {self._num(lp.c[j])}", file=fp)
+			for k in range(A.indptr[j], A.indptr[j + 1]):
+				i = A.indices[k]
+				if written[i] and A.data[k] != 0:
+					print(f" {name} {self.file_row_names[i]} "
+						f"{self._num(A.data[k])}", file=fp)
+		print("RHS", file=fp)
+		for i in numpy.flatnonzero(written):
+			rhs = lp.row_lower[i] if senses[i] == "G" else lp.row_upper[i]
+			if rhs != 0:
+				print(f" RHS {self.file_row_names[i]} {self._num(rhs)}", file=fp)
+		if (senses == "R").any():
+			# L row with range R: rhs - R <= row <= rhs
+			print("RANGES", file=fp)
+			for i in numpy.flatnonzero(senses == "R"):
+				print(f" RNG {self.file_row_names[i]} "
+					f"{self._num(lp.row_upper[i] - lp.row_lower[i])}", file=fp)
+		print("BOUNDS", file=fp)
+		for j in range(lp.n_cols):
+			name = self.file_col_names[j]
+			lower, upper = lp.col_lower[j], lp.col_upper[j]
+			if lower == upper:
+				print(f" FX BND {name} {self._num(lower)}", file=fp)
+				continue
+			if numpy.isinf(lower) and numpy.isinf(upper):
+				print(f" FR BND {name}", file=fp)
+				continue
+			if numpy.isinf(lower):
+				print(f" MI BND {name}", file=fp)
+			elif lower != 0:
+				print(f" LO BND {name} {self._num(lower)}", file=fp)
+			if numpy.isfinite(upper):
+				print(f" UP BND {name} {self._num(upper)}", file=fp)
+		print("ENDATA", file=fp)
+		return
+
+	def _write_lp_expr(self, fp: io.TextIOBase, prefix: str,
+		cols: numpy.ndarray, values: numpy.ndarray, suffix: str,
+	) -> None:
+		# one expression, wrapped every TERMS_PER_LINE terms
+		terms = [f"{'-' if v < 0 else '+'} {self._num(abs(v))} "
+			f"{self.file_col_names[j]}" for j, v in zip(cols, values) if v != 0]
+		if not terms:
+			# an empty expression is not valid
+			terms = [f"0 {self.file_col_names[0]}"]
+		lines = [(" ").join(terms[k:k + self.TERMS_PER_LINE])
+			for k in range(0, len(terms), self.TERMS_PER_LINE)]
+		print(f" {prefix}: " + ("\n   ").join(lines) + suffix, file=fp)
+		return
+
+	def write_cplex_lp(self, fp: io.TextIOBase) -> None:
+		# rows are streamed from the row-major matrix
+		lp = self.lp
+		senses = self._row_senses()
+		print(f"\\ Problem: {self.name}", file=fp)
+		print("Minimize", file=fp)
+		nz = numpy.flatnonzero(lp.c)
+		self._write_lp_expr(fp, self.OBJECTIVE_NAME, nz, lp.c[nz], "")
+		print("Subject To", file=fp)
+		A = lp.A.tocsr()
+		lo_names = None
+		if (senses == "R").any():
+			lo_names = dict(zip(numpy.flatnonzero(senses == "R"),
+				self.sanitize_names(list(self.file_col_names)
+					+ list(self.file_row_names)
+					+ [f"{self.file_row_names[i]}_lo"
+						for i in numpy.flatnonzero(senses == "R")]
+				)[lp.n_cols + lp.n_rows:]))
+		for i in range(lp.n_rows):
+			if senses[i] == "N":
+				continue
+			cols = A.indices[A.indptr[i]:A.indptr[i + 1]]
+			values = A.data[A.indptr[i]:A.indptr[i + 1]]
+			name = self.file_row_names[i]
+			if senses[i] == "E":
+				suffix = f" = {self._num(lp.row_upper[i])}"
+			elif senses[i] == "G":
+				suffix = f" >= {self._num(lp.row_lower[i])}"
+			else:
+				suffix = f" <= {self._num(lp.row_upper[i])}"
+			self._write_lp_expr(fp, name, cols, values, suffix)
+			if senses[i] == "R":
+				self._write_lp_expr(fp, lo_names[i], cols, values,
+					f" >= {self._num(lp.row_lower[i])}")
+		print("Bounds", file=fp)
+		for j in range(lp.n_cols):
+			name = self.file_col_names[j]
+			lower, upper = lp.col_lower[j], lp.col_upper[j]
+			if lower == upper:
+				print(f" {name} = {self._num(lower)}", file=fp)
+			elif numpy.isinf(lower) and numpy.isinf(upper):
+				print(f" {name} free", file=fp)
+			elif numpy.isinf(lower):
+				print(f" -inf <= {name} <= {self._num(upper)}", file=fp)
+			elif numpy.isfinite(upper):
+				print(f" {self._num(lower)} <= {name} <= {self._num(upper)}",
+					file=fp)
+			elif lower != 0:
+				print(f" {name} >= {self._num(lower)}", file=fp)
+		print("End", file=fp)
+		return
+
+	def read_solution(self, fname: str) -> pandas.Series:
+		# primal values of the columns from a solution file, indexed by the
+		# original column names; columns absent from the file are 0
+		# line-based formats with "<name> <value>" somewhere on a line are
+		# accepted, e.g. the solution files of HiGHS, CBC, Gurobi and SCIP;
+		# dual sections (e.g. "# Dual solution values" of HiGHS) are skipped
+		positions = {name: j for j, name in enumerate(self.file_col_names)}
+		values = numpy.zeros(self.lp.n_cols)
+		found = 0
+		with open(fname, "r") as fp:
+			for line in fp:
+				if line.lstrip("#").strip().lower().startswith("dual"):
+					break
+				tokens = line.split()
+				for k, token in enumerate(tokens[:-1]):
+					if token not in positions:
+						continue
+					try:
+						values[positions[token]] = float(tokens[k + 1])
+					except ValueError:
+						continue
+					found += 1
+					break
+		if (not found) and self.lp.n_cols:
+			raise ValueError(f"no column values found in '{fname}'")
+		ret = pandas.Series(values, index=self.col_names)
+		return ret
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import scipy.optimize
+
+from .linear_program import LinearProgramSolver
+from .production_calculator import ProductionCalculator
+from .recipe_matrix import RecipeMatrix
+from .what_if_session import WhatIfSession
+
+
+class ObjectiveCalculator(ProductionCalculator):
+	# maximize (or minimize) a column of the recipe matrix, e.g. raw_power or
+	# points_gain_rate, under the default constraints
+	# this generalizes the calculators in the calc.* scripts:
+	#   waste_free=True: non-sinkable items are forced to be net zero,
+	#     plus extra_eq_items (e.g. Desc_PlutoniumFuelRod_C to disallow
+	#     sinking plutonium fuel rods)
+	#   waste_free=False: all items may have surplus
+	# the problem is compiled once, re-solves after changes warm-start from
+	# the previous basis
+	def __init__(self, recipe_matrix: RecipeMatrix, *,
+		objective: str = "raw_power",
+		maximize: bool = True,
+		waste_free: bool = True,
+		extra_eq_items: list[str] = (),
+		**kw,
+	) -> None:
+		super().__init__(recipe_matrix, **kw)
+		self.objective = objective
+		self.maximize = maximize
+		self.waste_free = waste_free
+		self.extra_eq_items = list(extra_eq_items)
+		self._solver: LinearProgramSolver = None
+		return
+
+	def get_eq_items(self) -> list[str]:
+		if self.waste_free:
+			ret = self.get_default_net_zero_item_list()
+			ret.extend(i for i in self.extra_eq_items if i not in ret)
+		else:
+			ret = list()
+		return ret
+
+	@property
+	def solver(self) -> LinearProgramSolver:
+		if self._solver is None:
+			lp = self.get_linear_program(self.objective, maximize=self.maximize,
+				eq_items=self.get_eq_items())
+			self._solver = LinearProgramSolver(lp)
+		return self._solver
+
+	def calculate(self, *, exit_on_failure: bool = True,
+	) -> scipy.optimize.OptimizeResult:
+		res = self.solver.solve()
+		self._accept_result(res, exit_on_failure=exit_on_failure,
+			lp=self.solver.lp)
+		return res
+
+	def _update_apa_counts(self) -> None:
+		if self._solver is None:
+			return
+		self.update_solver_apa_counts(self._solver)
+		objective = self.recipe_matrix.get_column(self.objective)
+		self._solver.set_objective(-objective if self.maximize else objective)
+		return
+
+	def new_what_if_session(self) -> WhatIfSession:
+		# an incremental what-if session on the same objective and items
+		ret = WhatIfSession(self, objective=self.objective,
+			maximize=self.maximize, eq_items=self.get_eq_items())
+		return ret
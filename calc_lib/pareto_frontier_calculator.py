@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import io
+import sys
+
+import numpy
+import scipy.optimize
+import scipy.sparse
+
+from . import util
+from .objective_calculator import ObjectiveCalculator
+from .recipe_matrix import RecipeMatrix
+
+
+@dataclasses.dataclass
+class ParetoPoint(object):
+	# a breakpoint of the frontier
+	values: tuple[float, float]  # objective values
+	weights: tuple[float, float]  # objective weights that found this point
+	result: scipy.optimize.OptimizeResult
+
+	@property
+	def x(self) -> numpy.ndarray:
+		return self.result.x
+
+
+class ParetoFrontierCalculator(ObjectiveCalculator):
+	# trace the exact pareto frontier of maximizing two columns, by default
+	# raw_power and points_gain_rate, under the same constraints as
+	# ObjectiveCalculator
+	# the frontier of a bi-objective lp is piecewise linear; its breakpoints
+	# are found by weighted-sum solves, each weight vector being the normal of
+	# the segment between two known breakpoints (non-inferior set estimation)
+	# a segment is final once its weighted solve finds no point beyond it
+	# all solves share one solver, only the objective changes, so that each
+	# solve warm-starts from the previous basis
+	# relative loss of the first objective allowed in lexicographic solves
+	LEXICOGRAPHIC_SLACK = 1e-9
+
+	def __init__(self, recipe_matrix: RecipeMatrix, *,
+		objectives: tuple[str, str] = ("raw_power", "points_gain_rate"),
+		tol: float = 1e-7,
+		**kw,
+	) -> None:
+		if len(objectives) != 2:
+			raise ValueError("exactly two objectives are required")
+		super().__init__(recipe_matrix, objective=objectives[0], maximize=True,
+			**kw)
+		self.objectives = tuple(objectives)
+		self.tol = tol
+		# objective columns, as a 2 x n array
+		self._columns: numpy.ndarray = None
+		# rows bounding each objective from below, for lexicographic solves
+		self._floor_rows: numpy.ndarray = None
+		self.frontier: list[ParetoPoint] = None
+		return
+
+	def _prepare(self) -> None:
+		if self._columns is not None:
+			return
+		self._columns = numpy.vstack([self.recipe_matrix.get_column(o)
+			for o in self.objectives])
+		self._floor_rows = self.solver.add_rows(
+			scipy.sparse.csr_array(self._columns), -numpy.inf, numpy.inf,
+			names=[f"floor/{o}" for o in self.objectives])
+		return
+
+	def _solve_weighted(self, weights: numpy.ndarray,
+	) -> scipy.optimize.OptimizeResult:
+		self.solver.set_objective(-(weights @ self._columns))
+		return self.solver.solve()
+
+	def _solve_extreme(self, primary: int) -> ParetoPoint | None:
+		# maximize one objective, then the other without losing the first
+		weights = numpy.zeros(2)
+		weights[primary] = 1.0
+		res = self._solve_weighted(weights)
+		if not res.success:
+			return None
+		best = self._columns[primary] @ res.x
+		row = self._floor_rows[primary]
+		self.solver.set_row_bounds([row],
+			best - self.LEXICOGRAPHIC_SLACK * max(abs(best), 1.0), numpy.inf)
+		res = self._solve_weighted(1.0 - weights)
+		self.solver.set_row_bounds([row], -numpy.inf, numpy.inf)
+		if not res.success:
+			return None
+		ret = ParetoPoint(values=tuple(self._columns @ res.x),
+			weights=tuple(weights), result=res)
+		return ret
+
+	def _update_apa_counts(self) -> None:
+		super()._update_apa_counts()
+		if self._columns is None:
+			return
+		# the floor rows are objective columns, e.g. raw_power
+		columns = numpy.vstack([self.recipe_matrix.get_column(o)
+			for o in self.objectives])
+		rows, cols = numpy.nonzero(columns != self._columns)
+		self.solver.set_coefficients(self._floor_rows[rows], cols,
+			columns[rows, cols])
+		self._columns = columns
+		return
+
+	def calculate(self, *, max_breakpoints: int = None,
+		exit_on_failure: bool = True,
+	) -> list[ParetoPoint]:
+		# return breakpoints in decreasing order of the first objective
+		# max_breakpoints: stop refining once this many points are found
+		self._prepare()
+		left = self._solve_extreme(0)
+		right = self._solve_extreme(1)
+		if (left is None) or (right is None):
+			res = self.solver.solve()
+			self._accept_result(res, exit_on_failure=exit_on_failure,
+				lp=self.solver.lp)
+			self.frontier = list()
+			return self.frontier
+		points = [left]
+		if not numpy.allclose(left.values, right.values, rtol=self.tol):
+			points.append(right)
+		# refine segments between adjacent points, depth-first
+		pending = [(0, 1)] if len(points) == 2 else list()
+		while pending:
+			i, j = pending.pop()
+			a, b = points[i], points[j]
+			if (max_breakpoints is not None) and (len(points) >= max_breakpoints):
+				break
+			# normal of segment a-b, both components positive
+			weights = numpy.array([b.values[1] - a.values[1],
+				a.values[0] - b.values[0]])
+			weights /= weights.sum()
+			res = self._solve_weighted(weights)
+			if not res.success:
+				continue
+			values = self._columns @ res.x
+			on_segment = weights @ numpy.asarray(a.values)
+			if weights @ values <= on_segment + self.tol * max(abs(on_segment), 1.0):
+				continue  # a-b is a frontier segment
+			points.append(ParetoPoint(values=tuple(values),
+				weights=tuple(weights), result=res))
+			k = len(points) - 1
+			pending.extend([(k, j), (i, k)])
+		ret = sorted(points, key=lambda p: p.values[0], reverse=True)
+		self.frontier = ret
+		self._accept_result(ret[0].result, exit_on_failure=exit_on_failure,
+			lp=self.solver.lp)
+		return ret
+
+	def select(self, index: int) -> ParetoPoint:
+		# make a breakpoint the current result, e.g. for .report()
+		ret = self.frontier[index]
+		self._accept_result(ret.result)
+		return ret
+
+	def report_frontier(self, fp: io.TextIOBase = None) -> None:
+		if fp is None:
+			fp = sys.stdout
+		print(">> Pareto frontier", file=fp)
+		print("=" * 80, file=fp)
+		print(("\t").join(["Breakpoint", *self.objectives]), file=fp)
+		print("-" * 80, file=fp)
+		for i, point in enumerate(self.frontier):
+			print(("\t").join([str(i)] + [util.simplify_decimal(v, decimal=3)
+				for v in point.values]), file=fp)
+		print("=" * 80, file=fp)
+		return
@@ -1,21 +1,38 @@
 #!/usr/bin/env python3
 
 import functools
+import inspect
 import io
-import pdb
 import sys
 from typing import Self
 
+import numpy
 import scipy.optimize  # linprog
 import pandas
 
 from . import util
 from . import config
+from .constraint_builder import ConstraintBuilder
 from .elements import ClockSpeed
+from .flow_decomposition import FlowDecomposition
+from .infeasibility_diagnoser import InfeasibilityDiagnoser, InfeasibleSubsystem
+from .linear_program import LinearProgram, LinearProgramSolver
+from .logistics import LogisticsLimits
+from .lp_file import LinearProgramFile
 from .recipe_matrix import RecipeMatrix
 
 
 class ProductionCalculator(object):
+	# columns of the tables of .get_report_tables()
+	REPORT_TABLE_COLUMNS = {
+		"recipes": ["recipe", "building", "machines", "somersloop", "power",
+			"ingredients", "products"],
+		"summary": ["somersloop_amplification", "somersloop_apa",
+			"apa_power_boost", "net_power", "raw_power", "sinkpoints"],
+		"net_products": ["item", "rate", "sinkpoints"],
+		"resources": ["item", "consumption", "utilized"],
+	}
+
 	@classmethod
 	def from_recipe_dataset_json(cls, fname: str, *,
 		production_clock_speed: int = ClockSpeed(250),
@@ -24,7 +41,9 @@ class ProductionCalculator(object):
 		enable_somersloop_amplification: bool = False,
 		unfueled_apa_count: int = 0,
 		fueled_apa_count: int = 0,
+		**kw,
 	) -> Self:
+		# kw: passed to the constructor, e.g. for subclass options
 		recipe_matrix = RecipeMatrix.from_curated_recipe_dataset_json(fname,
 			production_clock_speed=production_clock_speed,
 			resource_extraction_clock_speed=resource_extraction_clock_speed,
@@ -35,6 +54,7 @@ class ProductionCalculator(object):
 			enable_somersloop_amplification=enable_somersloop_amplification,
 			unfueled_apa_count=unfueled_apa_count,
 			fueled_apa_count=fueled_apa_count,
+			**kw,
 		)
 		return ret
 
@@ -43,19 +63,25 @@ class ProductionCalculator(object):
 		enable_somersloop_amplification: bool = False,
 		unfueled_apa_count: int = 0,
 		fueled_apa_count: int = 0,
+		logistics: LogisticsLimits = None,
 	) -> None:
 		self.recipe_matrix = recipe_matrix
 		# the results of the last calculation
 		self._result = None
+		# the problem of the last calculation, either a LinearProgram or the
+		# bound arguments of a linprog call
+		self._last_problem: LinearProgram | dict = None
+		# cached constraint assembly, reset when the coef matrix is changed
+		self._constraint_builder: ConstraintBuilder = None
 		self.enable_resource_conversion = enable_resource_conversion
 		self.enable_somersloop_amplification = enable_somersloop_amplification
+		self._check_apa_counts(unfueled_apa_count, fueled_apa_count)
 		self.unfueled_apa_count = unfueled_apa_count
 		self.fueled_apa_count = fueled_apa_count
-		if (self.unfueled_apa_count < 0) or (self.fueled_apa_count < 0):
-			raise ValueError("APA count must be non-negative")
-		if (self.fueled_apa_count + self.unfueled_apa_count) > 10:
-			raise ValueError("the total APA count must be at most 10")
 		self._update_recipe_matrix_power_boost()
+		# belt and pipe limits, as bounds by .apply_logistics_limits()
+		self.logistics = logistics
+		self._logistics_load: numpy.ndarray = None
 		return
 
 	@property
@@ -64,11 +90,70 @@ class ProductionCalculator(object):
 
 	@property
 	def total_apa_power_boost(self) -> float:
+		ret = self.get_apa_power_boost(self.unfueled_apa_count,
+			self.fueled_apa_count)
+		return ret
+
+	def get_apa_power_boost(self, unfueled_apa_count: int,
+		fueled_apa_count: int,
+	) -> float:
 		building = self.recipe_matrix.recipe_dataset.buildings[config.POWER_BOOST_BUILDING_LIST[0]]
-		ret = building.base_power_boost * self.unfueled_apa_count \
-			+ building.fueled_power_boost * self.fueled_apa_count
+		ret = building.base_power_boost * unfueled_apa_count \
+			+ building.fueled_power_boost * fueled_apa_count
 		return ret
 
+	@staticmethod
+	def _check_apa_counts(unfueled_apa_count: int, fueled_apa_count: int,
+	) -> None:
+		if (unfueled_apa_count < 0) or (fueled_apa_count < 0):
+			raise ValueError("APA count must be non-negative")
+		if (unfueled_apa_count + fueled_apa_count) > 10:
+			raise ValueError("the total APA count must be at most 10")
+		return
+
+	def set_apa_counts(self, unfueled_apa_count: int, fueled_apa_count: int,
+	) -> None:
+		# change the APA counts of this calculator in place: the power boost
+		# of the coef matrix is rescaled, and a compiled problem is updated by
+		# ._update_apa_counts(), so that the next solve warm-starts
+		self._check_apa_counts(unfueled_apa_count, fueled_apa_count)
+		scale = 1 + self.total_apa_power_boost
+		self.unfueled_apa_count = unfueled_apa_count
+		self.fueled_apa_count = fueled_apa_count
+		scale = (1 + self.total_apa_power_boost) / scale
+		if scale != 1:
+			coef_matrix = self.recipe_matrix.coef_matrix
+			mask = coef_matrix["power"] > 0
+			coef_matrix.loc[mask, "power"] *= scale
+			coef_matrix.loc[mask, "raw_power"] *= scale
+			self._constraint_builder = None
+		self._update_apa_counts()
+		return
+
+	def _update_apa_counts(self) -> None:
+		# update the compiled problem, if any, after .set_apa_counts(); the
+		# linprog problem of .calculate() is assembled on each call
+		return
+
+	def update_solver_apa_counts(self, solver: LinearProgramSolver) -> None:
+		# bring a problem of .get_linear_program() in line with the current
+		# APA counts: the power and raw_power entries of generators, the APA
+		# variant bounds and the somersloop limit
+		coef_matrix = self.recipe_matrix.coef_matrix
+		# constraint rows are the coef matrix columns
+		row_index = coef_matrix.columns
+		cols = numpy.flatnonzero(coef_matrix["power"].to_numpy() > 0)
+		rows = [row_index.get_loc("power"), row_index.get_loc("raw_power")]
+		solver.set_coefficients(numpy.repeat(rows, len(cols)),
+			numpy.tile(cols, 2),
+			-coef_matrix[["power", "raw_power"]].to_numpy().T[:, cols].ravel())
+		cols = numpy.flatnonzero(self.recipe_matrix.row_metadata.is_power_booster)
+		bounds = self.apply_logistics_limits(self.get_default_bounds())[cols]
+		solver.set_col_bounds(cols, bounds[:, 0], bounds[:, 1])
+		solver.set_row_bounds([row_index.get_loc("somersloop")], -numpy.inf,
+			self.get_somersloop_limit())
+		return
+
 	def _update_recipe_matrix_power_boost(self) -> None:
 		if self.total_apa_count == 0:
 			return
@@ -76,8 +161,18 @@ class ProductionCalculator(object):
 		mask = coef_matrix["power"] > 0
 		coef_matrix.loc[mask, "power"] *= (1 + self.total_apa_power_boost)
 		coef_matrix.loc[mask, "raw_power"] *= (1 + self.total_apa_power_boost)
+		self._constraint_builder = None
 		return
 
+	@property
+	def constraint_builder(self) -> ConstraintBuilder:
+		# the sparse constraint matrix and its eq/ub partitions are built once
+		# and reused by all subsequent calculations
+		if self._constraint_builder is None:
+			self._constraint_builder = ConstraintBuilder(
+				self.recipe_matrix.coef_matrix)
+		return self._constraint_builder
+
 	def get_default_constraint_matrix(self) -> pandas.DataFrame:
 		# take the negative transpose of the coef matrix
 		ret = -self.recipe_matrix.coef_matrix.copy()
@@ -89,8 +184,17 @@ class ProductionCalculator(object):
 		# a zero vector with index the same as the coef matrix columns
 		# somersloop is pre-filled with global limit
 		ret = pandas.Series(0.0, index=self.recipe_matrix.coef_matrix.columns)
-		somersloop = config.SOMERSLOOP_GLOBAL_LIMIT
-		total_apa = self.total_apa_count
+		ret["somersloop"] = self.get_somersloop_limit()
+		return ret
+
+	def get_somersloop_limit(self,
+		somersloop: int = config.SOMERSLOOP_GLOBAL_LIMIT, *,
+		total_apa: int = None,
+	) -> int:
+		# somersloops left for amplification, out of the collected ones
+		# total_apa: APA count, default the calculator's
+		if total_apa is None:
+			total_apa = self.total_apa_count
 		if self.enable_somersloop_amplification and (total_apa > 0):
 			somersloop -= 3  # require 3 to unlock both in tech tree
 		elif self.enable_somersloop_amplification or (total_apa > 0):
@@ -99,8 +203,7 @@ class ProductionCalculator(object):
 		somersloop -= total_apa * 10
 		if somersloop < 0:
 			raise RuntimeError("somersloop limit is negative, cannot proceed")
-		ret["somersloop"] = somersloop
-		return ret
+		return somersloop
 
 	def get_default_net_zero_item_list(self) -> list[str]:
 		# returna list of itemclass for intermediate parts
@@ -115,27 +218,73 @@ class ProductionCalculator(object):
 				ret.append(v.classname)
 		return ret
 
-	def get_default_bounds(self) -> list[tuple[float, float]]:
-		# return a list of (min, max) for each recipe (row)
+	def get_default_bounds(self, *, unfueled_apa_count: int = None,
+		fueled_apa_count: int = None,
+	) -> numpy.ndarray:
+		# return a (min, max) pair for each recipe (row), as a n x 2 array
 		# by default min is always 0, but can be changed for net production
 		# max is global limit for resource proxy recipes, inf for others
-		recipes = self.recipe_matrix.recipe_dataset.recipes
-		buildings = self.recipe_matrix.recipe_dataset.buildings
-		global_limit = self.recipe_matrix.global_limit
-		ret = []
-		for r, gl in global_limit.items():
-			r_classname: str = r.split("/")[0]
-			recipe = recipes[r_classname]
-			if r_classname in config.RESOURCE_CONVERTER_RECIPE_LIST:
-				# deal with resource conversion
-				ret.append((0, gl if self.enable_resource_conversion else 0))
-			elif recipe.get_manufacturer(buildings).classname in config.POWER_BOOST_BUILDING_LIST:
-				# deal with power boost building (apa)
-				v = self.unfueled_apa_count if r_classname.endswith("Unfueled") \
-					else self.fueled_apa_count
-				ret.append((v, v))  # force fixed value
-			else:
-				ret.append((0, gl))
+		# APA counts: default the calculator's
+		if unfueled_apa_count is None:
+			unfueled_apa_count = self.unfueled_apa_count
+		if fueled_apa_count is None:
+			fueled_apa_count = self.fueled_apa_count
+		row_meta = self.recipe_matrix.row_metadata
+		upper = self.recipe_matrix.global_limit.to_numpy(dtype=float, copy=True)
+		lower = numpy.zeros_like(upper)
+		# deal with resource conversion
+		if not self.enable_resource_conversion:
+			upper[row_meta.is_converter] = 0
+		# deal with power boost building (apa), force fixed value
+		unfueled = row_meta.is_power_booster \
+			& numpy.char.endswith(row_meta.recipe, "Unfueled")
+		fueled = row_meta.is_power_booster & ~unfueled
+		lower[unfueled] = upper[unfueled] = unfueled_apa_count
+		lower[fueled] = upper[fueled] = fueled_apa_count
+		ret = numpy.column_stack([lower, upper])
+		return ret
+
+	def get_linear_program(self, objective: str | numpy.ndarray, *,
+		maximize: bool = True, eq_items: list[str] = None,
+	) -> LinearProgram:
+		# assemble the whole problem with default constraints and bounds
+		# objective: a column name of the recipe matrix, or a vector over rows
+		# eq_items: items forced to be net zero, default net-zero item list
+		builder = self.constraint_builder
+		if eq_items is None:
+			eq_items = self.get_default_net_zero_item_list()
+		b = self.get_default_constraint_vector().to_numpy(dtype=float)
+		row_lower = numpy.full(len(b), -numpy.inf)
+		eq_positions = builder.get_partition(eq_items).eq_positions
+		row_lower[eq_positions] = b[eq_positions]
+		if isinstance(objective, str):
+			objective = self.recipe_matrix.get_column(objective)
+		objective = numpy.asarray(objective, dtype=float)
+		bounds = self.apply_logistics_limits(self.get_default_bounds())
+		ret = LinearProgram(
+			c=(-objective if maximize else objective.copy()),
+			A=builder.A,
+			row_lower=row_lower,
+			row_upper=b,
+			col_lower=bounds[:, 0].copy(),
+			col_upper=bounds[:, 1].copy(),
+			col_names=builder.col_index,
+			row_names=builder.row_index,
+		)
+		return ret
+
+	def apply_logistics_limits(self, bounds: numpy.ndarray) -> numpy.ndarray:
+		# (min, max) bounds as .get_default_bounds(), with the max limited by
+		# the logistics limits, if any; every limit is a column bound, so the
+		# problem is solved once as without them
+		# min is kept, e.g. for APAs and pinned variants
+		if self.logistics is None:
+			return bounds
+		if self._logistics_load is None:
+			self._logistics_load = self.logistics.get_load(self.recipe_matrix)
+		ret = bounds.copy()
+		ret[:, 1] = numpy.maximum(bounds[:, 0], self.logistics.get_upper_bounds(
+			self.recipe_matrix, bounds[:, 1], load=self._logistics_load))
 		return ret
 
 	@property
@@ -146,179 +295,305 @@ class ProductionCalculator(object):
 
 	@functools.wraps(scipy.optimize.linprog)
 	def calculate(self, *ka, **kw) -> scipy.optimize.OptimizeResult:
+		# arguments are kept, so that the problem can be diagnosed or exported
+		# the bounds are those of the caller, logistics limits cannot apply
+		if self.logistics is not None:
+			raise ValueError("logistics limits are not supported by linprog "
+				"calculations, use ObjectiveCalculator")
+		self._last_problem = inspect.signature(scipy.optimize.linprog).bind(
+			*ka, **kw).arguments
 		res = scipy.optimize.linprog(*ka, **kw)
+		self._accept_result(res)
+		return res
+
+	def _accept_result(self, res: scipy.optimize.OptimizeResult, *,
+		exit_on_failure: bool = True, lp: LinearProgram = None,
+	) -> None:
+		# lp: the problem solved, if not solved by .calculate() of this class
 		self._result = res
-		if res.success is not True:
+		if lp is not None:
+			self._last_problem = lp
+		if (res.success is not True) and exit_on_failure:
 			print("linear programming calculating failed.", file=sys.stderr)
 			print(f"reason: {res.message}", file=sys.stderr)
+			if res.status == 2:
+				self.diagnose_infeasibility().report(sys.stderr)
 			sys.exit(1)
-		return res
+		return
+
+	def get_last_linear_program(self) -> LinearProgram:
+		# the problem of the last calculation, with constraint row and
+		# variant names where known
+		if self._last_problem is None:
+			raise RuntimeError("no calculation available")
+		if isinstance(self._last_problem, LinearProgram):
+			return self._last_problem
+		args = self._last_problem
+		builder = self.constraint_builder
+		partition = builder.find_partition(args.get("A_ub"), args.get("A_eq"))
+		c = numpy.asarray(args["c"], dtype=float)
+		ret = LinearProgram.from_linprog_args(c,
+			A_ub=args.get("A_ub"), b_ub=args.get("b_ub"),
+			A_eq=args.get("A_eq"), b_eq=args.get("b_eq"),
+			bounds=args.get("bounds"),
+			col_names=builder.col_index if len(c) == builder.shape[1] else None,
+			ub_names=None if partition is None else partition.ub_index,
+			eq_names=None if partition is None else partition.eq_index,
+		)
+		return ret
+
+	def diagnose_infeasibility(self, lp: LinearProgram = None,
+	) -> InfeasibleSubsystem:
+		# find an irreducible infeasible subsystem of the last problem, or of
+		# the given one
+		if lp is None:
+			lp = self.get_last_linear_program()
+		ret = InfeasibilityDiagnoser(lp, recipe_matrix=self.recipe_matrix).find()
+		return ret
+
+	def export_linear_program(self, fname: str, *, fmt: str = None,
+		lp: LinearProgram = None,
+	) -> None:
+		# write the last problem, or the given one, for external solvers;
+		# e.g. .solver.lp of ObjectiveCalculator, to export without solving
+		# fmt: "mps" or "lp", by default from the file extension
+		if lp is None:
+			lp = self.get_last_linear_program()
+		LinearProgramFile(lp).write(fname, fmt)
+		return
+
+	def load_solution(self, fname: str, *, lp: LinearProgram = None,
+	) -> scipy.optimize.OptimizeResult:
+		# load the solution of an external solver for the last problem, or
+		# the given one, as written by .export_linear_program(); it becomes the
+		# current result, e.g. for .report()
+		if lp is None:
+			lp = self.get_last_linear_program()
+		values = LinearProgramFile(lp).read_solution(fname)
+		# columns other than variants, e.g. a target objective column, are
+		# dropped
+		x = values.reindex(self.recipe_matrix.coef_matrix.index,
+			fill_value=0.0).to_numpy()
+		ret = scipy.optimize.OptimizeResult(
+			x=x,
+			fun=float(lp.c @ values.to_numpy()),
+			success=True,
+			status=0,
+			message=f"solution loaded from '{fname}'",
+			nit=0,
+		)
+		self._accept_result(ret, exit_on_failure=False)
+		return ret
+
+	def get_flow_decomposition(self, **kw) -> FlowDecomposition:
+		# chains per final product and per resource of the last result
+		# kw: passed to FlowDecomposition.from_result()
+		ret = FlowDecomposition.from_result(self.recipe_matrix, self.result.x,
+			**kw)
+		return ret
 
 	def report(self, fp: io.TextIOBase = None) -> None:
 		if fp is None:
 			fp = sys.stdout
-		#
-		self._report_recipe_details(fp)
-		self._report_net_products(fp)
-		self._report_resource_summary(fp)
+		# the text form of .get_report_tables()
+		tables = self.get_report_tables()
+		self._report_recipe_details(fp, tables)
+		self._report_net_products(fp, tables)
+		self._report_resource_summary(fp, tables)
 		return
 
-	def _report_recipe_details(self, fp: io.TextIOBase) -> None:
-		items = self.recipe_matrix.recipe_dataset.items
-		recipes = self.recipe_matrix.recipe_dataset.recipes
-		buildings = self.recipe_matrix.recipe_dataset.buildings
-
+	def _report_recipe_details(self, fp: io.TextIOBase,
+		tables: dict[str, pandas.DataFrame],
+	) -> None:
 		print(">> Recipe detail", file=fp)
 		print("=" * 80, file=fp)
 		print(("\t").join(["Recipe", "Machine/count", "Somersloop", "Power",
 			"Ingredients", "Products"]), file=fp)
 		print("=" * 80, file=fp)
 
-		ampli_somersloop = 0.0
-		total_power_draw = 0.0
-		total_power_prod = 0.0
-
-		for ix, x in enumerate(self.result.x):
-			if x > 1e-8:  # ignore tiny values
-				recipe_coef: pandas.Series = self.recipe_matrix.coef_matrix.iloc[ix]
-				recipe_classname = recipe_coef.name.split("/")[0]
-				if recipe_classname not in recipes:
-					continue
-				# manufacturer name
-				building = recipes[recipe_classname].get_manufacturer(buildings)
-				if building is None:
-					print(f"warning: recipe '{recipe_classname}' appeared in "
-		   				"calculation without a valid manufacturer",
-						file=sys.stderr
-					)
-					building_name = "N/A"
-				else:
-					building_name = building.display_name
-				# somersloop, power and raw power
-				ampli_somersloop += (somersloop := recipe_coef["somersloop"] * x)
-				if ((power := recipe_coef["power"] * x) > 0):
-					total_power_prod += power
-				else:
-					total_power_draw += power
-				# products
-				ingredients = list()
-				products = list()
-				for field, value in recipe_coef.items():
-					if field not in items:
-						continue
-					item = items[field]
-					if value < -1e-8:
-						ingredients.append(item.item_flux_repr(value * x, decimal=3))
-					elif value > 1e-8:
-						products.append(item.item_flux_repr(value * x, decimal=3))
-				# print row
-				lines = [
-					recipes[recipe_classname].display_name,
-					building_name + " x " + util.simplify_decimal(x, decimal=3),
-					util.simplify_decimal(somersloop, decimal=3),
-					util.simplify_decimal(power, decimal=1) + "MW",
-					("; ").join(ingredients),
-					("; ").join(products),
-				]
-				print(("\t").join(lines), file=fp)
+		for row in tables["recipes"].itertuples(index=False):
+			lines = [
+				row.recipe,
+				row.building + " x " + util.simplify_decimal(row.machines,
+					decimal=3),
+				util.simplify_decimal(row.somersloop, decimal=3),
+				util.simplify_decimal(row.power, decimal=1) + "MW",
+				row.ingredients,
+				row.products,
+			]
+			print(("\t").join(lines), file=fp)
 
 		print("-" * 80, file=fp)
 		# somersloop and power summary
-		print(f"Somersloops in amplification\t{util.simplify_decimal(ampli_somersloop, decimal=1)}",
+		summary = tables["summary"].iloc[0]
+		print(f"Somersloops in amplification\t{util.simplify_decimal(summary.somersloop_amplification, decimal=1)}",
 			file=fp)
-		print(f"Somersloops in APA\t{(self.unfueled_apa_count + self.fueled_apa_count) * 10}",
+		print(f"Somersloops in APA\t{int(summary.somersloop_apa)}",
 			file=fp)
-		print(f"APA power boost\t+{int(self.total_apa_power_boost * 100)}%",
+		print(f"APA power boost\t+{int(summary.apa_power_boost * 100)}%",
 			file=fp)
-		print(f"Total net power\t{util.simplify_decimal(total_power_prod + total_power_draw, decimal=1)}MW",
+		print(f"Total net power\t{util.simplify_decimal(summary.net_power, decimal=1)}MW",
 			file=fp)
-		print(f"Total raw power\t{util.simplify_decimal(total_power_prod, decimal=1)}MW",
+		print(f"Total raw power\t{util.simplify_decimal(summary.raw_power, decimal=1)}MW",
 			file=fp)
 
 		print("=" * 80, file=fp)
 		return
 
-	def _report_net_products(self, fp: io.TextIOBase) -> None:
-		items = self.recipe_matrix.recipe_dataset.items
-
+	def _report_net_products(self, fp: io.TextIOBase,
+		tables: dict[str, pandas.DataFrame],
+	) -> None:
 		print("\n>> Net products", file=fp)
 		print("=" * 80, file=fp)
 		print(("\t").join(["Item", "Net production", "Sinkpoints"]), file=fp)
 		print("-" * 80, file=fp)
 
-		prod = self.recipe_matrix.coef_matrix.T @ self.result.x
-		total_sinkpoints = 0
-		for itemclass, amount in prod.items():
-			if itemclass not in items:
-				continue
-			if amount < 1e-8:
-				continue
-			item = items[itemclass]
-			if item.is_sinkable:
-				sinkpoints = item.rescaled_sink_points(amount * 60)
-				total_sinkpoints += sinkpoints
-			else:
-				sinkpoints = None
-
+		for row in tables["net_products"].itertuples(index=False):
 			fields = [
-				item.display_name,
-				util.simplify_decimal(item.rescale_amount(amount * 60)) + "/min.",
-				(f"{int(sinkpoints)} pts/min.") if item.is_sinkable else "N/A",
+				row.item,
+				util.simplify_decimal(row.rate) + "/min.",
+				"N/A" if numpy.isnan(row.sinkpoints)
+					else f"{int(row.sinkpoints)} pts/min.",
 			]
 			print(("\t").join(fields), file=fp)
 
 		print("-" * 80, file=fp)
 		# total sinkpoints
 		line = ("\t").join(["Total sinkpoints", "",
-			util.simplify_decimal(total_sinkpoints)])
+			util.simplify_decimal(tables["summary"].iloc[0].sinkpoints)])
 		print(line, file=fp)
 		print("=" * 80, file=fp)
 		return
 
-	def _report_resource_summary(self, fp: io.TextIOBase) -> None:
-		items = self.recipe_matrix.recipe_dataset.items
-		recipes = self.recipe_matrix.recipe_dataset.recipes
-		coef_matrix = self.recipe_matrix.coef_matrix
-
+	def _report_resource_summary(self, fp: io.TextIOBase,
+		tables: dict[str, pandas.DataFrame],
+	) -> None:
 		print("\n>> Resource summary", file=fp)
 		print("=" * 80, file=fp)
 		print(("\t").join(["Item", "Consumption", "Utilized"]), file=fp)
 		print("-" * 80, file=fp)
 
-		# identify recipe (row) and item (column) names
-		resource_proxy_recipes = list()
-		for i in coef_matrix.index:
-			r, *_ = i.split("/")
-			if recipes[r].is_resource_proxy:
-				resource_proxy_recipes.append(i)
-		resource_itemclass_list = list(config.RESOURCE_GLOBAL_LIMIT.keys())
-		# select x
-		positions = coef_matrix.index.get_indexer(resource_proxy_recipes)
-		x = self.result.x[positions]
-		# select coef matrix
-		resource_coef_matrix = coef_matrix.reindex(
-			index=resource_proxy_recipes,
-			columns=resource_itemclass_list,
-		)
-		resource_consump: pandas.Series = resource_coef_matrix.T @ x
-
-		for itemclass, rate in resource_consump.items():
-			if itemclass not in items:
-				continue
-			item = items[itemclass]
-			rate_per_minute = item.rescale_amount(rate) * 60
-			global_limit = config.RESOURCE_GLOBAL_LIMIT[itemclass]
-			if global_limit > 0:
-				perc = rate_per_minute / global_limit * 100
-				perc_str = util.simplify_decimal(perc, decimal=1) + "%"
-			else:
+		for row in tables["resources"].itertuples(index=False):
+			if numpy.isnan(row.utilized):
 				perc_str = "N/A"
+			else:
+				perc_str = util.simplify_decimal(row.utilized * 100,
+					decimal=1) + "%"
 			fields = [
-				item.display_name,
-				util.simplify_decimal(rate_per_minute) + "/min.",
+				row.item,
+				util.simplify_decimal(row.consumption) + "/min.",
 				perc_str,
 			]
 			print(("\t").join(fields), file=fp)
 		print("=" * 80, file=fp)
 
 		return
+
+	def get_report_tables(self, x: numpy.ndarray = None,
+	) -> dict[str, pandas.DataFrame]:
+		# the contents of .report() as typed tables, e.g. for spreadsheets:
+		#   "recipes": recipe, building, machines, somersloop, power (MW),
+		#     ingredients, products
+		#   "summary": one row of somersloops, apa power boost, power (MW) and
+		#     sinkpoints totals
+		#   "net_products": item, rate (/min), sinkpoints (pts/min, NaN if not
+		#     sinkable)
+		#   "resources": item, consumption (/min), utilized (fraction of the
+		#     global limit, NaN if unlimited)
+		# x: a solution of this calculator, by default that of the last
+		# calculation
+		if x is None:
+			x = self.result.x
+		items = self.recipe_matrix.recipe_dataset.items
+		recipes = self.recipe_matrix.recipe_dataset.recipes
+		buildings = self.recipe_matrix.recipe_dataset.buildings
+		coef_matrix = self.recipe_matrix.coef_matrix
+		row_meta = self.recipe_matrix.row_metadata
+
+		recipe_rows = list()
+		for ix in numpy.flatnonzero(x > 1e-8):
+			recipe_classname = row_meta.recipe[ix]
+			if recipe_classname not in recipes:
+				continue
+			recipe_coef: pandas.Series = coef_matrix.iloc[ix]
+			building = buildings.get(row_meta.building[ix])
+			if building is None:
+				print(f"warning: recipe '{recipe_classname}' appeared in "
+					"calculation without a valid manufacturer",
+					file=sys.stderr
+				)
+			ingredients = list()
+			products = list()
+			for field, value in recipe_coef.items():
+				if field not in items:
+					continue
+				if value < -1e-8:
+					ingredients.append(items[field].item_flux_repr(value * x[ix]))
+				elif value > 1e-8:
+					products.append(items[field].item_flux_repr(value * x[ix]))
+			recipe_rows.append((
+				recipes[recipe_classname].display_name,
+				"N/A" if building is None else building.display_name,
+				float(x[ix]),
+				float(recipe_coef["somersloop"] * x[ix]),
+				float(recipe_coef["power"] * x[ix]),
+				("; ").join(ingredients),
+				("; ").join(products),
+			))
+		recipe_table = pandas.DataFrame(recipe_rows,
+			columns=self.REPORT_TABLE_COLUMNS["recipes"])
+
+		prod = coef_matrix.T @ x
+		product_rows = list()
+		for itemclass, amount in prod.items():
+			if (itemclass not in items) or (amount < 1e-8):
+				continue
+			item = items[itemclass]
+			product_rows.append((
+				item.display_name,
+				item.rescale_amount(amount * 60),
+				item.rescaled_sink_points(amount * 60) if item.is_sinkable
+					else numpy.nan,
+			))
+		product_table = pandas.DataFrame(product_rows,
+			columns=self.REPORT_TABLE_COLUMNS["net_products"])
+
+		positions = numpy.flatnonzero(row_meta.is_resource_proxy)
+		resource_consump: pandas.Series = coef_matrix.reindex(
+			index=coef_matrix.index[positions],
+			columns=list(config.RESOURCE_GLOBAL_LIMIT.keys()),
+		).T @ x[positions]
+		resource_rows = list()
+		for itemclass, rate in resource_consump.items():
+			if itemclass not in items:
+				continue
+			rate_per_minute = items[itemclass].rescale_amount(rate) * 60
+			global_limit = config.RESOURCE_GLOBAL_LIMIT[itemclass]
+			resource_rows.append((
+				items[itemclass].display_name,
+				rate_per_minute,
+				rate_per_minute / global_limit if global_limit > 0 else numpy.nan,
+			))
+		resource_table = pandas.DataFrame(resource_rows,
+			columns=self.REPORT_TABLE_COLUMNS["resources"])
+
+		# totals summed in row order, as in the text report
+		power = recipe_table["power"].tolist()
+		raw_power = sum(p for p in power if p > 0)
+		summary_table = pandas.DataFrame([(
+			sum(recipe_table["somersloop"].tolist()),
+			(self.unfueled_apa_count + self.fueled_apa_count) * 10,
+			self.total_apa_power_boost,
+			raw_power + sum(p for p in power if p <= 0),
+			raw_power,
+			sum(p for p in product_table["sinkpoints"].tolist()
+				if not numpy.isnan(p)),
+		)], columns=self.REPORT_TABLE_COLUMNS["summary"])
+
+		ret = {
+			"recipes": recipe_table,
+			"summary": summary_table,
+			"net_products": product_table,
+			"resources": resource_table,
+		}
+		return ret
@@ -3,7 +3,6 @@
 import dataclasses
 import functools
 import json
-import pdb
 from typing import Self
 
 from .elements import Recipe, Building, Item
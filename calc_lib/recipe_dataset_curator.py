@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import json
-import pdb
 import re
 from typing import Self
 
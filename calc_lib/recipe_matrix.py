@@ -1,21 +1,56 @@
 #!/usr/bin/env python3
 
+import copy
+import dataclasses
 import itertools
-import pdb
-from typing import Self
+from typing import Self, Sequence
 
+import numpy
 import pandas
+import scipy.sparse
 
 from .elements import ClockSpeed, Recipe, Building, Item
 from .recipe_dataset import RecipeDataset
 from . import config
 
 
+@dataclasses.dataclass
+class RowMetadata(object):
+	# typed per-row metadata of the coef matrix, one entry per recipe variant
+	# all columns are numpy arrays of the same length, aligned with the rows
+	recipe: numpy.ndarray  # str, recipe classname
+	building: numpy.ndarray  # str, manufacturer classname
+	somersloop: numpy.ndarray  # int, installed somersloop count
+	clock_speed: numpy.ndarray  # int, clock speed in percent
+	is_resource_proxy: numpy.ndarray  # bool
+	is_converter: numpy.ndarray  # bool
+	is_power_booster: numpy.ndarray  # bool
+
+	def __len__(self) -> int:
+		return len(self.recipe)
+
+	@classmethod
+	def from_records(cls, records: list[tuple]) -> Self:
+		# records are tuples in the same order as the fields
+		columns = list(zip(*records)) if records else [()] * 7
+		ret = cls(
+			recipe=numpy.array(columns[0], dtype=str),
+			building=numpy.array(columns[1], dtype=str),
+			somersloop=numpy.array(columns[2], dtype=int),
+			clock_speed=numpy.array(columns[3], dtype=int),
+			is_resource_proxy=numpy.array(columns[4], dtype=bool),
+			is_converter=numpy.array(columns[5], dtype=bool),
+			is_power_booster=numpy.array(columns[6], dtype=bool),
+		)
+		return ret
+
+
 class RecipeMatrix(object):
 	def __init__(self, recipe_dataset: RecipeDataset, *ka,
 		production_clock_speed: ClockSpeed = ClockSpeed(100),
 		resource_extraction_clock_speed: ClockSpeed = ClockSpeed(250),
-		with_somersloop: bool = False, **kw,
+		with_somersloop: bool = False,
+		production_clock_speed_grid: Sequence[int] = None, **kw,
 	) -> None:
 		super().__init__(*ka, **kw)
 		# basic data attributes
@@ -24,68 +59,241 @@ class RecipeMatrix(object):
 		self.resource_extraction_clock_speed: ClockSpeed = ClockSpeed(
 			resource_extraction_clock_speed)
 		self.with_somersloop: bool = with_somersloop
+		# if set, overclockable production recipes get a variant at each of
+		# these clock speeds, instead of production clock speed and 250%
+		self.production_clock_speed_grid: list[ClockSpeed] = None \
+			if production_clock_speed_grid is None \
+			else sorted({ClockSpeed(c) for c in production_clock_speed_grid})
 		# the coefficient matrix for the recipes
 		# coefs are in units of items/second
 		self.coef_matrix: pandas.DataFrame = None
 		# the global production limit for each recipe
 		# may be used for resource extraction limits
 		self.global_limit: pandas.Series = None
-		# construct .coef_matrix and .global_limit
+		# typed metadata of each row (recipe variant) in the coef matrix
+		self.row_metadata: RowMetadata = None
+		# item flow block of the coef matrix, as sparse matrix
+		# rows are the same as coef matrix, columns are .item_index
+		self.flow_matrix: scipy.sparse.csr_array = None
+		self.item_index: pandas.Index = None
+		# user-registered weighted columns of item flows
+		# these are not in the coef matrix, thus not used as constraints, but
+		# can be used as objectives
+		self.weighted_columns: pandas.DataFrame = None
+		# construct above attributes
 		self._construct_matrices()
 		return
 
 	def _construct_matrices(self) -> None:
 		# these are updated in-place by related methods
-		coef_rows = list[pandas.Series]()  # rows in coef matrix
-		global_limit = pandas.Series(dtype=float)
+		row_labels = list[str]()  # row names in coef matrix
+		global_limit = list[float]()
+		row_meta = list[tuple]()  # records of row metadata
 
-		# fill-in regular recipes
+		# enumerate variants of regular recipes
 		for recipe in self.recipe_dataset.recipes.values():
-			self._append_regular_recipe(coef_rows, global_limit, recipe=recipe)
+			self._append_regular_recipe(row_labels, global_limit, row_meta,
+				recipe=recipe)
+		row_metadata = RowMetadata.from_records(row_meta)
 
-		# concat coef matrix rows into a matrix
-		# take transpose so that each row is a recipe
-		coef_matrix = pandas.concat(coef_rows, axis=1).T
-		# fill NaNs with 0
-		coef_matrix = coef_matrix.fillna(0)
+		# power and production multiplier of all variants
+		power, prod_multiplier = self._get_variant_power_and_production(
+			row_metadata)
+		cycles_per_second = (row_metadata.clock_speed / 100) \
+			/ self._get_manufacturing_duration(row_metadata)
+
+		# item flow block
+		flow_matrix, item_index = self._build_flow_matrix(row_metadata,
+			cycles_per_second=cycles_per_second,
+			prod_multiplier=prod_multiplier,
+		)
+
+		# aggregate columns
+		# somersloop: for somersloop count
+		# power: for net power
+		# raw_power: for raw power production
+		# points_gain_rate: for sinkable points gain, derived from item flows
+		aggregates = pandas.DataFrame({
+			"somersloop": row_metadata.somersloop.astype(float),
+			"power": power,
+			"raw_power": numpy.maximum(power, 0.0),
+			"points_gain_rate": flow_matrix @ self._get_item_vector(
+				self._get_sink_points_weights(), item_index),
+		}, index=row_labels)
+		coef_matrix = pandas.concat([aggregates, pandas.DataFrame(
+			flow_matrix.toarray(), index=row_labels, columns=item_index,
+		)], axis=1)
 
 		# update attributes
 		self.coef_matrix = coef_matrix
-		self.global_limit = global_limit
+		self.global_limit = pandas.Series(global_limit, index=row_labels,
+			dtype=float)
+		self.row_metadata = row_metadata
+		self.flow_matrix = flow_matrix
+		self.item_index = item_index
+		self.weighted_columns = pandas.DataFrame(index=coef_matrix.index)
 		return
 
+	def _build_flow_matrix(self, row_metadata: RowMetadata, *,
+		cycles_per_second: numpy.ndarray, prod_multiplier: numpy.ndarray,
+	) -> tuple[scipy.sparse.csr_array, pandas.Index]:
+		# per-cycle ingredients and products of each distinct recipe, as
+		# sparse matrices; then expanded to all variants by row selection and
+		# scaling with cycles/s and production multiplier
+		recipes = self.recipe_dataset.recipes
+		recipe_index = pandas.Index(pandas.unique(row_metadata.recipe))
+		item_index = list()  # items in order of first appearance
+		item_pos = dict()
+		ingr_entries = ([], [], [])  # (value, recipe pos, item pos)
+		prod_entries = ([], [], [])
+		for ri, r in enumerate(recipe_index):
+			recipe = recipes[r]
+			for category, entries in [(recipe.ingredients, ingr_entries),
+				(recipe.products, prod_entries),
+			]:
+				for k, v in category.items():
+					if k not in item_pos:
+						item_pos[k] = len(item_index)
+						item_index.append(k)
+					if (entries is ingr_entries) and (k in recipe.products):
+						continue  # products take precedence
+					entries[0].append(v)
+					entries[1].append(ri)
+					entries[2].append(item_pos[k])
+		shape = (len(recipe_index), len(item_index))
+		ingr = scipy.sparse.csr_array((
+			-numpy.asarray(ingr_entries[0], dtype=float),
+			(ingr_entries[1], ingr_entries[2]),
+		), shape=shape)
+		prod = scipy.sparse.csr_array((
+			numpy.asarray(prod_entries[0], dtype=float),
+			(prod_entries[1], prod_entries[2]),
+		), shape=shape)
+		# expand to variants
+		rows = recipe_index.get_indexer(row_metadata.recipe)
+		cps = scipy.sparse.diags_array(cycles_per_second)
+		pm = scipy.sparse.diags_array(prod_multiplier)
+		# ingredients not affected by boost
+		ret = cps @ ingr[rows] + cps @ (pm @ prod[rows])
+		return scipy.sparse.csr_array(ret), pandas.Index(item_index)
+
+	def _get_sink_points_weights(self) -> dict[str, float]:
+		# only sinkable items count
+		ret = {k: float(v.resource_sink_points)
+			for k, v in self.recipe_dataset.items.items() if v.is_sinkable}
+		return ret
+
+	@staticmethod
+	def _get_item_vector(weights: dict[str, float], item_index: pandas.Index,
+	) -> numpy.ndarray:
+		# items not in the matrix are ignored
+		ret = numpy.zeros(len(item_index), dtype=float)
+		pos = item_index.get_indexer(list(weights.keys()))
+		mask = pos >= 0
+		ret[pos[mask]] = numpy.fromiter(weights.values(), dtype=float,
+			count=len(weights))[mask]
+		return ret
+
+	def get_weighted_column(self, weights: dict[str, float], *,
+		row_mask: numpy.ndarray = None,
+	) -> numpy.ndarray:
+		# weighted sum of item flows of each row, computed as a single mat-vec
+		# on the flow block; e.g. weighted resource usage with
+		# config.DEFAULT_RESOURCE_WEIGHT_CONFIG
+		# row_mask: if provided, only rows selected by the mask are counted
+		ret = self.flow_matrix @ self._get_item_vector(weights,
+			self.item_index)
+		if row_mask is not None:
+			ret = numpy.where(row_mask, ret, 0.0)
+		return ret
+
+	def register_weighted_column(self, name: str, weights: dict[str, float],
+		*, row_mask: numpy.ndarray = None,
+	) -> pandas.Series:
+		# add .get_weighted_column() as a named column, e.g. for reports
+		if name in self.coef_matrix.columns:
+			raise ValueError(f"column '{name}' already exists in coef matrix")
+		self.weighted_columns[name] = self.get_weighted_column(weights,
+			row_mask=row_mask)
+		return self.weighted_columns[name]
+
+	def get_column(self, name: str) -> numpy.ndarray:
+		# a column from either the coef matrix or the weighted columns
+		if name in self.coef_matrix.columns:
+			ret = self.coef_matrix[name].to_numpy(dtype=float)
+		elif name in self.weighted_columns.columns:
+			ret = self.weighted_columns[name].to_numpy(dtype=float)
+		else:
+			raise KeyError(f"unknown column: {name}")
+		return ret
+
+	def _get_manufacturing_duration(self, row_metadata: RowMetadata,
+	) -> numpy.ndarray:
+		recipes = self.recipe_dataset.recipes
+		ret = numpy.array([recipes[r].manufacturing_duration
+			for r in row_metadata.recipe], dtype=float)
+		return ret
+
+	def _get_variant_power_and_production(self, row_metadata: RowMetadata,
+	) -> tuple[numpy.ndarray, numpy.ndarray]:
+		# power and production multiplier of each row, computed in a single
+		# broadcast per building
+		recipes = self.recipe_dataset.recipes
+		buildings = self.recipe_dataset.buildings
+		power = numpy.zeros(len(row_metadata), dtype=float)
+		prod_multiplier = numpy.ones(len(row_metadata), dtype=float)
+		for b in numpy.unique(row_metadata.building):
+			building = buildings[b]
+			pos = numpy.flatnonzero(row_metadata.building == b)
+			somersloop = row_metadata.somersloop[pos]
+			power[pos] = building.get_adjusted_power_array(
+				row_metadata.clock_speed[pos], somersloop,
+				recipes=[recipes[r] for r in row_metadata.recipe[pos]],
+			)
+			prod_multiplier[pos] = building.get_production_multiplier_array(
+				somersloop)
+		return power, prod_multiplier
+
+	def get_sparse_coef_matrix(self) -> scipy.sparse.csr_array:
+		# the coef matrix as sparse matrix, same rows and columns; assembled
+		# from the aggregate columns and the flow block, without densifying
+		# the item flows
+		n_aggregates = len(self.coef_matrix.columns) - len(self.item_index)
+		if not self.coef_matrix.columns[n_aggregates:].equals(self.item_index):
+			raise RuntimeError("coef matrix columns do not match the flow block")
+		aggregates = scipy.sparse.csr_array(self.coef_matrix.iloc[:,
+			:n_aggregates].to_numpy(dtype=float))
+		ret = scipy.sparse.hstack([aggregates, self.flow_matrix], format="csr")
+		ret.eliminate_zeros()
+		return ret
+
+	def copy(self) -> Self:
+		# coef matrix and weighted columns are copied, as calculators may
+		# change them in-place (e.g. apa power boost); the other attributes
+		# are never changed after construction, thus shared
+		ret = copy.copy(self)
+		ret.coef_matrix = self.coef_matrix.copy()
+		ret.weighted_columns = self.weighted_columns.copy()
+		return ret
+
 	@classmethod
 	def from_curated_recipe_dataset_json(cls, fname: str, *,
 		production_clock_speed: ClockSpeed = ClockSpeed(100),
 		resource_extraction_clock_speed: ClockSpeed = ClockSpeed(250),
 		with_somersloop: bool = False,
+		production_clock_speed_grid: Sequence[int] = None,
 	) -> Self:
 		ret = cls(RecipeDataset.from_json(fname),
 			production_clock_speed=production_clock_speed,
 			resource_extraction_clock_speed=resource_extraction_clock_speed,
 			with_somersloop=with_somersloop,
+			production_clock_speed_grid=production_clock_speed_grid,
 		)
 		return ret
 
-	@staticmethod
-	def _basic_coef_matrix_row(name: str, *, somersloop: int = 0,
-		power: float = 0.0, sink_points_rate: float = 0.0
-	) -> pandas.Series:
-		# somersloop: for somersloop count
-		# power: for net power
-		# raw_power: for raw power production
-		row = pandas.Series(0.0, name=name,
-			index=["somersloop", "power", "raw_power", "points_gain_rate",],
-		)
-		row["somersloop"] = somersloop
-		row["power"] = power
-		if power > 0:
-			row["raw_power"] = power
-		row["points_gain_rate"] = sink_points_rate
-		return row
-
-	def _append_regular_recipe(self, coef_rows_extern: list[pandas.Series],
-		global_limit_extern: pandas.Series, *, recipe: Recipe,
+	def _append_regular_recipe(self, row_labels_extern: list[str],
+		global_limit_extern: list[float], row_meta_extern: list[tuple], *,
+		recipe: Recipe,
 		# allow temporary change below settings
 		production_clock_speed: ClockSpeed = None,
 		resource_clock_speed: ClockSpeed = None,
@@ -115,41 +323,32 @@ class RecipeMatrix(object):
 			if recipe.is_resource_proxy:
 				# also ensures there is only one clock speed for resources
 				clock_speeds = [resource_clock_speed]
+			elif self.production_clock_speed_grid is not None:
+				clock_speeds = self.production_clock_speed_grid
 			else:
 				# always consider 250%
 				clock_speeds = list({production_clock_speed, ClockSpeed(250)})
 
-		# add a row for each somersloop count
+		# add a variant for each somersloop count and clock speed
+		# the coef rows are filled later for all variants together
 		for somersloop, clock_speed in itertools.product(somersloops, clock_speeds):
-			cycles_per_second = (clock_speed / 100) / recipe.manufacturing_duration
-			prod_multiplier = building.get_production_multiplier(somersloop)
 			# use the recipe in-game classname as index postfixed by
 			# somersloop count
-			index = f"{recipe.classname}/S{somersloop}_OC{clock_speed}"
-
-			# construct the row
-			row = self._basic_coef_matrix_row(index, somersloop=somersloop,
-				power=building.get_adjusted_power(clock_speed, somersloop,
-					recipe=recipe,
-				),
-				sink_points_rate=recipe.get_production_sink_points_gain(
-					items=self.recipe_dataset.items,
-					prod_multiplier=prod_multiplier,
-					cycles_per_second=cycles_per_second,
-					sinkable_only=True,
-				)
-			)
-			# add ingredients and products
-			for k, v in recipe.ingredients.items():
-				row[k] = -v * cycles_per_second  # ingredients not affected by boost
-			for k, v in recipe.products.items():
-				row[k] = v * prod_multiplier * cycles_per_second
-
-			# append to coef matrix rows
-			coef_rows_extern.append(row)
+			row_labels_extern.append(
+				f"{recipe.classname}/S{somersloop}_OC{clock_speed}")
 			# global limit related
 			recipe_global_limit = recipe.global_limit
-			global_limit_extern[index] = float("inf") \
-				if recipe_global_limit < 0 else recipe_global_limit
+			global_limit_extern.append(float("inf")
+				if recipe_global_limit < 0 else recipe_global_limit)
+			# row metadata, same order as RowMetadata fields
+			row_meta_extern.append((
+				recipe.classname,
+				building.classname,
+				somersloop,
+				clock_speed,
+				recipe.is_resource_proxy,
+				recipe.classname in config.RESOURCE_CONVERTER_RECIPE_LIST,
+				building.classname in config.POWER_BOOST_BUILDING_LIST,
+			))
 
 		return
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+
+import collections
+import dataclasses
+from typing import Self, Sequence
+
+import numpy
+import pandas
+import scipy.optimize
+import scipy.sparse
+
+from . import config
+from .linear_program import LinearProgram, LinearProgramSolver
+from .objective_calculator import ObjectiveCalculator
+from .recipe_matrix import RecipeMatrix
+
+
+@dataclasses.dataclass
+class Region(object):
+	# a regional factory and the resources on its territory, in the shape of
+	# the config tables:
+	#   nodes: itemclass -> {purity: count}, as config.RESOURCE_NODE_CONFIG
+	#   wells: itemclass -> well cluster locations, as the keys in
+	#     config.RESOURCE_WELL_CONFIG
+	#   geysers: {purity: count}, as config.RESOURCE_NODE_GEYSER_CONFIG
+	# unrestrained resources (water pumps) are available in every region
+	name: str
+	nodes: dict[str, dict[str, int]] = dataclasses.field(default_factory=dict)
+	wells: dict[str, list[str]] = dataclasses.field(default_factory=dict)
+	geysers: dict[str, int] = dataclasses.field(default_factory=dict)
+
+	def get_resource_limits(self) -> dict[str, float]:
+		# global limit of the resource proxy recipes in this region, by recipe
+		# classname as named by the recipe dataset curator
+		ret = dict()
+		for itemclass, purity_counts in self.nodes.items():
+			for extractor in config.RESOURCE_NODE_EXTRACTOR_CONFIG[itemclass]:
+				for purity, count in purity_counts.items():
+					label = config.RESOURCE_NODE_PURITY_CONFIG[purity]["label"]
+					ret[f"ResourceNode-{extractor}-{itemclass}-{label}"] = count
+		for itemclass, locations in self.wells.items():
+			for activator in config.RESOURCE_WELL_ACTIVATOR_LIST:
+				for location in locations:
+					ret[f"ResourceWell-{activator}-{itemclass}-{location}"] = 1
+		for purity, count in self.geysers.items():
+			label = config.RESOURCE_NODE_PURITY_CONFIG[purity]["label"]
+			ret[("ResourceNode-{}-{}").format(
+				config.RESOURCE_NODE_GEYSER_GENERATOR, label)] = count
+		return ret
+
+	def limit_bounds(self, recipe_matrix: RecipeMatrix, bounds: numpy.ndarray,
+	) -> numpy.ndarray:
+		# variant bounds, as ProductionCalculator.get_default_bounds(), with
+		# the resource proxies limited to the resources of this region
+		row_meta = recipe_matrix.row_metadata
+		limits = self.get_resource_limits()
+		ret = bounds.copy()
+		# proxies of unrestrained resources have no global limit
+		limited = row_meta.is_resource_proxy \
+			& numpy.isfinite(recipe_matrix.global_limit.to_numpy())
+		for pos in numpy.flatnonzero(limited):
+			ret[pos, 1] = min(ret[pos, 1], limits.get(row_meta.recipe[pos], 0))
+		return ret
+
+	@classmethod
+	def split_map(cls, names: Sequence[str]) -> list[Self]:
+		# the nodes, wells and geysers of the whole map dealt out round-robin
+		# to the regions; together the regions have the resources of the
+		# pooled single-factory model
+		n = len(names)
+		if not n:
+			raise ValueError("at least one region is required")
+		ret = [cls(name) for name in names]
+		start = 0
+		# nodes and geysers: each count split evenly, the remainders go to
+		# the next regions in turn
+		purity_tables = [(i, counts, "nodes")
+			for i, counts in config.RESOURCE_NODE_CONFIG.items()]
+		purity_tables.append((None, config.RESOURCE_NODE_GEYSER_CONFIG,
+			"geysers"))
+		for itemclass, purity_counts, field in purity_tables:
+			for purity, count in purity_counts.items():
+				for k, region in enumerate(ret):
+					share = count // n + int((k - start) % n < count % n)
+					if field == "geysers":
+						region.geysers[purity] = share
+					else:
+						region.nodes.setdefault(itemclass, dict())[purity] = share
+				start = (start + count % n) % n
+		for itemclass, clusters in config.RESOURCE_WELL_CONFIG.items():
+			for location in clusters:
+				ret[start].wells.setdefault(itemclass, list()).append(location)
+				start = (start + 1) % n
+		return ret
+
+
+@dataclasses.dataclass
+class Link(object):
+	# a directed transport route between two regions, e.g. a train line;
+	# add one link per direction for two-way traffic
+	# items: itemclasses carried, or "power" for a power line
+	# capacity: shared by all items carried, in items/min (m3/min for
+	#   fluids, MW for power); must be finite
+	# cost: objective units per item/min transported, e.g. MW of trains when
+	#   maximizing raw_power
+	src: str
+	dst: str
+	items: list[str]
+	capacity: float
+	cost: float = 0.0
+
+
+class RegionalCalculator(ObjectiveCalculator):
+	# several regional factories instead of one factory on pooled resources:
+	# each region has a copy of the recipe block, bounded by the resources of
+	# that region, and the regions trade items over links, as transport flow
+	# variables with capacity and cost
+	# somersloops are shared by all regions; APAs are built in apa_region
+	# (default: the first region) and boost the generators of all regions
+	# methods:
+	#   "dantzig-wolfe": decomposition by region; the master problem combines
+	#     production plans (proposals) of each region with the transport
+	#     flows, under the rows linking the regions: traded items, somersloops
+	#     and link capacities; each round prices every region with the master
+	#     duals and adds the improving plans, until no region improves or the
+	#     lagrangian bound closes the gap; pricing problems are one region
+	#     each and warm-start from the previous round; a phase 1 on
+	#     artificial columns finds a feasible combination first
+	#   "monolithic": all regions in one problem, e.g. as reference
+	# .result.x is the map-wide total over all regions, e.g. for .report();
+	# .result.regional_x (region x variant) and .result.flows (per link and
+	# item, in items/min) hold the regional plans and the transport
+	METHODS = ("dantzig-wolfe", "monolithic")
+	# aggregate rows that cannot be transported
+	NON_TRANSPORTABLE_ROWS = ("somersloop", "raw_power", "points_gain_rate")
+
+	def __init__(self, recipe_matrix: RecipeMatrix, *,
+		regions: Sequence[Region],
+		links: Sequence[Link] = (),
+		apa_region: str = None,
+		method: str = "dantzig-wolfe",
+		max_rounds: int = 1000,
+		tol: float = 1e-6,
+		**kw,
+	) -> None:
+		super().__init__(recipe_matrix, **kw)
+		if self.logistics is not None:
+			raise ValueError("logistics limits are not supported by the regional calculator")
+		self.regions = list(regions)
+		self.links = list(links)
+		self.region_index = pandas.Index([r.name for r in self.regions])
+		if not len(self.regions):
+			raise ValueError("at least one region is required")
+		if not self.region_index.is_unique:
+			raise ValueError("region names must be unique")
+		if apa_region is None:
+			apa_region = self.regions[0].name
+		if apa_region not in self.region_index:
+			raise ValueError(f"unknown apa region: '{apa_region}'")
+		self.apa_region = apa_region
+		row_index = self.constraint_builder.row_index
+		for link in self.links:
+			for name in (link.src, link.dst):
+				if name not in self.region_index:
+					raise ValueError(f"link to unknown region: '{name}'")
+			if link.src == link.dst:
+				raise ValueError(f"link from '{link.src}' to itself")
+			if (not numpy.isfinite(link.capacity)) or (link.capacity < 0):
+				raise ValueError(f"link '{link.src}' -> '{link.dst}' must have "
+					"a finite, non-negative capacity")
+			for item in link.items:
+				if (item not in row_index) \
+					or (item in self.NON_TRANSPORTABLE_ROWS):
+					raise ValueError(f"cannot transport '{item}'")
+		if method not in self.METHODS:
+			raise ValueError(f"unknown method: '{method}', expected one of "
+				f"{self.METHODS}")
+		self.method = method
+		if max_rounds < 1:
+			raise ValueError("max_rounds must be positive")
+		self.max_rounds = max_rounds
+		self.tol = tol
+		# the single-region problem, every block is a copy of it
+		self._base_lp: LinearProgram = None
+		# dantzig-wolfe state: pricing problem of each region, master column
+		# costs, artificial columns and proposals (region, plan)
+		self._blocks: list[LinearProgramSolver] = None
+		self._master_costs: numpy.ndarray = None
+		self._artificial: numpy.ndarray = None
+		self._proposals: list[tuple[int, numpy.ndarray]] = None
+		self.stats = collections.Counter()
+		return
+
+	@property
+	def base_linear_program(self) -> LinearProgram:
+		if self._base_lp is None:
+			self._base_lp = self.get_linear_program(self.objective,
+				maximize=self.maximize, eq_items=self.get_eq_items())
+		return self._base_lp
+
+	def get_flow_scale(self, item: str) -> float:
+		# items/min (or MW) per unit of an item row
+		if item == "power":
+			return 1.0
+		ret = self.recipe_matrix.recipe_dataset.items[item].rescale_amount(60.0)
+		return ret
+
+	def get_transport_table(self) -> pandas.DataFrame:
+		# one transport flow variable per link and item carried, with the
+		# positions of the regions and of the item row
+		records = list()
+		row_index = self.constraint_builder.row_index
+		for i, link in enumerate(self.links):
+			for item in link.items:
+				records.append((i, link.src, link.dst, item,
+					self.region_index.get_loc(link.src),
+					self.region_index.get_loc(link.dst),
+					row_index.get_loc(item), self.get_flow_scale(item)))
+		ret = pandas.DataFrame(records, columns=["link", "src", "dst", "item",
+			"src_pos", "dst_pos", "row_pos", "scale"])
+		return ret
+
+	def get_region_bounds(self, region: int) -> numpy.ndarray:
+		# variant bounds of a region, as .get_default_bounds(): the resource
+		# proxies limited by the region's nodes, APAs only in apa_region
+		ret = self.regions[region].limit_bounds(self.recipe_matrix,
+			self.get_default_bounds())
+		if self.region_index[region] != self.apa_region:
+			ret[self.recipe_matrix.row_metadata.is_power_booster] = 0
+		return ret
+
+	def get_traded_rows(self, region: int) -> numpy.ndarray:
+		# item rows of a region linked to other regions by transport
+		transport = self.get_transport_table()
+		mask = (transport["src_pos"] == region) | (transport["dst_pos"] == region)
+		ret = numpy.unique(transport.loc[mask, "row_pos"].to_numpy(dtype=int))
+		return ret
+
+	def get_monolithic_linear_program(self) -> LinearProgram:
+		# all regions in one problem
+		# columns: the variants of each region, then the transport flows
+		# rows: the rows of each region but somersloop, then the shared
+		# somersloop row, then the link capacities
+		base = self.base_linear_program
+		builder = self.constraint_builder
+		n_regions = len(self.regions)
+		somersloop = builder.row_index.get_loc("somersloop")
+		local = numpy.delete(numpy.arange(base.n_rows), somersloop)
+		n_local = len(local)
+		local_pos = numpy.full(base.n_rows, -1)
+		local_pos[local] = numpy.arange(n_local)
+		transport = self.get_transport_table()
+		n_flows = len(transport)
+		# transport enters the item rows: exported at src, imported at dst
+		src_rows = transport["src_pos"].to_numpy() * n_local \
+			+ local_pos[transport["row_pos"].to_numpy()]
+		dst_rows = transport["dst_pos"].to_numpy() * n_local \
+			+ local_pos[transport["row_pos"].to_numpy()]
+		flows = scipy.sparse.coo_array((
+			numpy.concatenate([numpy.ones(n_flows), -numpy.ones(n_flows)]),
+			(numpy.concatenate([src_rows, dst_rows]),
+				numpy.tile(numpy.arange(n_flows), 2)),
+		), shape=(n_regions * n_local + 1, n_flows))
+		capacity = scipy.sparse.coo_array((
+			transport["scale"].to_numpy(dtype=float),
+			(transport["link"].to_numpy(), numpy.arange(n_flows)),
+		), shape=(len(self.links), n_flows))
+		blocks = scipy.sparse.vstack([
+			scipy.sparse.block_diag([base.A[local]] * n_regions),
+			scipy.sparse.hstack([base.A[[somersloop]]] * n_regions),
+		])
+		A = scipy.sparse.vstack([
+			scipy.sparse.hstack([blocks, flows]),
+			scipy.sparse.hstack([
+				scipy.sparse.csr_array((len(self.links), n_regions * base.n_cols)),
+				capacity,
+			]),
+		], format="csr")
+		bounds = numpy.vstack([self.get_region_bounds(r)
+			for r in range(n_regions)])
+		link_cost = numpy.array([link.cost for link in self.links], dtype=float)
+		ret = LinearProgram(
+			c=numpy.concatenate([numpy.tile(base.c, n_regions),
+				link_cost[transport["link"].to_numpy(dtype=int)]
+					* transport["scale"].to_numpy(dtype=float)]),
+			A=A,
+			row_lower=numpy.concatenate([
+				numpy.tile(base.row_lower[local], n_regions),
+				base.row_lower[[somersloop]],
+				numpy.full(len(self.links), -numpy.inf),
+			]),
+			row_upper=numpy.concatenate([
+				numpy.tile(base.row_upper[local], n_regions),
+				base.row_upper[[somersloop]],
+				numpy.array([link.capacity for link in self.links], dtype=float),
+			]),
+			col_lower=numpy.concatenate([bounds[:, 0], numpy.zeros(n_flows)]),
+			col_upper=numpy.concatenate([bounds[:, 1],
+				numpy.full(n_flows, numpy.inf)]),
+			col_names=pandas.Index([f"{r}:{v}" for r in self.region_index
+				for v in base.col_names] + self._get_flow_names(transport)),
+			row_names=pandas.Index([f"{r}:{v}" for r in self.region_index
+				for v in base.row_names[local]] + ["somersloop"]
+				+ [f"{link.src}->{link.dst}" for link in self.links]),
+		)
+		return ret
+
+	@staticmethod
+	def _get_flow_names(transport: pandas.DataFrame) -> list[str]:
+		ret = [f"{src}->{dst}:{item}" for src, dst, item
+			in transport[["src", "dst", "item"]].itertuples(index=False)]
+		return ret
+
+	def get_block_linear_program(self, region: int) -> LinearProgram:
+		# the pricing problem of a region: the single-region problem with the
+		# region's bounds; its traded rows are relaxed by the capacity of the
+		# links into (imports) and out of (exports) the region, and it keeps
+		# the somersloop limit, so that the region alone is bounded
+		ret = self.base_linear_program.copy()
+		bounds = self.get_region_bounds(region)
+		ret.col_lower = bounds[:, 0]
+		ret.col_upper = bounds[:, 1]
+		transport = self.get_transport_table()
+		for link, src_pos, dst_pos, row_pos, scale in transport[["link",
+			"src_pos", "dst_pos", "row_pos", "scale"]].itertuples(index=False):
+			capacity = self.links[link].capacity / scale
+			if dst_pos == region:
+				ret.row_upper[row_pos] += capacity
+			elif src_pos == region:
+				ret.row_lower[row_pos] -= capacity
+		return ret
+
+	@property
+	def solver(self) -> LinearProgramSolver:
+		# the master problem of the dantzig-wolfe decomposition
+		# rows: the traded item rows of each region, the shared somersloop
+		# row, one convexity row per region, the link capacities
+		# columns: the transport flows, artificial columns for phase 1, then
+		# the proposals added by pricing
+		if self._solver is None:
+			base = self.base_linear_program
+			n_regions = len(self.regions)
+			somersloop = self.constraint_builder.row_index.get_loc("somersloop")
+			transport = self.get_transport_table()
+			n_flows = len(transport)
+			# master positions of the linking rows, per (region, base row)
+			self._linking = dict()
+			linking_rows = list()
+			for r in range(n_regions):
+				for row_pos in self.get_traded_rows(r):
+					self._linking[r, row_pos] = len(linking_rows)
+					linking_rows.append((r, row_pos))
+			n_linking = len(linking_rows) + 1
+			base_rows = numpy.array([i for _, i in linking_rows] + [somersloop],
+				dtype=int)
+			row_lower = numpy.concatenate([base.row_lower[base_rows],
+				numpy.ones(n_regions), numpy.full(len(self.links), -numpy.inf)])
+			row_upper = numpy.concatenate([base.row_upper[base_rows],
+				numpy.ones(n_regions),
+				numpy.array([link.capacity for link in self.links], dtype=float)])
+			n_rows = len(row_lower)
+			# transport flows
+			rows, cols, values = list(), list(), list()
+			for j, (link, src_pos, dst_pos, row_pos, scale) in enumerate(
+				transport[["link", "src_pos", "dst_pos", "row_pos",
+					"scale"]].itertuples(index=False)
+			):
+				rows.extend([self._linking[src_pos, row_pos],
+					self._linking[dst_pos, row_pos], n_linking + n_regions + link])
+				cols.extend([j] * 3)
+				values.extend([1.0, -1.0, scale])
+			# artificial columns on the linking and convexity rows, one per
+			# finite side
+			self._artificial = list()
+			for i in range(n_linking + n_regions):
+				for sign, bound in [(-1.0, row_upper[i]), (1.0, row_lower[i])]:
+					if numpy.isfinite(bound):
+						rows.append(i)
+						cols.append(n_flows + len(self._artificial))
+						values.append(sign)
+						self._artificial.append(n_flows + len(self._artificial))
+			self._artificial = numpy.array(self._artificial, dtype=int)
+			n_cols = n_flows + len(self._artificial)
+			link_cost = numpy.array([link.cost for link in self.links],
+				dtype=float)
+			self._master_costs = numpy.concatenate([
+				link_cost[transport["link"].to_numpy(dtype=int)]
+					* transport["scale"].to_numpy(dtype=float),
+				numpy.zeros(len(self._artificial)),
+			])
+			master = LinearProgram(
+				c=self._master_costs.copy(),
+				A=scipy.sparse.csr_array((values, (rows, cols)),
+					shape=(n_rows, n_cols)),
+				row_lower=row_lower,
+				row_upper=row_upper,
+				col_lower=numpy.zeros(n_cols),
+				col_upper=numpy.full(n_cols, numpy.inf),
+				col_names=pandas.Index(self._get_flow_names(transport)
+					+ [f"artificial{i}" for i in range(len(self._artificial))]),
+				row_names=pandas.Index([f"{self.region_index[r]}:"
+					f"{base.row_names[i]}" for r, i in linking_rows]
+					+ ["somersloop"]
+					+ [f"convexity:{r}" for r in self.region_index]
+					+ [f"{link.src}->{link.dst}" for link in self.links]),
+			)
+			self._solver = LinearProgramSolver(master)
+			# per region: base rows and master rows of its linking rows
+			self._block_linking = list()
+			for r in range(n_regions):
+				traded = self.get_traded_rows(r)
+				self._block_linking.append((
+					numpy.append(traded, somersloop),
+					numpy.array([self._linking[r, i] for i in traded]
+						+ [n_linking - 1], dtype=int),
+				))
+			self._blocks = [LinearProgramSolver(self.get_block_linear_program(r))
+				for r in range(n_regions)]
+			self._proposals = list()
+			self._n_linking = n_linking
+		return self._solver
+
+	def _set_phase(self, phase: int) -> None:
+		# phase 1: minimize the artificial columns; phase 2: the objective,
+		# with the artificial columns fixed at 0
+		master = self.solver
+		if phase == 1:
+			c = numpy.zeros(master.lp.n_cols)
+			c[self._artificial] = 1.0
+			master.set_col_bounds(self._artificial, 0, numpy.inf)
+		else:
+			c = self._master_costs
+			master.set_col_bounds(self._artificial, 0, 0)
+		master.set_objective(c)
+		return
+
+	def _price(self, region: int, row_duals: numpy.ndarray, phase: int,
+	) -> scipy.optimize.OptimizeResult:
+		# the best plan of a region under the master duals; .fun is the
+		# reduced cost of its proposal
+		base = self.base_linear_program
+		base_rows, master_rows = self._block_linking[region]
+		c = base.c if phase == 2 else numpy.zeros(base.n_cols)
+		c = c - base.A[base_rows].T @ row_duals[master_rows]
+		block = self._blocks[region]
+		block.set_objective(c)
+		ret = block.solve()
+		self.stats["pricing_solves"] += 1
+		if ret.success:
+			ret.fun -= row_duals[self._n_linking + region]
+		return ret
+
+	def _add_proposal(self, region: int, x: numpy.ndarray, phase: int,
+	) -> None:
+		base = self.base_linear_program
+		master = self.solver
+		base_rows, master_rows = self._block_linking[region]
+		column = numpy.zeros(master.lp.n_rows)
+		column[master_rows] = base.A[base_rows] @ x
+		column[self._n_linking + region] = 1.0
+		cost = float(base.c @ x)
+		master.add_cols(column[:, None], cost if phase == 2 else 0.0, 0.0,
+			numpy.inf,
+			names=[f"{self.region_index[region]}:plan{len(self._proposals)}"])
+		self._master_costs = numpy.append(self._master_costs, cost)
+		self._proposals.append((region, x.copy()))
+		self.stats["columns_added"] += 1
+		return
+
+	def _solve_dantzig_wolfe(self) -> scipy.optimize.OptimizeResult:
+		master = self.solver
+		n_fixed = master.lp.n_cols - len(self._proposals)
+		phase = 1
+		self._set_phase(phase)
+		nit = 0
+		for _ in range(self.max_rounds):
+			res = master.solve()
+			nit += res.nit
+			self.stats["rounds"] += 1
+			if not res.success:
+				break
+			# lagrangian bound: the master objective plus the reduced costs
+			# of the best proposals
+			bound = res.fun
+			entering = list()
+			for r in range(len(self.regions)):
+				price = self._price(r, res.row_marginals, phase)
+				nit += price.nit
+				if not price.success:
+					res = price
+					res.message = f"region '{self.region_index[r]}': " \
+						f"{price.message}"
+					break
+				bound += min(price.fun, 0.0)
+				if price.fun < -self.tol * max(1.0, abs(res.fun)):
+					entering.append((r, price.x))
+			if not res.success:
+				break
+			gap = self.tol * max(1.0, abs(res.fun))
+			if entering and (res.fun - bound > gap):
+				for r, x in entering:
+					self._add_proposal(r, x, phase)
+				continue
+			if phase == 2:
+				break
+			if res.fun > gap:
+				res.success = False
+				res.status = 2
+				res.message = "the regional problem is infeasible"
+				break
+			phase = 2
+			self._set_phase(phase)
+		else:
+			res.success = False
+			res.status = 1
+			res.message = "dantzig-wolfe round limit reached"
+		res.nit = nit
+		if res.success:
+			res.bound = bound
+			regional_x = numpy.zeros((len(self.regions),
+				self.base_linear_program.n_cols))
+			weights = res.x[n_fixed:]
+			for (r, x), w in zip(self._proposals, weights):
+				regional_x[r] += w * x
+			flows = res.x[:len(self.get_transport_table())]
+			self._set_regional_result(res, regional_x, flows)
+		return res
+
+	def _solve_monolithic(self) -> scipy.optimize.OptimizeResult:
+		lp = self.get_monolithic_linear_program()
+		ret = LinearProgramSolver(lp).solve()
+		ret.lp = lp
+		if ret.success:
+			n_regions = len(self.regions)
+			n = self.base_linear_program.n_cols
+			self._set_regional_result(ret,
+				ret.x[:n_regions * n].reshape(n_regions, n), ret.x[n_regions * n:])
+		return ret
+
+	def _set_regional_result(self, res: scipy.optimize.OptimizeResult,
+		regional_x: numpy.ndarray, flows: numpy.ndarray,
+	) -> None:
+		transport = self.get_transport_table()
+		res.regional_x = pandas.DataFrame(regional_x, index=self.region_index,
+			columns=self.base_linear_program.col_names)
+		res.flows = pandas.DataFrame({
+			"src": transport["src"],
+			"dst": transport["dst"],
+			"item": transport["item"],
+			"rate": flows * transport["scale"].to_numpy(dtype=float),
+		})
+		res.x = regional_x.sum(axis=0)
+		# marginals are over the master (or monolithic) problem
+		for k in ["row_marginals", "reduced_costs", "lower", "upper"]:
+			res.pop(k, None)
+		return
+
+	def _update_apa_counts(self) -> None:
+		# the master and pricing problems are rebuilt
+		self._solver = None
+		self._base_lp = None
+		return
+
+	def calculate(self, *, exit_on_failure: bool = True,
+	) -> scipy.optimize.OptimizeResult:
+		if self.method == "monolithic":
+			res = self._solve_monolithic()
+			lp = res.pop("lp")
+		else:
+			res = self._solve_dantzig_wolfe()
+			lp = self.solver.lp
+		self._accept_result(res, exit_on_failure=exit_on_failure, lp=lp)
+		return res
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import os
+
+import numpy
+import pandas
+
+
+class ResultStore(object):
+	# columnar store of the scalar results of a sweep, one row per point, as
+	# a numpy .npz file with one array per column; columns are loaded only
+	# when read, e.g. only the objective for plotting, without the solutions
+	# and coef matrices of the full result archive
+	# columns are numeric or boolean; labels are stored as strings
+	# RESULT_COLUMNS are the scalars of a SweepCheckpoint.encode_result()
+	# record
+	RESULT_COLUMNS = ["success", "status", "fun", "nit"]
+
+	def __init__(self, fname: str) -> None:
+		self.fname = fname
+		return
+
+	@staticmethod
+	def write(fname: str, df: pandas.DataFrame) -> None:
+		# replaces fname atomically; the index is not stored
+		columns = dict()
+		for name, column in df.items():
+			values = column.to_numpy()
+			if values.dtype == object:
+				values = values.astype(str)
+			columns[str(name)] = values
+		if os.path.dirname(fname):
+			os.makedirs(os.path.dirname(fname), exist_ok=True)
+		with open(fname + ".tmp", "wb") as fp:
+			numpy.savez(fp, **columns)
+		os.replace(fname + ".tmp", fname)
+		return
+
+	@classmethod
+	def result_values(cls, record: dict) -> list:
+		# RESULT_COLUMNS of a checkpoint record; fun is NaN without a solution
+		ret = [record["success"], record["status"],
+			numpy.nan if record["fun"] is None else record["fun"],
+			record["nit"]]
+		return ret
+
+	@property
+	def columns(self) -> list[str]:
+		with numpy.load(self.fname) as npz:
+			ret = list(npz.files)
+		return ret
+
+	def read(self, columns: list[str] = None) -> pandas.DataFrame:
+		# columns: by default all
+		with numpy.load(self.fname) as npz:
+			if columns is None:
+				columns = list(npz.files)
+			missing = [c for c in columns if c not in npz.files]
+			if missing:
+				raise KeyError(f"columns not in '{self.fname}': {missing}")
+			ret = pandas.DataFrame({c: npz[c] for c in columns})
+		return ret
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import hashlib
+import json
+from typing import Self
+
+import scipy.optimize
+
+from .elements import ClockSpeed
+from .logistics import LogisticsLimits
+from .objective_calculator import ObjectiveCalculator
+from .production_calculator import ProductionCalculator
+from .recipe_matrix import RecipeMatrix
+from .target_production_calculator import TargetProductionCalculator
+
+
+@dataclasses.dataclass(frozen=True)
+class Scenario(object):
+	# a small, hashable description of one calculation
+	# scenarios sharing .model_key share the same recipe matrix
+	dataset: str = "curated/recipe_dataset.en-US.json"
+	production_clock_speed: int = 250
+	resource_extraction_clock_speed: int = 250
+	enable_somersloop_amplification: bool = False
+	enable_resource_conversion: bool = False
+	unfueled_apa_count: int = 0
+	fueled_apa_count: int = 0
+	# objective, used by ObjectiveCalculator
+	objective: str = "raw_power"
+	maximize: bool = True
+	waste_free: bool = True
+	extra_eq_items: tuple[str, ...] = ()
+	# if set, solve a target production with TargetProductionCalculator
+	# instead, as sorted (itemclass, rate/min) pairs
+	demand: tuple[tuple[str, float], ...] = None
+	# if set, belt and pipe limits as (belt_tier, pipe_tier,
+	# limit_node_extraction), see LogisticsLimits
+	logistics: tuple[int, int, bool] = None
+
+	@classmethod
+	def from_dict(cls, d: dict) -> Self:
+		fields = {f.name for f in dataclasses.fields(cls)}
+		if (unknown := set(d.keys()) - fields):
+			raise ValueError(f"unknown scenario fields: {sorted(unknown)}")
+		d = dict(d)
+		if "extra_eq_items" in d:
+			d["extra_eq_items"] = tuple(d["extra_eq_items"])
+		if d.get("demand") is not None:
+			demand = d["demand"]
+			if isinstance(demand, dict):
+				demand = demand.items()
+			d["demand"] = tuple(sorted((str(k), float(v)) for k, v in demand))
+		if d.get("logistics") is not None:
+			logistics = d["logistics"]
+			if isinstance(logistics, dict):
+				logistics = LogisticsLimits(**logistics)
+			else:
+				logistics = LogisticsLimits(*logistics)
+			d["logistics"] = dataclasses.astuple(logistics)
+		ret = cls(**d)
+		return ret
+
+	def to_dict(self) -> dict:
+		ret = dataclasses.asdict(self)
+		ret["extra_eq_items"] = list(self.extra_eq_items)
+		if self.demand is not None:
+			ret["demand"] = dict(self.demand)
+		# omitted if not set, so that digests and cache keys of scenarios
+		# without logistics limits are those from before the field existed
+		if self.logistics is None:
+			del ret["logistics"]
+		else:
+			ret["logistics"] = dataclasses.asdict(self.get_logistics_limits())
+		return ret
+
+	@property
+	def digest(self) -> str:
+		# stable content hash, e.g. as a key in result stores
+		s = json.dumps(self.to_dict(), sort_keys=True)
+		return hashlib.sha256(s.encode("utf-8")).hexdigest()[:16]
+
+	@property
+	def model_key(self) -> tuple:
+		ret = (self.dataset, int(self.production_clock_speed),
+			int(self.resource_extraction_clock_speed),
+			bool(self.enable_somersloop_amplification))
+		return ret
+
+	@property
+	def calculator_key(self) -> tuple:
+		# everything except the demand values, which can change without
+		# recompiling; but target production uses a different calculator
+		ret = dataclasses.astuple(dataclasses.replace(self, demand=None)) \
+			+ (self.demand is not None,)
+		return ret
+
+	@property
+	def solver_key(self) -> tuple:
+		# .calculator_key without the APA counts, which a calculator built by
+		# .build_calculator() can change in place by .set_apa_counts()
+		ret = dataclasses.replace(self, unfueled_apa_count=0,
+			fueled_apa_count=0).calculator_key
+		return ret
+
+	def get_logistics_limits(self) -> LogisticsLimits | None:
+		if self.logistics is None:
+			return None
+		return LogisticsLimits(*self.logistics)
+
+	def build_recipe_matrix(self) -> RecipeMatrix:
+		ret = RecipeMatrix.from_curated_recipe_dataset_json(self.dataset,
+			production_clock_speed=ClockSpeed(self.production_clock_speed),
+			resource_extraction_clock_speed=ClockSpeed(
+				self.resource_extraction_clock_speed),
+			with_somersloop=self.enable_somersloop_amplification,
+		)
+		return ret
+
+	def build_calculator(self, recipe_matrix: RecipeMatrix = None,
+	) -> ProductionCalculator:
+		# the recipe matrix is copied, so it can be shared by many scenarios
+		if recipe_matrix is None:
+			recipe_matrix = self.build_recipe_matrix()
+		kw = dict(
+			enable_resource_conversion=self.enable_resource_conversion,
+			enable_somersloop_amplification=self.enable_somersloop_amplification,
+			unfueled_apa_count=self.unfueled_apa_count,
+			fueled_apa_count=self.fueled_apa_count,
+			logistics=self.get_logistics_limits(),
+		)
+		if self.demand is not None:
+			ret = TargetProductionCalculator(recipe_matrix.copy(), **kw)
+		else:
+			ret = ObjectiveCalculator(recipe_matrix.copy(),
+				objective=self.objective,
+				maximize=self.maximize,
+				waste_free=self.waste_free,
+				extra_eq_items=self.extra_eq_items,
+				**kw,
+			)
+		return ret
+
+	def calculate(self, calculator: ProductionCalculator, *,
+		exit_on_failure: bool = True,
+	) -> scipy.optimize.OptimizeResult:
+		# run the calculator built by .build_calculator()
+		if self.demand is not None:
+			ret = calculator.calculate(dict(self.demand),
+				exit_on_failure=exit_on_failure)
+		else:
+			ret = calculator.calculate(exit_on_failure=exit_on_failure)
+		return ret
+
+	def objective_value(self, res: scipy.optimize.OptimizeResult) -> float:
+		# objective in its natural sign, e.g. raw power in MW
+		if (res.fun is None) or (self.maximize and self.demand is None):
+			ret = None if res.fun is None else -res.fun
+		else:
+			ret = res.fun
+		return ret
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+import collections
+import concurrent.futures
+import dataclasses
+import functools
+import hashlib
+import io
+import itertools
+import json
+import os
+import sys
+import tomllib
+from typing import Self
+
+import numpy
+import pandas
+
+from .pareto_frontier_calculator import ParetoFrontierCalculator
+from .production_calculator import ProductionCalculator
+from .recipe_matrix import RecipeMatrix
+from .scenario import Scenario
+
+
+@dataclasses.dataclass(frozen=True)
+class ScenarioRun(object):
+	# one grid point of a scenario file, with its output paths
+	# kind "report": the calculator report of the scenario
+	# kind "pareto": the pareto frontier between .objectives
+	name: str
+	scenario: Scenario
+	kind: str = "report"
+	objectives: tuple[str, ...] = ()
+	report: str = None  # report path
+	result: str = None  # structured result path, json
+
+	@property
+	def key(self) -> str:
+		# cache key, changes with the run, the dataset contents and the
+		# calc_lib sources
+		s = json.dumps([self.kind, list(self.objectives),
+			self.scenario.to_dict(), _file_digest(self.scenario.dataset),
+			_code_digest()], sort_keys=True)
+		return hashlib.sha256(s.encode("utf-8")).hexdigest()[:32]
+
+
+@functools.cache
+def _file_digest(fname: str) -> str:
+	with open(fname, "rb") as fp:
+		return hashlib.file_digest(fp, "sha256").hexdigest()
+
+
+@functools.cache
+def _code_digest() -> str:
+	# digest of the calc_lib sources, so that cached results of an older
+	# version are calculated again
+	package_dir = os.path.dirname(os.path.abspath(__file__))
+	h = hashlib.sha256()
+	for fname in sorted(os.listdir(package_dir)):
+		if fname.endswith(".py"):
+			h.update(fname.encode("utf-8") + b"\0")
+			h.update(bytes.fromhex(_file_digest(os.path.join(package_dir,
+				fname))))
+	return h.hexdigest()
+
+
+def _build_calculator(run: ScenarioRun, recipe_matrix: RecipeMatrix,
+) -> ProductionCalculator:
+	scenario = run.scenario
+	if run.kind == "pareto":
+		ret = ParetoFrontierCalculator(recipe_matrix.copy(),
+			objectives=run.objectives or ("raw_power", "points_gain_rate"),
+			waste_free=scenario.waste_free,
+			extra_eq_items=scenario.extra_eq_items,
+			enable_resource_conversion=scenario.enable_resource_conversion,
+			enable_somersloop_amplification=scenario.enable_somersloop_amplification,
+			unfueled_apa_count=scenario.unfueled_apa_count,
+			fueled_apa_count=scenario.fueled_apa_count,
+			logistics=scenario.get_logistics_limits(),
+		)
+	else:
+		ret = scenario.build_calculator(recipe_matrix)
+	return ret
+
+
+def _execute(run: ScenarioRun, recipe_matrix: RecipeMatrix) -> dict:
+	# the outputs of one run: report text and structured result
+	calculator = _build_calculator(run, recipe_matrix)
+	fp = io.StringIO()
+	ret = {"name": run.name, "scenario": run.scenario.to_dict(),
+		"digest": run.scenario.digest, "kind": run.kind}
+	if run.kind == "pareto":
+		frontier = calculator.calculate(exit_on_failure=False)
+		ret["success"] = bool(frontier)
+		ret["objectives"] = list(calculator.objectives)
+		ret["points"] = [{"values": [float(v) for v in p.values],
+			"weights": [float(w) for w in p.weights]} for p in frontier]
+		if frontier:
+			calculator.report_frontier(fp)
+	else:
+		res = run.scenario.calculate(calculator, exit_on_failure=False)
+		ret["success"] = bool(res.success)
+		ret["status"] = int(res.status)
+		ret["message"] = str(res.message)
+		ret["objective"] = run.scenario.objective_value(res)
+		if res.success:
+			calculator.report(fp)
+			pos = numpy.flatnonzero(res.x > 1e-8)
+			ret["x"] = {str(calculator.recipe_matrix.coef_matrix.index[i]):
+				float(res.x[i]) for i in pos}
+	ret["report"] = fp.getvalue()
+	return ret
+
+
+def _execute_group(runs: list[ScenarioRun]) -> list[dict]:
+	# runs sharing one recipe matrix, built once; also the worker entry
+	recipe_matrix = runs[0].scenario.build_recipe_matrix()
+	ret = [_execute(run, recipe_matrix) for run in runs]
+	return ret
+
+
+class ScenarioRunner(object):
+	# run the grid of a TOML scenario file, e.g. to regenerate output/:
+	#
+	#   [defaults]            # scenario fields shared by all runs
+	#   locale = "zh-Hans"    # shorthand of dataset
+	#   enable_resource_conversion = true
+	#
+	#   [[run]]
+	#   name = "max_point"
+	#   objective = "points_gain_rate"   # scenario fields of this run
+	#   report = "output/calc.max_point.oc_{production_clock_speed}.{sloop}.txt"
+	#   result = "..."                   # optional, json
+	#   [run.axes]
+	#   production_clock_speed = [1, 100, 250]   # values of one field
+	#   sloop = [                                # or sets of fields, labeled
+	#     {label = "wo_sloop", enable_somersloop_amplification = false},
+	#     {label = "with_sloop", enable_somersloop_amplification = true},
+	#   ]
+	#
+	# the grid of a run is the product of its axes; output paths are
+	# formatted with the scenario fields and the axis labels
+	# max_apa_count: optional, grid points with more APAs in total are left
+	# out, e.g. for an axis of each APA count
+	# runs sharing a recipe matrix (Scenario.model_key) are run together, so
+	# each matrix is built once; groups run in parallel with max_workers > 1
+	# outputs are cached in cache_dir by run and dataset contents; files are
+	# only written if changed
+	RUN_KEYS = ("name", "kind", "objectives", "report", "result", "axes",
+		"max_apa_count")
+	KINDS = ("report", "pareto")
+
+	def __init__(self, runs: list[ScenarioRun], *, max_workers: int = 1,
+		cache_dir: str = None,
+	) -> None:
+		self.runs = list(runs)
+		self.max_workers = max_workers
+		self.cache_dir = cache_dir
+		self.stats = collections.Counter()
+		return
+
+	@classmethod
+	def from_toml(cls, fname: str, **kw) -> Self:
+		with open(fname, "rb") as fp:
+			config = tomllib.load(fp)
+		ret = cls(cls.expand(config), **kw)
+		return ret
+
+	@staticmethod
+	def _scenario_fields(d: dict) -> dict:
+		d = dict(d)
+		if "locale" in d:
+			d["dataset"] = f"curated/recipe_dataset.{d.pop('locale')}.json"
+		return d
+
+	@classmethod
+	def expand(cls, config: dict) -> list[ScenarioRun]:
+		if (unknown := set(config.keys()) - {"defaults", "run"}):
+			raise ValueError(f"unknown sections: {sorted(unknown)}")
+		defaults = cls._scenario_fields(config.get("defaults", dict()))
+		ret = list()
+		for i, run in enumerate(config.get("run", list())):
+			name = run.get("name", f"run{i}")
+			kind = run.get("kind", "report")
+			if kind not in cls.KINDS:
+				raise ValueError(f"run '{name}': unknown kind '{kind}'")
+			fields = dict(defaults)
+			fields.update(cls._scenario_fields({k: v for k, v in run.items()
+				if k not in cls.RUN_KEYS}))
+			# each axis is a list of (axis, label, scenario fields)
+			axes = list()
+			for axis, values in run.get("axes", dict()).items():
+				points = list()
+				for v in values:
+					if isinstance(v, dict):
+						v = dict(v)
+						label = str(v.pop("label", len(points)))
+						points.append((axis, label, cls._scenario_fields(v)))
+					else:
+						points.append((axis, str(v),
+							cls._scenario_fields({axis: v})))
+				axes.append(points)
+			for point in itertools.product(*axes):
+				d = dict(fields)
+				labels = dict()
+				for axis, label, overrides in point:
+					d.update(overrides)
+					labels[axis] = label
+				scenario = Scenario.from_dict(d)
+				if ("max_apa_count" in run) and (scenario.unfueled_apa_count
+					+ scenario.fueled_apa_count > run["max_apa_count"]):
+					continue
+				names = scenario.to_dict()
+				names.update(labels)
+				ret.append(ScenarioRun(
+					name=name,
+					scenario=scenario,
+					kind=kind,
+					objectives=tuple(run.get("objectives", ())),
+					report=run["report"].format(**names) if "report" in run
+						else None,
+					result=run["result"].format(**names) if "result" in run
+						else None,
+				))
+		return ret
+
+	def _cache_path(self, run: ScenarioRun) -> str:
+		return os.path.join(self.cache_dir, run.key + ".json")
+
+	def _load_cached(self, run: ScenarioRun) -> dict | None:
+		if self.cache_dir is None:
+			return None
+		path = self._cache_path(run)
+		if not os.path.exists(path):
+			return None
+		with open(path, "r") as fp:
+			return json.load(fp)
+
+	def _store_cached(self, run: ScenarioRun, output: dict) -> None:
+		if self.cache_dir is None:
+			return
+		os.makedirs(self.cache_dir, exist_ok=True)
+		path = self._cache_path(run)
+		with open(path + ".tmp", "w") as fp:
+			json.dump(output, fp)
+		os.replace(path + ".tmp", path)
+		return
+
+	def _write_file(self, fname: str, content: str) -> None:
+		# only if changed, so that unchanged outputs keep their mtime
+		if os.path.exists(fname):
+			with open(fname, "r") as fp:
+				if fp.read() == content:
+					self.stats["unchanged"] += 1
+					return
+		if os.path.dirname(fname):
+			os.makedirs(os.path.dirname(fname), exist_ok=True)
+		with open(fname, "w") as fp:
+			fp.write(content)
+		self.stats["written"] += 1
+		return
+
+	def _write_outputs(self, run: ScenarioRun, output: dict) -> None:
+		if not output["success"]:
+			print(f"warning: run '{run.name}' ({run.report or run.result}) "
+				"failed", file=sys.stderr)
+		if run.report and output["report"]:
+			self._write_file(run.report, output["report"])
+		if run.result:
+			result = {k: v for k, v in output.items() if k != "report"}
+			self._write_file(run.result, json.dumps(result, indent="\t") + "\n")
+		return
+
+	def run(self, *, force: bool = False) -> pandas.DataFrame:
+		# force: ignore cached outputs
+		# returns one row per run: name, report, result, success, objective,
+		# cached
+		outputs = dict()
+		from_cache = set()
+		pending = collections.defaultdict(list)
+		for i, run in enumerate(self.runs):
+			cached = None if force else self._load_cached(run)
+			if cached is not None:
+				outputs[i] = cached
+				from_cache.add(i)
+				self.stats["cached"] += 1
+			else:
+				pending[run.scenario.model_key].append(i)
+		groups = list(pending.values())
+		self.stats["matrices"] += len(groups)
+		if (self.max_workers > 1) and (len(groups) > 1):
+			with concurrent.futures.ProcessPoolExecutor(self.max_workers) as pool:
+				futures = {pool.submit(_execute_group,
+					[self.runs[i] for i in group]): group for group in groups}
+				for future in concurrent.futures.as_completed(futures):
+					self._accept_group(futures[future], future.result(), outputs)
+		else:
+			for group in groups:
+				self._accept_group(group,
+					_execute_group([self.runs[i] for i in group]), outputs)
+		records = list()
+		for i, run in enumerate(self.runs):
+			output = outputs[i]
+			self._write_outputs(run, output)
+			records.append((run.name, run.report, run.result, output["success"],
+				output.get("objective"), i in from_cache))
+		ret = pandas.DataFrame(records, columns=["name", "report", "result",
+			"success", "objective", "cached"])
+		return ret
+
+	def _accept_group(self, group: list[int], results: list[dict],
+		outputs: dict,
+	) -> None:
+		for i, output in zip(group, results):
+			outputs[i] = output
+			self._store_cached(self.runs[i], output)
+			self.stats["solved"] += 1
+		return
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+from typing import Iterable
+
+import numpy
+import pandas
+import scipy.optimize
+
+
+class SweepCheckpoint(object):
+	# append-only checkpoint of a sweep, one json line per finished point:
+	#   {"key": <key>, "value": <value>}
+	# keys are json values (tuples are stored as lists), compared by their
+	# canonical json; values are any json values, e.g. encode_result()
+	# each line is written with a single O_APPEND write and synced, so that a
+	# crash loses at most the point being written; a truncated last line is
+	# dropped when the checkpoint is opened again
+	# shards of the same sweep, e.g. from different machines, can be merged
+	def __init__(self, fname: str, *, resume: bool = True,
+		retry_failed: bool = True,
+	) -> None:
+		# resume: load completed points from fname, otherwise start over
+		# retry_failed: do not load failed results (encode_result() records
+		#   with success false), so that their points are calculated again,
+		#   e.g. after a transient failure; a new record supersedes the old one
+		self.fname = fname
+		self.retry_failed = retry_failed
+		self._records: dict[str, object] = dict()
+		if resume and os.path.exists(fname):
+			self._load()
+		else:
+			if os.path.dirname(fname):
+				os.makedirs(os.path.dirname(fname), exist_ok=True)
+			with open(fname, "w"):
+				pass
+		return
+
+	@staticmethod
+	def canonical_key(key) -> str:
+		return json.dumps(key, sort_keys=True, separators=(",", ":"))
+
+	def _load(self) -> None:
+		valid_size = 0
+		with open(self.fname, "rb") as fp:
+			for line in fp:
+				if not line.endswith(b"\n"):
+					break
+				try:
+					record = json.loads(line)
+				except ValueError:
+					break
+				valid_size += len(line)
+				key, value = self.canonical_key(record["key"]), record["value"]
+				if self.retry_failed and isinstance(value, dict) \
+					and (value.get("success") is False):
+					self._records.pop(key, None)
+					continue
+				self._records[key] = value
+		if valid_size < os.path.getsize(self.fname):
+			print(f"warning: dropped a truncated record at the end of "
+				f"'{self.fname}'", file=sys.stderr)
+			os.truncate(self.fname, valid_size)
+		return
+
+	def __len__(self) -> int:
+		return len(self._records)
+
+	def __contains__(self, key) -> bool:
+		return self.canonical_key(key) in self._records
+
+	def get(self, key, default=None):
+		return self._records.get(self.canonical_key(key), default)
+
+	def items(self) -> Iterable[tuple[object, object]]:
+		# keys as loaded from json, i.e. tuples are lists
+		for key, value in self._records.items():
+			yield json.loads(key), value
+		return
+
+	def append(self, key, value) -> None:
+		line = json.dumps({"key": key, "value": value},
+			separators=(",", ":")) + "\n"
+		fd = os.open(self.fname, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+		try:
+			os.write(fd, line.encode("utf-8"))
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+		self._records[self.canonical_key(key)] = value
+		return
+
+	def merge(self, shard_fnames: Iterable[str]) -> int:
+		# append the points of other checkpoint files not yet in this one;
+		# returns the number of points added; missing shards are an error,
+		# not an empty shard
+		ret = 0
+		for fname in shard_fnames:
+			if not os.path.exists(fname):
+				raise FileNotFoundError(f"checkpoint shard not found: '{fname}'")
+			shard = SweepCheckpoint(fname)
+			for key, value in shard.items():
+				if key in self:
+					if self.get(key) != value:
+						print(f"warning: point {self.canonical_key(key)} differs "
+							f"in '{fname}', kept the existing one", file=sys.stderr)
+					continue
+				self.append(key, value)
+				ret += 1
+		return ret
+
+	@staticmethod
+	def encode_result(res: scipy.optimize.OptimizeResult,
+		row_labels: pandas.Index, *, tol: float = 1e-12,
+	) -> dict:
+		# a compact json record of a calculation result; x is kept as
+		# {row label: value} of its non-zero values
+		ret = {
+			"success": bool(res.success),
+			"status": int(res.status),
+			"message": str(res.message),
+			"fun": None if res.fun is None else float(res.fun),
+			"nit": int(res.get("nit", 0)),
+		}
+		if res.x is not None:
+			pos = numpy.flatnonzero(numpy.abs(res.x) > tol)
+			ret["x"] = {str(row_labels[i]): float(res.x[i]) for i in pos}
+		return ret
+
+	@staticmethod
+	def decode_result(record: dict, row_labels: pandas.Index,
+	) -> scipy.optimize.OptimizeResult:
+		# inverse of encode_result(), x over row_labels
+		x = None
+		if "x" in record:
+			x = pandas.Series(record["x"], dtype=float).reindex(row_labels,
+				fill_value=0.0).to_numpy()
+		ret = scipy.optimize.OptimizeResult(
+			x=x,
+			fun=record["fun"],
+			success=record["success"],
+			status=record["status"],
+			message=record["message"],
+			nit=record["nit"],
+		)
+		return ret
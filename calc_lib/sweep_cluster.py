@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+
+import asyncio
+import collections
+import hashlib
+import json
+import pickle
+import socket
+import sys
+import threading
+import time
+from typing import Iterable
+
+from .recipe_matrix import RecipeMatrix
+from .scenario import Scenario
+from .sweep_checkpoint import SweepCheckpoint
+
+
+class SweepCoordinator(object):
+	# distributes the points of sweeps to SweepWorker processes over tcp, and
+	# stores their results in the checkpoint of each sweep
+	# the protocol is newline-delimited json, requests by the workers:
+	#   {"op": "hello"}                -> {"worker": <id>, "heartbeat": <s>}
+	#   {"op": "work", "n": <n>}       -> {"tasks": [{"id", "model",
+	#                                       "scenario"}, ...]}
+	#                                     or {"tasks": [], "wait": <s>}
+	#                                     or {"done": true}
+	#   {"op": "model", "model": <digest>}
+	#                                  -> {"model": <digest>, "size": <n>},
+	#                                     followed by n bytes of the pickled
+	#                                     recipe matrix
+	#   {"op": "result", "id", "value"}  -> {}, value as encode_result()
+	#   {"op": "heartbeat"}            -> {}
+	# any response may carry "cancel": ids of tasks of the worker finished
+	# elsewhere, which it may skip
+	# models are compiled once by the coordinator and identified by the
+	# sha256 of their pickle, so workers fetch each one once
+	# workers pickle.loads() the models of the coordinator, which can run
+	# any code it sends: only start workers for a trusted coordinator, on a
+	# trusted network; the sha256 is checked against the digest sent by the
+	# same coordinator, so it only detects corruption, not tampering
+	# idle workers pull tasks; when none are queued, they take a copy of a
+	# task outstanding on another worker (work stealing), and the first
+	# result wins
+	# workers send heartbeats while solving; the tasks of a worker silent for
+	# longer than heartbeat_timeout, or disconnected, are dispatched again,
+	# and the worker is dropped until it says hello again
+	class _WorkerState(object):
+		def __init__(self, worker_id: int, writer: asyncio.StreamWriter,
+		) -> None:
+			self.id = worker_id
+			self.writer = writer
+			self.last_seen = time.monotonic()
+			self.tasks = set()
+			self.cancel = set()
+			self.alive = True
+			# a request is being answered, e.g. waiting for a model to compile
+			self.busy = False
+			return
+
+	def __init__(self, *, heartbeat_timeout: float = 30.0) -> None:
+		self.heartbeat_timeout = heartbeat_timeout
+		self._checkpoints: list[SweepCheckpoint] = list()
+		# task id -> (checkpoint, key, scenario)
+		self._tasks: dict[str, tuple[SweepCheckpoint, object, Scenario]] = \
+			dict()
+		self._queue = collections.deque()
+		self._done = set()
+		# task id -> ids of the workers it is dispatched to
+		self._owners: dict[str, set[int]] = dict()
+		self._workers: dict[int, "_WorkerState"] = dict()
+		self._n_workers = 0
+		# model key -> future of the digest; digest -> pickled recipe matrix
+		self._digests: dict[tuple, asyncio.Future] = dict()
+		self._blobs: dict[str, bytes] = dict()
+		self._finished: asyncio.Event = None
+		self.address: tuple = None
+		self.stats = collections.Counter()
+		return
+
+	def add_sweep(self, points: Iterable[tuple[object, Scenario]],
+		checkpoint: SweepCheckpoint,
+	) -> int:
+		# (key, scenario) points not in the checkpoint yet; returns their
+		# number
+		ret = 0
+		if not any(c is checkpoint for c in self._checkpoints):
+			self._checkpoints.append(checkpoint)
+		sweep = [c is checkpoint for c in self._checkpoints].index(True)
+		for key, scenario in points:
+			if key in checkpoint:
+				continue
+			task_id = f"{sweep}:{SweepCheckpoint.canonical_key(key)}"
+			if task_id in self._tasks:
+				continue
+			self._tasks[task_id] = (checkpoint, key, scenario)
+			self._queue.append(task_id)
+			ret += 1
+		return ret
+
+	@property
+	def n_remaining(self) -> int:
+		return len(self._tasks) - len(self._done)
+
+	def run(self, *, host: str = "127.0.0.1", port: int = 0) -> None:
+		# blocking, until all tasks are done
+		asyncio.run(self.serve(host=host, port=port))
+		return
+
+	async def serve(self, *, host: str = "127.0.0.1", port: int = 0) -> None:
+		# port 0 picks a free port, see .address
+		self._finished = asyncio.Event()
+		if not self.n_remaining:
+			return
+		server = await asyncio.start_server(self._on_client, host=host,
+			port=port)
+		self.address = server.sockets[0].getsockname()[:2]
+		print(f"sweep coordinator listening on {self.address}, "
+			f"{self.n_remaining} tasks", file=sys.stderr)
+		monitor = asyncio.create_task(self._monitor())
+		async with server:
+			await self._finished.wait()
+			# let connected workers receive "done"
+			deadline = time.monotonic() + self.heartbeat_timeout
+			while any(w.alive for w in self._workers.values()) \
+				and (time.monotonic() < deadline):
+				await asyncio.sleep(0.05)
+			monitor.cancel()
+		return
+
+	async def _monitor(self) -> None:
+		while True:
+			await asyncio.sleep(self.heartbeat_timeout / 4)
+			now = time.monotonic()
+			for worker in list(self._workers.values()):
+				if worker.alive and (not worker.busy) and (now - worker.last_seen
+					> self.heartbeat_timeout):
+					print(f"warning: worker {worker.id} timed out",
+						file=sys.stderr)
+					self.stats["timed_out"] += 1
+					self._drop(worker)
+					worker.writer.close()
+		return
+
+	def _drop(self, worker: "_WorkerState") -> None:
+		# dispatch the unfinished tasks of the worker again
+		if not worker.alive:
+			return
+		worker.alive = False
+		for task_id in worker.tasks:
+			owners = self._owners.get(task_id, set())
+			owners.discard(worker.id)
+			if (not owners) and (task_id not in self._done):
+				self._queue.appendleft(task_id)
+				self.stats["redispatched"] += 1
+		worker.tasks.clear()
+		return
+
+	async def _on_client(self, reader: asyncio.StreamReader,
+		writer: asyncio.StreamWriter,
+	) -> None:
+		# requests of a worker are sequential
+		worker = None
+		try:
+			while (line := await reader.readline()):
+				request = json.loads(line)
+				if request.get("op") == "hello":
+					self._n_workers += 1
+					worker = self._WorkerState(self._n_workers, writer)
+					self._workers[worker.id] = worker
+					response, blob = {"worker": worker.id,
+						"heartbeat": self.heartbeat_timeout / 3}, None
+				elif (worker is None) or (not worker.alive):
+					response, blob = {"error": "not registered"}, None
+				else:
+					worker.busy = True
+					try:
+						response, blob = await self._dispatch(worker, request)
+					finally:
+						worker.busy = False
+						worker.last_seen = time.monotonic()
+					if worker.cancel:
+						response["cancel"] = sorted(worker.cancel)
+						worker.cancel.clear()
+				writer.write(json.dumps(response).encode("utf-8") + b"\n")
+				if blob is not None:
+					writer.write(blob)
+				await writer.drain()
+		except (ConnectionError, ValueError) as e:
+			print(f"warning: worker connection failed: {e}", file=sys.stderr)
+		finally:
+			if worker is not None:
+				self._drop(worker)
+			writer.close()
+		return
+
+	async def _dispatch(self, worker: "_WorkerState", request: dict,
+	) -> tuple[dict, bytes | None]:
+		op = request.get("op")
+		self.stats[f"op_{op}"] += 1
+		if op == "heartbeat":
+			return dict(), None
+		if op == "result":
+			self._accept_result(worker, request["id"], request["value"])
+			return dict(), None
+		if op == "model":
+			if request["model"] not in self._blobs:
+				raise ValueError(f"unknown model: {request['model']}")
+			blob = self._blobs[request["model"]]
+			return {"model": request["model"], "size": len(blob)}, blob
+		if op == "work":
+			if not self.n_remaining:
+				return {"done": True}, None
+			tasks = list()
+			for task_id in self._next_tasks(worker, int(request.get("n", 1))):
+				_, _, scenario = self._tasks[task_id]
+				tasks.append({"id": task_id,
+					"model": await self._get_digest(scenario),
+					"scenario": scenario.to_dict()})
+			if not tasks:
+				return {"tasks": [], "wait": 0.5}, None
+			return {"tasks": tasks}, None
+		raise ValueError(f"unknown op: {op}")
+
+	def _next_tasks(self, worker: "_WorkerState", n: int) -> list[str]:
+		ret = list()
+		while self._queue and (len(ret) < n):
+			task_id = self._queue.popleft()
+			if (task_id not in self._done) and (task_id not in worker.tasks):
+				ret.append(task_id)
+		if not ret:
+			# steal the oldest outstanding tasks, each at most once
+			for task_id, owners in self._owners.items():
+				if len(ret) >= n:
+					break
+				if (task_id not in self._done) and (len(owners) == 1) \
+					and (worker.id not in owners):
+					ret.append(task_id)
+					self.stats["stolen"] += 1
+		for task_id in ret:
+			self._owners.setdefault(task_id, set()).add(worker.id)
+			worker.tasks.add(task_id)
+		self.stats["dispatched"] += len(ret)
+		return ret
+
+	def _accept_result(self, worker: "_WorkerState", task_id: str,
+		value: dict,
+	) -> None:
+		worker.tasks.discard(task_id)
+		if (task_id not in self._tasks) or (task_id in self._done):
+			self.stats["duplicate"] += 1
+			return
+		checkpoint, key, _ = self._tasks[task_id]
+		checkpoint.append(key, value)
+		self._done.add(task_id)
+		self.stats["finished"] += 1
+		for owner in self._owners.pop(task_id, set()) - {worker.id}:
+			other = self._workers[owner]
+			other.tasks.discard(task_id)
+			other.cancel.add(task_id)
+		if not self.n_remaining:
+			self._finished.set()
+		return
+
+	async def _get_digest(self, scenario: Scenario) -> str:
+		# compiles the recipe matrix of a model key once, off the event loop
+		key = scenario.model_key
+		if key not in self._digests:
+			loop = asyncio.get_running_loop()
+			self._digests[key] = loop.run_in_executor(None, self._compile,
+				scenario)
+		ret = await asyncio.shield(self._digests[key])
+		return ret
+
+	def _compile(self, scenario: Scenario) -> str:
+		blob = pickle.dumps(scenario.build_recipe_matrix(),
+			protocol=pickle.HIGHEST_PROTOCOL)
+		ret = hashlib.sha256(blob).hexdigest()
+		self._blobs[ret] = blob
+		self.stats["compiled"] += 1
+		return ret
+
+
+class SweepWorker(object):
+	# solves the tasks of a SweepCoordinator until the sweeps are done
+	# recipe matrices are fetched once per digest; calculators are cached by
+	# Scenario.solver_key, in LRU order; the points of a key (e.g. of an APA
+	# grid) only change the APA counts of the compiled problem in place
+	# a worker dropped by the coordinator (e.g. stalled past the heartbeat
+	# timeout by gc or swap) or disconnected connects and says hello again,
+	# keeping its models and calculators; results not sent yet are sent then
+	def __init__(self, host: str, port: int, *, chunksize: int = 1,
+		max_calculators: int = 16, connect_timeout: float = 30.0,
+	) -> None:
+		self.host = host
+		self.port = port
+		self.chunksize = chunksize
+		self.max_calculators = max_calculators
+		self.connect_timeout = connect_timeout
+		self._models: dict[str, RecipeMatrix] = dict()
+		self._calculators = collections.OrderedDict()
+		self._cancel = set()
+		# (task id, value) of results not sent yet
+		self._unsent: list[tuple[str, dict]] = list()
+		self._lock = threading.Lock()
+		self._sock: socket.socket = None
+		self._fp = None
+		self.stats = collections.Counter()
+		return
+
+	def _connect(self) -> None:
+		# the coordinator may not be listening yet
+		deadline = time.monotonic() + self.connect_timeout
+		while True:
+			try:
+				self._sock = socket.create_connection((self.host, self.port))
+				break
+			except ConnectionRefusedError:
+				if time.monotonic() > deadline:
+					raise
+				time.sleep(0.2)
+		self._fp = self._sock.makefile("rb")
+		return
+
+	def _request(self, request: dict) -> tuple[dict, bytes | None]:
+		with self._lock:
+			self._sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+			line = self._fp.readline()
+			if not line:
+				raise ConnectionError("coordinator closed the connection")
+			response = json.loads(line)
+			blob = self._fp.read(response["size"]) if "size" in response \
+				else None
+		if response.get("error") == "not registered":
+			# dropped by the coordinator, e.g. after a missed heartbeat
+			raise ConnectionError("coordinator: not registered")
+		if "error" in response:
+			raise RuntimeError(f"coordinator: {response['error']}")
+		self._cancel.update(response.get("cancel", ()))
+		return response, blob
+
+	def _heartbeat(self, interval: float, stop: threading.Event) -> None:
+		while not stop.wait(interval):
+			try:
+				self._request({"op": "heartbeat"})
+			except (OSError, RuntimeError):
+				return
+		return
+
+	def _get_model(self, digest: str) -> RecipeMatrix:
+		if digest not in self._models:
+			_, blob = self._request({"op": "model", "model": digest})
+			if hashlib.sha256(blob).hexdigest() != digest:
+				raise RuntimeError(f"model {digest} is corrupted")
+			self._models[digest] = pickle.loads(blob)
+			self.stats["models"] += 1
+		return self._models[digest]
+
+	def _solve(self, task: dict) -> dict:
+		scenario = Scenario.from_dict(task["scenario"])
+		recipe_matrix = self._get_model(task["model"])
+		key = (task["model"], scenario.solver_key)
+		if key not in self._calculators:
+			self._calculators[key] = scenario.build_calculator(recipe_matrix)
+			while len(self._calculators) > self.max_calculators:
+				self._calculators.popitem(last=False)
+		else:
+			self._calculators.move_to_end(key)
+		calculator = self._calculators[key]
+		calculator.set_apa_counts(scenario.unfueled_apa_count,
+			scenario.fueled_apa_count)
+		res = scenario.calculate(calculator, exit_on_failure=False)
+		ret = SweepCheckpoint.encode_result(res,
+			recipe_matrix.coef_matrix.index)
+		return ret
+
+	def run(self) -> None:
+		while True:
+			try:
+				if self._run_session():
+					break
+			except ConnectionRefusedError:
+				if not self.stats["reconnects"]:
+					raise
+				# e.g. finished the sweeps while this worker was stalled
+				print("warning: the coordinator is gone, exiting",
+					file=sys.stderr)
+				break
+			self.stats["reconnects"] += 1
+			print("warning: lost the coordinator, connecting again",
+				file=sys.stderr)
+		return
+
+	def _send_results(self) -> None:
+		while self._unsent:
+			task_id, value = self._unsent[0]
+			self._request({"op": "result", "id": task_id, "value": value})
+			self._unsent.pop(0)
+		return
+
+	def _run_session(self) -> bool:
+		# one connection; returns True once the sweeps are done, False if the
+		# connection was lost
+		self._connect()
+		stop = threading.Event()
+		try:
+			hello, _ = self._request({"op": "hello"})
+			heartbeat = threading.Thread(target=self._heartbeat,
+				args=(hello["heartbeat"], stop), daemon=True)
+			heartbeat.start()
+			self._send_results()
+			while True:
+				response, _ = self._request({"op": "work", "n": self.chunksize})
+				if response.get("done"):
+					break
+				if not response["tasks"]:
+					time.sleep(response.get("wait", 0.5))
+					continue
+				for task in response["tasks"]:
+					if task["id"] in self._cancel:
+						self.stats["cancelled"] += 1
+						continue
+					self._unsent.append((task["id"], self._solve(task)))
+					self.stats["solved"] += 1
+					self._send_results()
+		except ConnectionError:
+			return False
+		finally:
+			stop.set()
+			self._fp.close()
+			self._sock.close()
+		return True
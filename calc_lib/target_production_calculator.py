@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import numpy
+import scipy.optimize
+
+from . import config
+from .linear_program import LinearProgramSolver
+from .production_calculator import ProductionCalculator
+from .recipe_matrix import RecipeMatrix
+
+
+class TargetProductionCalculator(ProductionCalculator):
+	# minimize weighted resource usage to meet a target production
+	# a demand vector is {itemclass: rate}, rate in items/min as shown in the
+	# reports (i.e. m3/min for fluids)
+	# the problem is compiled once and shared by all demand vectors; only the
+	# bounds of demanded item rows change between solves, so that each solve
+	# warm-starts from the previous one
+
+	def __init__(self, recipe_matrix: RecipeMatrix, *,
+		resource_weights: dict[str, float] = None, **kw,
+	) -> None:
+		super().__init__(recipe_matrix, **kw)
+		if resource_weights is None:
+			resource_weights = config.DEFAULT_RESOURCE_WEIGHT_CONFIG
+		self.resource_weights = resource_weights
+		self._solver: LinearProgramSolver = None
+		self._base_row_lower: numpy.ndarray = None
+		self._base_row_upper: numpy.ndarray = None
+		# rows whose bounds are currently changed by a demand vector
+		self._demand_rows = numpy.zeros(0, dtype=int)
+		return
+
+	def get_objective(self) -> numpy.ndarray:
+		# weighted resource usage of each row, by this calculator's weights;
+		# kept here, as the recipe matrix may be shared with other weights
+		# resource usage is the production of resource proxy recipes
+		# weights apply to the displayed amount, i.e. per m3 for fluids
+		items = self.recipe_matrix.recipe_dataset.items
+		weights = {k: v * items[k].rescale_amount(1.0)
+			for k, v in self.resource_weights.items() if k in items}
+		ret = self.recipe_matrix.get_weighted_column(weights,
+			row_mask=self.recipe_matrix.row_metadata.is_resource_proxy)
+		return ret
+
+	@property
+	def solver(self) -> LinearProgramSolver:
+		if self._solver is None:
+			lp = self.get_linear_program(self.get_objective(), maximize=False)
+			self._solver = LinearProgramSolver(lp)
+			self._base_row_lower = lp.row_lower.copy()
+			self._base_row_upper = lp.row_upper.copy()
+		return self._solver
+
+	def _update_apa_counts(self) -> None:
+		# the objective is resource usage, only the rows and bounds change
+		if self._solver is None:
+			return
+		self.update_solver_apa_counts(self._solver)
+		pos = self.recipe_matrix.coef_matrix.columns.get_loc("somersloop")
+		self._base_row_upper[pos] = self._solver.lp.row_upper[pos]
+		return
+
+	def get_demand_row_bounds(self, demand: dict[str, float],
+	) -> tuple[numpy.ndarray, numpy.ndarray]:
+		# return constraint row positions and upper bounds for a demand vector
+		# net production >= demand, i.e. -net production <= -demand
+		items = self.recipe_matrix.recipe_dataset.items
+		row_index = self.constraint_builder.row_index
+		positions = row_index.get_indexer(list(demand.keys()))
+		upper = numpy.empty(len(demand), dtype=float)
+		for i, (itemclass, rate) in enumerate(demand.items()):
+			if (itemclass not in items) or (positions[i] < 0):
+				raise ValueError(f"item '{itemclass}' cannot be produced")
+			if rate < 0:
+				raise ValueError(f"demand of '{itemclass}' must be non-negative")
+			# coef matrix is in raw amount per second
+			upper[i] = -rate / 60 / items[itemclass].rescale_amount(1.0)
+		return positions, upper
+
+	def _apply_demand(self, demand: dict[str, float]) -> None:
+		solver = self.solver
+		positions, upper = self.get_demand_row_bounds(demand)
+		# restore rows of the previous demand that are not demanded anymore
+		restore = numpy.setdiff1d(self._demand_rows, positions)
+		solver.set_row_bounds(restore, self._base_row_lower[restore],
+			self._base_row_upper[restore])
+		solver.set_row_bounds(positions, -numpy.inf, upper)
+		self._demand_rows = positions
+		return
+
+	def calculate(self, demand: dict[str, float], *,
+		exit_on_failure: bool = True,
+	) -> scipy.optimize.OptimizeResult:
+		self._apply_demand(demand)
+		res = self.solver.solve()
+		self._accept_result(res, exit_on_failure=exit_on_failure,
+			lp=self.solver.lp)
+		return res
+
+	def calculate_batch(self, demands: list[dict[str, float]],
+	) -> list[scipy.optimize.OptimizeResult]:
+		# solve a batch of demand vectors in order, warm-starting each solve
+		# from the previous one; failed solves are returned as-is instead of
+		# exiting, check .success of each result
+		ret = list()
+		for demand in demands:
+			self._apply_demand(demand)
+			ret.append(self.solver.solve())
+		if ret:
+			self._result = ret[-1]
+			self._last_problem = self.solver.lp
+		return ret
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import io
+import sys
+from typing import Iterable
+
+import numpy
+import pandas
+import scipy.optimize
+import scipy.sparse
+
+from . import config
+from . import util
+from .linear_program import LinearProgramSolver
+from .production_calculator import ProductionCalculator
+
+
+@dataclasses.dataclass
+class WhatIfDiff(object):
+	# changes of a what-if solve against the previous solution
+	# recipes: changed recipe variants, columns before/after/delta, in machine
+	#   count
+	# net_products: changed net production, columns before/after/delta, in
+	#   items/min as shown in the reports (i.e. m3/min for fluids)
+	# both are empty if the solve failed
+	result: scipy.optimize.OptimizeResult
+	objective_before: float
+	objective_after: float
+	recipes: pandas.DataFrame
+	net_products: pandas.DataFrame
+
+	@property
+	def success(self) -> bool:
+		return bool(self.result.success)
+
+	def report(self, fp: io.TextIOBase = None, *, recipe_names: dict = None,
+		item_names: dict = None,
+	) -> None:
+		# names: optional classname -> display name mappings
+		if fp is None:
+			fp = sys.stdout
+		recipe_names = recipe_names or dict()
+		item_names = item_names or dict()
+		print(">> What-if diff", file=fp)
+		print("=" * 80, file=fp)
+		if not self.success:
+			print(f"calculation failed: {self.result.message}", file=fp)
+			print("=" * 80, file=fp)
+			return
+		print(("\t").join(["Objective",
+			self._repr_value(self.objective_before, 3),
+			self._repr_value(self.objective_after, 3),
+			self._repr_value(self.objective_after - self.objective_before, 3)
+			if self.objective_before is not None else "N/A",
+		]), file=fp)
+		print("-" * 80, file=fp)
+		print(("\t").join(["Recipe", "Before", "After", "Delta"]), file=fp)
+		print("-" * 80, file=fp)
+		for label, row in self.recipes.iterrows():
+			recipe, _, variant = label.partition("/")
+			name = recipe_names.get(recipe, recipe)
+			print(("\t").join([f"{name} ({variant})"]
+				+ [self._repr_value(v, 3) for v in row]), file=fp)
+		print("-" * 80, file=fp)
+		print(("\t").join(["Item", "Before", "After", "Delta"]), file=fp)
+		print("-" * 80, file=fp)
+		for itemclass, row in self.net_products.iterrows():
+			print(("\t").join([item_names.get(itemclass, itemclass)]
+				+ [self._repr_value(v, 3) + "/min." for v in row]), file=fp)
+		print("=" * 80, file=fp)
+		return
+
+	@staticmethod
+	def _repr_value(value: float, decimal: int) -> str:
+		if value is None:
+			return "N/A"
+		return util.simplify_decimal(value, decimal=decimal)
+
+
+class WhatIfSession(object):
+	# incremental re-solves of one problem under changes, e.g. disabling an
+	# alternate recipe, changing a resource extraction limit or adding a
+	# resource node
+	# the problem is compiled once; changes only touch column bounds or
+	# extraction limit rows, so that each solve starts from the previous basis
+	# each solve returns a WhatIfDiff against the previous successful solution
+	#
+	# changes are kept as overrides on top of the calculator's default bounds:
+	#   disabled recipes: all variants of the recipe fixed at 0
+	#   global limits: upper bound of all variants of a recipe, e.g. the
+	#     number of resource nodes of a resource proxy recipe
+	#   extraction limits: total extraction of a resource item, in items/min
+	#     as config.RESOURCE_GLOBAL_LIMIT
+	#   pins: a recipe variant (coef matrix row) fixed at a value
+	def __init__(self, calculator: ProductionCalculator, *,
+		objective: str | numpy.ndarray = "raw_power",
+		maximize: bool = True,
+		eq_items: list[str] = None,
+		exit_on_failure: bool = False,
+	) -> None:
+		self.calculator = calculator
+		self.maximize = maximize
+		self.exit_on_failure = exit_on_failure
+		lp = calculator.get_linear_program(objective, maximize=maximize,
+			eq_items=eq_items)
+		self.solver = LinearProgramSolver(lp)
+		# the defaults before logistics limits, which are applied on top of
+		# the overrides
+		bounds = calculator.get_default_bounds()
+		self._base_col_lower = bounds[:, 0].copy()
+		self._base_col_upper = bounds[:, 1].copy()
+		# overrides
+		self._disabled: set[str] = set()
+		self._global_limits: dict[str, float] = dict()
+		self._pins: dict[str, float] = dict()
+		self._extraction_limits: dict[str, float] = dict()
+		# extraction limit rows, added to the solver on first use
+		self._extraction_rows: dict[str, int] = dict()
+		# last successful result, the baseline of the next diff
+		self._last: scipy.optimize.OptimizeResult = None
+		self.baseline = self.solve()
+		return
+
+	@property
+	def recipe_matrix(self):
+		return self.calculator.recipe_matrix
+
+	def _get_recipe_positions(self, classname: str) -> numpy.ndarray:
+		ret = numpy.flatnonzero(self.recipe_matrix.row_metadata.recipe
+			== classname)
+		if not len(ret):
+			raise ValueError(f"recipe '{classname}' is not in the recipe matrix")
+		return ret
+
+	def _get_row_position(self, label: str) -> int:
+		index = self.recipe_matrix.coef_matrix.index
+		if label not in index:
+			raise ValueError(f"variant '{label}' is not in the recipe matrix")
+		return index.get_loc(label)
+
+	def disable_recipes(self, classnames: Iterable[str]) -> None:
+		for classname in classnames:
+			self._get_recipe_positions(classname)
+			self._disabled.add(classname)
+		return
+
+	def enable_recipes(self, classnames: Iterable[str]) -> None:
+		# only undoes disable_recipes(), recipes disabled by the calculator
+		# defaults (e.g. resource conversion) stay disabled
+		for classname in classnames:
+			self._get_recipe_positions(classname)
+			self._disabled.discard(classname)
+		return
+
+	def set_global_limit(self, classname: str, limit: float | None) -> None:
+		# limit: None to restore the default, negative for unlimited
+		self._get_recipe_positions(classname)
+		if limit is None:
+			self._global_limits.pop(classname, None)
+		else:
+			self._global_limits[classname] = numpy.inf if limit < 0 else limit
+		return
+
+	def add_nodes(self, classname: str, count: int = 1) -> None:
+		# e.g. add a pure iron node:
+		# add_nodes("ResourceNode-Build_MinerMk3_C-Desc_OreIron_C-Pure")
+		current = self._global_limits.get(classname)
+		if current is None:
+			pos = self._get_recipe_positions(classname)
+			current = self._base_col_upper[pos].max()
+		self.set_global_limit(classname, max(current + count, 0))
+		return
+
+	def set_extraction_limit(self, itemclass: str, limit: float | None,
+	) -> None:
+		# limit total extraction of a resource item, in items/min
+		# limit: None to remove, negative for unlimited
+		if itemclass not in config.RESOURCE_GLOBAL_LIMIT:
+			raise ValueError(f"'{itemclass}' is not a resource item")
+		if limit is None:
+			self._extraction_limits.pop(itemclass, None)
+		else:
+			self._extraction_limits[itemclass] = numpy.inf if limit < 0 \
+				else limit
+		return
+
+	def pin(self, label: str, value: float) -> None:
+		# fix a recipe variant (coef matrix row label) at a machine count
+		self._get_row_position(label)
+		if value < 0:
+			raise ValueError("pinned value must be non-negative")
+		self._pins[label] = value
+		return
+
+	def unpin(self, label: str) -> None:
+		self._pins.pop(label, None)
+		return
+
+	def reset(self) -> None:
+		# remove all overrides; the basis is kept
+		self._disabled.clear()
+		self._global_limits.clear()
+		self._pins.clear()
+		self._extraction_limits.clear()
+		return
+
+	def _push_col_bounds(self) -> None:
+		# recompute bounds from the overrides, only changed columns are sent
+		# to the solver
+		lower = self._base_col_lower.copy()
+		upper = self._base_col_upper.copy()
+		for classname, limit in self._global_limits.items():
+			upper[self._get_recipe_positions(classname)] = limit
+		for classname in self._disabled:
+			pos = self._get_recipe_positions(classname)
+			lower[pos] = upper[pos] = 0
+		for label, value in self._pins.items():
+			pos = self._get_row_position(label)
+			lower[pos] = upper[pos] = value
+		# overrides are limited as the defaults, e.g. added nodes extract at
+		# most what their belts carry
+		bounds = self.calculator.apply_logistics_limits(
+			numpy.column_stack([lower, upper]))
+		lower, upper = bounds[:, 0], bounds[:, 1]
+		lp = self.solver.lp
+		changed = (lower != lp.col_lower) | (upper != lp.col_upper)
+		if changed.any():
+			self.solver.set_col_bounds(changed, lower[changed], upper[changed])
+		return
+
+	def _get_extraction_row(self, itemclass: str) -> int:
+		# extraction is the production of resource proxy recipes
+		if itemclass not in self._extraction_rows:
+			recipe_matrix = self.recipe_matrix
+			item_pos = recipe_matrix.item_index.get_loc(itemclass)
+			values = recipe_matrix.flow_matrix[:, [item_pos]].toarray().ravel()
+			values[~recipe_matrix.row_metadata.is_resource_proxy] = 0
+			pos = self.solver.add_rows(scipy.sparse.csr_array(values[None, :]),
+				-numpy.inf, numpy.inf, names=[f"extraction_limit/{itemclass}"])
+			self._extraction_rows[itemclass] = pos[0]
+		return self._extraction_rows[itemclass]
+
+	def _push_row_bounds(self) -> None:
+		items = self.recipe_matrix.recipe_dataset.items
+		for itemclass in set(self._extraction_limits) | set(self._extraction_rows):
+			limit = self._extraction_limits.get(itemclass, numpy.inf)
+			if itemclass not in self._extraction_rows and numpy.isinf(limit):
+				continue
+			pos = self._get_extraction_row(itemclass)
+			# coef matrix is in raw amount per second
+			upper = limit / 60 / items[itemclass].rescale_amount(1.0)
+			if self.solver.lp.row_upper[pos] != upper:
+				self.solver.set_row_bounds([pos], -numpy.inf, upper)
+		return
+
+	def _objective_value(self, res: scipy.optimize.OptimizeResult) -> float:
+		if res is None or res.fun is None:
+			return None
+		return -res.fun if self.maximize else res.fun
+
+	def _get_net_products(self, x: numpy.ndarray) -> pandas.Series:
+		# in items/min as shown in the reports
+		recipe_matrix = self.recipe_matrix
+		items = recipe_matrix.recipe_dataset.items
+		scale = numpy.array([items[k].rescale_amount(60.0) if k in items
+			else 60.0 for k in recipe_matrix.item_index])
+		ret = pandas.Series(recipe_matrix.flow_matrix.T @ x * scale,
+			index=recipe_matrix.item_index)
+		return ret
+
+	def _get_diff(self, res: scipy.optimize.OptimizeResult, *,
+		tol: float = 1e-8,
+	) -> WhatIfDiff:
+		columns = ["before", "after", "delta"]
+		recipes = pandas.DataFrame(columns=columns, dtype=float)
+		net_products = pandas.DataFrame(columns=columns, dtype=float)
+		if res.success:
+			n = len(res.x)
+			before = self._last.x if self._last is not None else numpy.zeros(n)
+			recipes = pandas.DataFrame({"before": before, "after": res.x,
+				"delta": res.x - before},
+				index=self.recipe_matrix.coef_matrix.index)
+			recipes = recipes[numpy.abs(recipes["delta"]) > tol]
+			prod_before = self._get_net_products(before)
+			prod_after = self._get_net_products(res.x)
+			net_products = pandas.DataFrame({"before": prod_before,
+				"after": prod_after, "delta": prod_after - prod_before})
+			net_products = net_products[numpy.abs(net_products["delta"]) > tol]
+		ret = WhatIfDiff(
+			result=res,
+			objective_before=self._objective_value(self._last),
+			objective_after=self._objective_value(res),
+			recipes=recipes,
+			net_products=net_products,
+		)
+		return ret
+
+	def solve(self) -> WhatIfDiff:
+		# apply pending changes and re-solve from the previous basis
+		self._push_col_bounds()
+		self._push_row_bounds()
+		res = self.solver.solve()
+		self.calculator._accept_result(res,
+			exit_on_failure=self.exit_on_failure, lp=self.solver.lp)
+		ret = self._get_diff(res)
+		if res.success:
+			self._last = res
+		return ret
+
+	def report(self, diff: WhatIfDiff, fp: io.TextIOBase = None) -> None:
+		# diff report with display names
+		dataset = self.recipe_matrix.recipe_dataset
+		diff.report(fp,
+			recipe_names={k: v.display_name for k, v in dataset.recipes.items()},
+			item_names={k: v.display_name for k, v in dataset.items.items()},
+		)
+		return
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import collections
+import concurrent.futures
+import copy
+import dataclasses
+import multiprocessing
+import multiprocessing.shared_memory
+import os
+import pickle
+from typing import Sequence
+
+import numpy
+import pandas
+import scipy.optimize
+
+from .recipe_matrix import RecipeMatrix
+from .scenario import Scenario
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedArray(object):
+	# a numpy array in a shared memory block, by name; small to pickle
+	name: str
+	shape: tuple[int, ...]
+	dtype: str = "float64"
+
+	@classmethod
+	def create(cls, shape: tuple[int, ...], dtype: str = "float64",
+	) -> tuple["SharedArray", multiprocessing.shared_memory.SharedMemory]:
+		# the caller owns the returned block, and must unlink it
+		size = max(int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize, 1)
+		shm = multiprocessing.shared_memory.SharedMemory(create=True, size=size)
+		ret = cls(name=shm.name, shape=tuple(shape), dtype=dtype)
+		return ret, shm
+
+	def view(self, shm: multiprocessing.shared_memory.SharedMemory,
+	) -> numpy.ndarray:
+		return numpy.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedModel(object):
+	# a recipe matrix published in shared memory:
+	#   values: the dense coef matrix values, zero-copy in workers
+	#   shell: the pickled rest of the recipe matrix (dataset, metadata,
+	#     sparse flow block and labels), unpickled once per worker
+	values: SharedArray
+	shell: SharedArray
+
+
+class SharedMatrixPool(object):
+	# process pool solving scenarios on recipe matrices compiled once in the
+	# parent and shared with all workers:
+	#   each matrix (one per Scenario.model_key) is published once in shared
+	#   memory; workers map its coef matrix as a read-only numpy view, and
+	#   only unpickle the small remainder once
+	#   tasks only carry a chunk of scenarios and their first row in a shared
+	#   result buffer, into which workers write x; results return as small
+	#   status records
+	#   workers are forked from a forkserver with calc_lib preloaded, so that
+	#   no worker imports pandas or scipy itself
+	# calculators are cached in each worker by Scenario.solver_key; the
+	# scenarios of a key (e.g. the points of an APA grid, or demands) only
+	# change the APA counts and demand rows of the compiled problem in place,
+	# and warm-start from the previous solve
+	PRELOAD = ["calc_lib.objective_calculator",
+		"calc_lib.target_production_calculator", "calc_lib.worker_pool"]
+
+	def __init__(self, max_workers: int = None, *,
+		start_method: str = None,
+	) -> None:
+		# start_method: by default forkserver where available, else spawn
+		if start_method is None:
+			start_method = "forkserver" if "forkserver" \
+				in multiprocessing.get_all_start_methods() else "spawn"
+		context = multiprocessing.get_context(start_method)
+		if start_method == "forkserver":
+			context.set_forkserver_preload(self.PRELOAD)
+		if max_workers is None:
+			max_workers = os.cpu_count() or 1
+		self.max_workers = max_workers
+		self.executor = concurrent.futures.ProcessPoolExecutor(max_workers,
+			mp_context=context)
+		# key -> (SharedModel, owned blocks, the published recipe matrix)
+		self._models: dict[tuple, tuple[SharedModel, list, RecipeMatrix]] = \
+			dict()
+		self.stats = collections.Counter()
+		return
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *ka) -> None:
+		self.close()
+		return
+
+	def close(self) -> None:
+		self.executor.shutdown(wait=True, cancel_futures=True)
+		for _, blocks, _ in self._models.values():
+			for shm in blocks:
+				shm.close()
+				shm.unlink()
+		self._models.clear()
+		return
+
+	def publish(self, recipe_matrix: RecipeMatrix, key: tuple,
+	) -> SharedModel:
+		# publish a recipe matrix under key, e.g. Scenario.model_key; the same
+		# key is only published once
+		if key in self._models:
+			return self._models[key][0]
+		values = recipe_matrix.coef_matrix.to_numpy(dtype=float)
+		values_ref, values_shm = SharedArray.create(values.shape)
+		values_ref.view(values_shm)[:] = values
+		shell = copy.copy(recipe_matrix)
+		shell.coef_matrix = recipe_matrix.coef_matrix.iloc[:, :0]
+		shell_bytes = numpy.frombuffer(pickle.dumps((shell,
+			recipe_matrix.coef_matrix.columns), protocol=pickle.HIGHEST_PROTOCOL),
+			dtype=numpy.uint8)
+		shell_ref, shell_shm = SharedArray.create(shell_bytes.shape, "uint8")
+		shell_ref.view(shell_shm)[:] = shell_bytes
+		ret = SharedModel(values=values_ref, shell=shell_ref)
+		self._models[key] = (ret, [values_shm, shell_shm], recipe_matrix)
+		self.stats["published"] += 1
+		return ret
+
+	def get_recipe_matrix(self, key: tuple) -> RecipeMatrix:
+		# the recipe matrix published under key, e.g. for row labels of x
+		return self._models[key][2]
+
+	def map(self, scenarios: Sequence[Scenario], *, chunksize: int = None,
+	) -> list[scipy.optimize.OptimizeResult]:
+		# solve scenarios in the pool; results are in the same order, failed
+		# solves have .success False
+		# chunksize: scenarios per task, by default about 4 tasks per worker
+		groups = collections.defaultdict(list)
+		for i, scenario in enumerate(scenarios):
+			groups[scenario.model_key].append(i)
+		if chunksize is None:
+			chunksize = max(1, len(scenarios) // (4 * self.max_workers))
+		ret = [None] * len(scenarios)
+		outputs = list()
+		try:
+			futures = dict()
+			for key, positions in groups.items():
+				if key not in self._models:
+					self.publish(scenarios[positions[0]].build_recipe_matrix(), key)
+				model = self._models[key][0]
+				out_ref, out_shm = SharedArray.create((len(positions),
+					model.values.shape[0]))
+				outputs.append((out_ref, out_shm, positions))
+				for start in range(0, len(positions), chunksize):
+					chunk = positions[start:start + chunksize]
+					future = self.executor.submit(_solve_in_worker, model,
+						[scenarios[i] for i in chunk], out_ref, start)
+					futures[future] = chunk
+			for future in concurrent.futures.as_completed(futures):
+				for i, res in zip(futures[future], future.result()):
+					ret[i] = res
+			for out_ref, out_shm, positions in outputs:
+				x = out_ref.view(out_shm)
+				for row, i in enumerate(positions):
+					if ret[i].pop("has_x"):
+						ret[i].x = x[row].copy()
+			self.stats["solved"] += len(scenarios)
+			self.stats["tasks"] += len(futures)
+		finally:
+			for _, out_shm, _ in outputs:
+				out_shm.close()
+				out_shm.unlink()
+		return ret
+
+
+# worker state, per process
+_worker_models: dict[str, RecipeMatrix] = dict()
+_worker_blocks: dict[str, multiprocessing.shared_memory.SharedMemory] = dict()
+_worker_calculators = collections.OrderedDict()
+_WORKER_MAX_CALCULATORS = 16
+
+
+def _attach(ref: SharedArray) -> numpy.ndarray:
+	if ref.name not in _worker_blocks:
+		_worker_blocks[ref.name] = multiprocessing.shared_memory.SharedMemory(
+			name=ref.name)
+	return ref.view(_worker_blocks[ref.name])
+
+
+def _get_worker_model(model: SharedModel) -> RecipeMatrix:
+	if model.values.name not in _worker_models:
+		shell, columns = pickle.loads(_attach(model.shell).tobytes())
+		values = _attach(model.values)
+		values.flags.writeable = False
+		shell.coef_matrix = pandas.DataFrame(values,
+			index=shell.coef_matrix.index, columns=columns, copy=False)
+		_worker_models[model.values.name] = shell
+	return _worker_models[model.values.name]
+
+
+def _solve_in_worker(model: SharedModel, scenarios: list[Scenario],
+	out: SharedArray, start: int,
+) -> list[scipy.optimize.OptimizeResult]:
+	# x of scenarios[k] is written to row start + k of out
+	ret = list()
+	for k, scenario in enumerate(scenarios):
+		key = (model.values.name, scenario.solver_key)
+		if key not in _worker_calculators:
+			# the calculator copies the shared matrix, e.g. for apa power boost
+			_worker_calculators[key] = scenario.build_calculator(
+				_get_worker_model(model))
+			while len(_worker_calculators) > _WORKER_MAX_CALCULATORS:
+				_worker_calculators.popitem(last=False)
+		else:
+			_worker_calculators.move_to_end(key)
+		calculator = _worker_calculators[key]
+		calculator.set_apa_counts(scenario.unfueled_apa_count,
+			scenario.fueled_apa_count)
+		res = scenario.calculate(calculator, exit_on_failure=False)
+		ret.append(scipy.optimize.OptimizeResult(
+			success=bool(res.success),
+			status=int(res.status),
+			message=str(res.message),
+			fun=res.fun,
+			nit=res.get("nit", 0),
+			x=None,
+			has_x=res.x is not None,
+		))
+		if res.x is not None:
+			_attach_output(out)[start + k] = res.x
+	return ret
+
+
+def _attach_output(ref: SharedArray) -> numpy.ndarray:
+	# output blocks are new for every map(), only the last one is kept
+	name = "out:" + ref.name
+	if name not in _worker_blocks:
+		for k in [k for k in _worker_blocks if k.startswith("out:")]:
+			_worker_blocks.pop(k).close()
+		_worker_blocks[name] = multiprocessing.shared_memory.SharedMemory(
+			name=ref.name)
+	return ref.view(_worker_blocks[name])
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+
+import calc_lib
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="run a local calculation service "
+		"answering newline-delimited json requests")
+	ap.add_argument("-s", "--socket", type=str, metavar="path",
+		help="listen on this unix socket")
+	ap.add_argument("-H", "--host", type=str, default="127.0.0.1",
+		metavar="host",
+		help="listen on this host if --socket is not set [127.0.0.1]")
+	ap.add_argument("-p", "--port", type=int, default=8765, metavar="int",
+		help="listen on this tcp port if --socket is not set [8765]")
+	ap.add_argument("-w", "--workers", type=int, default=4, metavar="int",
+		help="number of concurrent solves [4]")
+	ap.add_argument("-m", "--max-models", type=int, default=4, metavar="int",
+		help="number of recipe matrices kept in memory [4]")
+	ap.add_argument("-c", "--max-calculators", type=int, default=16,
+		metavar="int",
+		help="number of calculators kept in memory per recipe matrix [16]")
+	args = ap.parse_args()
+	return args
+
+
+def main():
+	args = get_args()
+	service = calc_lib.CalcService(max_models=args.max_models,
+		max_calculators=args.max_calculators, max_workers=args.workers)
+	try:
+		if args.socket:
+			asyncio.run(service.serve(path=args.socket))
+		else:
+			asyncio.run(service.serve(host=args.host, port=args.port))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		service.close()
+	return
+
+
+if __name__ == "__main__":
+	main()
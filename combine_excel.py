@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 
+import argparse
 import itertools
-import os
+import sys
 from typing import Generator
 
-import openpyxl
+import calc_lib
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="combine the results of the "
+		"output/ scenarios into one excel workbook, one sheet per report")
+	ap.add_argument("-s", "--scenarios", type=str,
+		default="scenarios/output.toml", metavar="toml",
+		help="scenario file of the reports [scenarios/output.toml]")
+	ap.add_argument("-o", "--output", type=str, default="output/results.xlsx",
+		metavar="xlsx",
+		help="output workbook [output/results.xlsx]")
+	args = ap.parse_args()
+	return args
 
 
 def formatted_string_generator(*fmts, **kw: list[tuple],
@@ -19,25 +33,9 @@ def formatted_string_generator(*fmts, **kw: list[tuple],
 	return
 
 
-def tsv_to_worksheet(worksheet: openpyxl.worksheet.worksheet.Worksheet,
-	fname: str
-) -> None:
-	with open(fname, "r", encoding="utf-8") as fp:
-		for r, line in enumerate(fp):
-			for c, cell in enumerate(line.strip().split("\t")):
-				if cell.startswith("="):
-					cell = cell.replace("=", "-")
-				try:
-					cell = float(cell)
-				except ValueError:
-					pass
-				worksheet.cell(row=r + 1, column=c + 1, value=cell)
-	return
-
-
-if __name__ == "__main__":
-	wb = openpyxl.Workbook()
-	for fname, ws_name in formatted_string_generator(
+def sheet_names() -> Generator[tuple[str, str], None, None]:
+	# (report path, sheet name), in the order of the sheets
+	yield from formatted_string_generator(
 		"output/calc.max_power{waste}{conv}{sink}{sloop}.txt",
 		"最大化发电-{waste}-{sink}-{conv}-{sloop}",
 		waste=[
@@ -56,13 +54,8 @@ if __name__ == "__main__":
 			(".with_sloop", "有红石"),
 			(".wo_sloop", "无红石"),
 		],
-	):
-		if not os.path.exists(fname):
-			continue
-		ws = wb.create_sheet(title=ws_name)
-		tsv_to_worksheet(ws, fname)
-
-	for fname, ws_name in formatted_string_generator(
+	)
+	yield from formatted_string_generator(
 		"output/calc.max_power{waste}{sloop}.txt",
 		"最大化发电-{waste}-{sloop}",
 		waste=[
@@ -73,13 +66,8 @@ if __name__ == "__main__":
 			(".with_sloop", "有红石"),
 			(".wo_sloop", "无红石"),
 		],
-	):
-		if not os.path.exists(fname):
-			continue
-		ws = wb.create_sheet(title=ws_name)
-		tsv_to_worksheet(ws, fname)
-
-	for fname, ws_name in formatted_string_generator(
+	)
+	yield from formatted_string_generator(
 		"output/calc.max_point{oc}{sloop}.txt",
 		"最大化点数-{oc}-{sloop}",
 		oc=[
@@ -91,11 +79,31 @@ if __name__ == "__main__":
 			(".with_sloop", "有红石"),
 			(".wo_sloop", "无红石"),
 		],
-	):
-		if not os.path.exists(fname):
-			continue
-		ws = wb.create_sheet(title=ws_name)
-		tsv_to_worksheet(ws, fname)
+	)
+	return
 
-	wb.remove(wb["Sheet"])
-	wb.save("output/results.xlsx")
+
+def main():
+	args = get_args()
+	# the report runs of the scenario file, by report path; results are
+	# taken from the calculators directly, instead of parsing the reports
+	runs = {run.report: run for run in
+		calc_lib.ScenarioRunner.from_toml(args.scenarios).runs
+		if (run.kind == "report") and run.report}
+	models = calc_lib.ModelCache(max_models=8)
+	with calc_lib.StreamingWorkbook(args.output) as wb:
+		for fname, ws_name in sheet_names():
+			if fname not in runs:
+				continue
+			scenario = runs[fname].scenario
+			calculator, _ = models.get_calculator(scenario)
+			res = scenario.calculate(calculator, exit_on_failure=False)
+			if not res.success:
+				print(f"warning: {fname}: {res.message}", file=sys.stderr)
+				continue
+			wb.add_report(ws_name, calculator.get_report_tables(res.x))
+	return
+
+
+if __name__ == "__main__":
+	main()
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import argparse
-import pdb
 from typing import Self
 
 import calc_lib
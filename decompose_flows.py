@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+
+import calc_lib
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="decompose an optimal solution "
+		"into production chains per final product and per resource")
+	ap.add_argument("-d", "--dataset", type=str,
+		default="curated/recipe_dataset.en-US.json", metavar="json",
+		help="curated recipe dataset [curated/recipe_dataset.en-US.json]")
+	ap.add_argument("-O", "--objective", type=str, default="raw_power",
+		choices=["raw_power", "points_gain_rate"],
+		help="objective to maximize [raw_power]")
+	ap.add_argument("-s", "--with-somersloop", action="store_true",
+		help="consider production-boosted recipes with somersloop [no]")
+	ap.add_argument("-c", "--enable-resource-conversion", action="store_true",
+		help="enable resource conversion recipes [no]")
+	ap.add_argument("-o", "--output", type=str, required=True, metavar="json",
+		help="output chains as nested json (required)")
+	ap.add_argument("--dot", type=str, metavar="dot",
+		help="also output the flow graph as graphviz dot")
+	ap.add_argument("--dot-product", type=str, metavar="itemclass",
+		help="only include the chain of this final product in the dot output")
+	args = ap.parse_args()
+	return args
+
+
+def main():
+	args = get_args()
+	scenario = calc_lib.Scenario(
+		dataset=args.dataset,
+		enable_somersloop_amplification=args.with_somersloop,
+		enable_resource_conversion=args.enable_resource_conversion,
+		objective=args.objective,
+	)
+	calculator = scenario.build_calculator()
+	scenario.calculate(calculator)
+	decomposition = calculator.get_flow_decomposition()
+	with open(args.output, "w") as fp:
+		json.dump(decomposition.to_dict(), fp, indent="\t")
+	if args.dot:
+		dataset = calculator.recipe_matrix.recipe_dataset
+		with open(args.dot, "w") as fp:
+			fp.write(decomposition.to_dot(args.dot_product,
+				recipe_names={k: v.display_name
+					for k, v in dataset.recipes.items()},
+				item_names={k: v.display_name for k, v in dataset.items.items()},
+			))
+	return
+
+
+if __name__ == "__main__":
+	main()
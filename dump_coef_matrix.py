@@ -11,8 +11,14 @@ def main() -> None:
 		metavar="json",
 		help="input curated json file (required)")
 	parser.add_argument("-o", "--output", type=str, required=True,
-		metavar="txt",
-		help="output matrix as tsv file (required)")
+		metavar="file",
+		help="output matrix file; format by extension: .tsv/.txt dense, .npz "
+			"scipy CSR, .mtx Matrix Market, .parquet (row, col, value) "
+			"records; the sparse formats have <file>.rows.txt and "
+			"<file>.cols.txt label sidecars (required)")
+	parser.add_argument("-f", "--format", type=str,
+		choices=["tsv", "npz", "mtx", "parquet"],
+		help="output format, overrides the file extension")
 	parser.add_argument("-c", "--production-clock-speed",
 		type=calc_lib.ClockSpeed, default=100, metavar="1-250",
 		help="Set the production clock speed (1-250) [100]")
@@ -31,7 +37,8 @@ def main() -> None:
 		with_somersloop=args.with_somersloop,
 	)
 
-	recipe_matrix.coef_matrix.to_csv(args.output, sep="\t", index=True)
+	calc_lib.CoefMatrixFile.from_recipe_matrix(recipe_matrix).write(
+		args.output, args.format)
 	return
 
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+
+import calc_lib
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="export the assembled linear "
+		"program as MPS or CPLEX-LP for external solvers, and report their "
+		"solutions")
+	ap.add_argument("-d", "--dataset", type=str,
+		default="curated/recipe_dataset.en-US.json", metavar="json",
+		help="curated recipe dataset [curated/recipe_dataset.en-US.json]")
+	ap.add_argument("-O", "--objective", type=str, default="raw_power",
+		choices=["raw_power", "points_gain_rate"],
+		help="objective to maximize [raw_power]")
+	ap.add_argument("--waste-prone", action="store_true",
+		help="allow surplus of all items, not only sinkable ones [no]")
+	ap.add_argument("-p", "--production-clock-speed",
+		type=calc_lib.ClockSpeed, default=250, metavar="1-250",
+		help="production clock speed (1-250) [250]")
+	ap.add_argument("-s", "--with-somersloop", action="store_true",
+		help="consider production-boosted recipes with somersloop [no]")
+	ap.add_argument("-c", "--enable-resource-conversion", action="store_true",
+		help="enable resource conversion recipes [no]")
+	ap.add_argument("-o", "--output", type=str, metavar="mps|lp",
+		help="output the problem, format by extension (.mps or .lp)")
+	ap.add_argument("-f", "--format", type=str, default=None,
+		choices=calc_lib.LinearProgramFile.FORMATS,
+		help="output format, overriding the extension")
+	ap.add_argument("--solution", type=str, metavar="sol",
+		help="solution file of an external solver, whose report is written")
+	ap.add_argument("--reference", action="store_true",
+		help="also solve with the built-in solver, print its objective as "
+			"a reference, and write its report if no --solution is given [no]")
+	ap.add_argument("-r", "--report", type=str, default="-", metavar="txt",
+		help="output report [stdout]")
+	args = ap.parse_args()
+	if (args.output is None) and (args.solution is None) \
+		and (not args.reference):
+		ap.error("at least one of -o/--output, --solution and --reference "
+			"is required")
+	return args
+
+
+def main():
+	args = get_args()
+	scenario = calc_lib.Scenario(
+		dataset=args.dataset,
+		production_clock_speed=args.production_clock_speed,
+		enable_somersloop_amplification=args.with_somersloop,
+		enable_resource_conversion=args.enable_resource_conversion,
+		objective=args.objective,
+		waste_free=not args.waste_prone,
+	)
+	calculator = scenario.build_calculator()
+	# the compiled problem, exported without solving it here
+	lp = calculator.solver.lp
+	if args.output:
+		calculator.export_linear_program(args.output, fmt=args.format, lp=lp)
+	res = None
+	if args.reference:
+		res = scenario.calculate(calculator, exit_on_failure=False)
+		print(f"built-in: {res.message}, objective: "
+			f"{scenario.objective_value(res)}", file=sys.stderr)
+	if args.solution:
+		res = calculator.load_solution(args.solution, lp=lp)
+		print(f"{res.message}, objective: {scenario.objective_value(res)}",
+			file=sys.stderr)
+	if (res is not None) and res.success:
+		if args.report == "-":
+			calculator.report(sys.stdout)
+		else:
+			with open(args.report, "w") as fp:
+				calculator.report(fp)
+	return
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import time
+
+import calc_lib
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="rank alternate recipes by their "
+		"contribution to an objective, as an unlock order")
+	ap.add_argument("-d", "--dataset", type=str,
+		default="curated/recipe_dataset.en-US.json", metavar="json",
+		help="curated recipe dataset [curated/recipe_dataset.en-US.json]")
+	ap.add_argument("-O", "--objective", type=str, default="raw_power",
+		choices=["raw_power", "points_gain_rate"],
+		help="objective to maximize [raw_power]")
+	ap.add_argument("--waste-prone", action="store_true",
+		help="allow surplus of all items, not only sinkable ones [no]")
+	ap.add_argument("-s", "--with-somersloop", action="store_true",
+		help="consider production-boosted recipes with somersloop [no]")
+	ap.add_argument("-c", "--enable-resource-conversion", action="store_true",
+		help="enable resource conversion recipes [no]")
+	ap.add_argument("-b", "--beam-width", type=int, default=1, metavar="int",
+		help="number of subsets kept at each step, 1 for greedy [1]")
+	ap.add_argument("-n", "--max-steps", type=int, default=None,
+		metavar="int",
+		help="stop after this many unlocks [until no improvement]")
+	ap.add_argument("-j", "--jobs", type=int, default=1, metavar="int",
+		help="number of worker processes [1]")
+	ap.add_argument("-o", "--output", type=str, default="-", metavar="tsv",
+		help="output ranking as tsv file [stdout]")
+	args = ap.parse_args()
+	return args
+
+
+def main():
+	args = get_args()
+	scenario = calc_lib.Scenario(
+		dataset=args.dataset,
+		enable_somersloop_amplification=args.with_somersloop,
+		enable_resource_conversion=args.enable_resource_conversion,
+		objective=args.objective,
+		waste_free=not args.waste_prone,
+	)
+	t = time.time()
+	ranker = calc_lib.AlternateRecipeRanker(scenario,
+		beam_width=args.beam_width, max_workers=args.jobs)
+	ranking = ranker.rank(args.max_steps)
+	print(f"{len(ranker.alternates)} alternates, "
+		f"{ranker.stats['solved']} solved, {ranker.stats['pruned']} pruned, "
+		f"{time.time() - t:.1f}s", file=sys.stderr)
+	print(f"objective without alternates: {ranker.base_objective}",
+		file=sys.stderr)
+	ranking.to_csv(sys.stdout if args.output == "-" else args.output,
+		sep="\t", index=True)
+	return
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import time
+
+import calc_lib
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="run the scenario grid of toml "
+		"files, and write their reports and structured results")
+	ap.add_argument("input", type=str, nargs="+", metavar="toml",
+		help="scenario files, e.g. scenarios/output.toml")
+	ap.add_argument("-j", "--jobs", type=int, default=1, metavar="int",
+		help="number of worker processes [1]")
+	ap.add_argument("--cache-dir", type=str, default=".scenario_cache",
+		metavar="dir",
+		help="cache of run outputs, keyed by scenario, dataset contents and "
+			"calc_lib sources [.scenario_cache]")
+	ap.add_argument("--no-cache", action="store_true",
+		help="do not read or write the cache [no]")
+	ap.add_argument("-f", "--force", action="store_true",
+		help="ignore cached outputs [no]")
+	ap.add_argument("-n", "--dry-run", action="store_true",
+		help="only list the expanded runs [no]")
+	ap.add_argument("-s", "--summary", type=str, metavar="tsv",
+		help="also output a summary of all runs as tsv file")
+	args = ap.parse_args()
+	return args
+
+
+def main():
+	args = get_args()
+	runs = list()
+	for fname in args.input:
+		runner = calc_lib.ScenarioRunner.from_toml(fname)
+		runs.extend(runner.runs)
+	if args.dry_run:
+		for run in runs:
+			print(("\t").join([run.name, run.kind, run.report or "",
+				run.result or "", run.scenario.digest]))
+		return
+	runner = calc_lib.ScenarioRunner(runs, max_workers=args.jobs,
+		cache_dir=None if args.no_cache else args.cache_dir)
+	t = time.time()
+	summary = runner.run(force=args.force)
+	stats = runner.stats
+	print(f"{len(runs)} runs, {stats['solved']} solved with "
+		f"{stats['matrices']} recipe matrices, {stats['cached']} cached; "
+		f"{stats['written']} files written, {stats['unchanged']} unchanged; "
+		f"{time.time() - t:.1f}s", file=sys.stderr)
+	if args.summary:
+		summary.to_csv(args.summary, sep="\t", index=False)
+	if not summary["success"].all():
+		sys.exit(1)
+	return
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# each case runs in a fresh interpreter, so that no module is cached
+BENCH_CASES = {
+	"python": "pass",
+	"import calc_lib": "import calc_lib",
+	"calc_lib.ClockSpeed": "import calc_lib; calc_lib.ClockSpeed",
+	"calc_lib.RecipeDataset": "import calc_lib; calc_lib.RecipeDataset",
+	"calc_lib.RecipeMatrix": "import calc_lib; calc_lib.RecipeMatrix",
+	"calc_lib.ProductionCalculator":
+		"import calc_lib; calc_lib.ProductionCalculator",
+}
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_args():
+	ap = argparse.ArgumentParser(description="benchmark import time of "
+		"calc_lib and its public names")
+	ap.add_argument("-n", "--repeat", type=int, default=5, metavar="int",
+		help="number of runs per case, the median is reported [5]")
+	ap.add_argument("-j", "--json", type=str, metavar="json",
+		help="also write the results into this json file [no]")
+	ap.add_argument("--max-ms", type=float, metavar="float",
+		help="exit with error if 'import calc_lib' is slower than this [no]")
+	args = ap.parse_args()
+	return args
+
+
+def time_case(code: str, repeat: int) -> float:
+	# return the median wall time in ms
+	times = list()
+	for _ in range(repeat):
+		t = time.perf_counter()
+		subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, check=True,
+			stdout=subprocess.DEVNULL)
+		times.append((time.perf_counter() - t) * 1000)
+	return statistics.median(times)
+
+
+def main():
+	args = get_args()
+	res = dict()
+	for name, code in BENCH_CASES.items():
+		res[name] = time_case(code, args.repeat)
+		print(f"{name}\t{res[name]:.1f}ms")
+	# help of a cli script using calc_lib
+	res["dump_coef_matrix.py --help"] = time_case(
+		"import runpy, sys; sys.argv = ['dump_coef_matrix.py', '--help']; "
+		"runpy.run_path('dump_coef_matrix.py', run_name='__main__')",
+		args.repeat,
+	)
+	print(f"dump_coef_matrix.py --help\t{res['dump_coef_matrix.py --help']:.1f}ms")
+	if args.json:
+		with open(args.json, "w") as fp:
+			json.dump(res, fp, indent="\t")
+	if (args.max_ms is not None) and (res["import calc_lib"] > args.max_ms):
+		print(f"'import calc_lib' took {res['import calc_lib']:.1f}ms, "
+			f"limit is {args.max_ms:.1f}ms", file=sys.stderr)
+		sys.exit(1)
+	return
+
+
+if __name__ == "__main__":
+	main()